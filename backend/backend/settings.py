@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -87,13 +88,119 @@ WSGI_APPLICATION = "backend.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Connections are kept open between requests (CONN_MAX_AGE seconds) instead of
+# reopened per request. Writes take the lock at BEGIN (transaction_mode
+# IMMEDIATE), so concurrent writers queue on busy_timeout rather than failing
+# with "database is locked" when a read transaction tries to upgrade.
+# "replica" is the same file opened read-only, used for recommendation reads;
+# tests run it on the default test database (TEST MIRROR).
+DB_CONN_MAX_AGE = int(os.environ.get("DB_CONN_MAX_AGE", "600"))
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+        "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {"transaction_mode": "IMMEDIATE"},
+    },
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db.sqlite3",
+        "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": True,
+        "TEST": {"MIRROR": "default"},
+    },
+}
+
+# PRAGMAs for every SQLite connection (backend_app/db_tuning.py): WAL,
+# synchronous=NORMAL, busy_timeout, page cache and mmap. DB_TUNING=0 keeps
+# SQLite's defaults (benchmarks/bench_sqlite.py compares both).
+DATABASE_TUNING = {
+    "ENABLED": os.environ.get("DB_TUNING", "1") != "0",
+    "PRAGMAS": {},                     # overrides of db_tuning.DEFAULT_PRAGMAS
+    "READ_ONLY_ALIASES": ["replica"],
+    "READ_ALIAS": "replica",
+}
+
+# Recent-books session of each user for the recommender (model/session_store.py).
+# PATH is a SQLite file shared by all worker processes; None keeps sessions in-process only.
+# Sessions idle for TTL_SECONDS are deleted every PURGE_EVERY_WRITES writes (per worker).
+ML_SESSION_STORE = {
+    "PATH": BASE_DIR / "ml_sessions.sqlite3",
+    "MAX_LEN": 20,
+    "LOCAL_MAX_USERS": 50_000,
+    "LOCAL_TTL_SECONDS": 5.0,
+    "TTL_SECONDS": 7 * 24 * 3600,
+    "PURGE_EVERY_WRITES": 1000,
+}
+
+# recommend_books() result cache, per worker. Keyed by the user's session and the
+# model version, so it never serves a result for an old session or model.
+ML_RECOMMEND_CACHE = {
+    "MAX_ENTRIES": 100_000,
+    "TTL_SECONDS": 300.0,
+}
+
+# record_interaction() writes Ratings behind: events are journaled per worker
+# (replayed after a crash) and flushed in batches every FLUSH_INTERVAL_SECONDS.
+# FLUSH_INTERVAL_SECONDS = None writes each interaction synchronously. A batch
+# failing MAX_ATTEMPTS flushes in a row is split up, and events that still fail
+# go to a dead-letter file in JOURNAL_DIR.
+ML_INTERACTION_LOG = {
+    "JOURNAL_DIR": BASE_DIR / "interaction_journal",
+    "FLUSH_INTERVAL_SECONDS": 0.5,
+    "MAX_BATCH": 500,
+    "FSYNC": False,
+    "MAX_ATTEMPTS": 5,
 }
 
+# Hot model reload (POST /api/model/reload/, manage.py reload_model):
+# every worker polls this file and reloads when it sees a newer request.
+ML_RELOAD_TRIGGER = BASE_DIR / "ml_reload.json"
+
+# A reload is refused (state "failed", live model kept) when its sanity eval,
+# sampled Recall@10 against 100 negatives on the latest ratings, is missing,
+# below ML_RELOAD_MIN_RECALL, or below ML_RELOAD_MIN_RECALL_RATIO times the
+# live model's recall on the same ratings. Chance level is 10/101 ≈ 0.1, so
+# the floor asks for a clear margin above a random model. None disables a check.
+ML_RELOAD_MIN_RECALL = 0.15
+ML_RELOAD_MIN_RECALL_RATIO = 0.8
+
+# Recommend requests arriving while the model is still loading wait this long
+# before answering 503 (readiness: GET /api/model/ready/).
+ML_READY_TIMEOUT_SECONDS = 10.0
+
+# Load the ML stack (torch + STAMP) when the WSGI/ASGI app starts. Other
+# processes (management commands, ML_PRELOAD=0 workers) import it on first use.
+ML_PRELOAD = os.environ.get("ML_PRELOAD", "1") != "0"
+
+
+# GET /metrics answers only scrapers sending "Authorization: Bearer
+# <METRICS_TOKEN>" or connecting from METRICS_ALLOWED_IPS; everyone else gets
+# 403. The address checked is REMOTE_ADDR, i.e. the proxy's when behind one:
+# behind a reverse proxy on the same host every client is 127.0.0.1, so never
+# allowlist loopback there. Empty by default, so the token is required.
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get("METRICS_ALLOWED_IPS", "").split(",")
+                       if ip.strip()]
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN") or None
+
+
+# Hot-path logs of the ML stack ("stamp.*"): one JSON line per request with
+# timing spans, written by a background thread. DEBUG adds per-request
+# details (and the Book lookups needed to print titles).
+ML_LOG_LEVEL = os.environ.get("ML_LOG_LEVEL", "INFO")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "stamp_queue": {"()": "backend_app.tracing.NonBlockingHandler"},
+    },
+    "loggers": {
+        "stamp": {"handlers": ["stamp_queue"], "level": ML_LOG_LEVEL, "propagate": False},
+    },
+}
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
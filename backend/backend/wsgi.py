@@ -8,9 +8,18 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/wsgi/
 """
 
 import os
+import time
 
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 
+_t0 = time.perf_counter()
 application = get_wsgi_application()
+
+# Serving processes load the recommender up front so the first request does
+# not pay for it; ML_PRELOAD=0 skips that (e.g. auth-only workers).
+from django.conf import settings  # noqa: E402
+if settings.ML_PRELOAD:
+    from backend_app import ml  # noqa: E402
+    ml.preload(django_setup_ms=(time.perf_counter() - _t0) * 1000)
@@ -0,0 +1,175 @@
+import heapq
+import random
+import re
+import sys
+import threading
+
+
+# --------------------------------------------------------
+# Keyword → book posting lists for recommendation candidates
+# --------------------------------------------------------
+# Replaces the per-request OR-of-icontains query in
+# model/utils.py::_get_similar_books_by_title. Keywords are extracted once per
+# book when the index is built (or the book is saved), so generating
+# candidates is a posting-list count with no database round-trips.
+
+STOPWORDS = {
+    "from", "with", "this", "that", "your", "have", "will", "book", "books",
+    "into", "edition", "press", "about", "their", "these", "those", "which",
+    "after", "before", "under", "over", "then", "been", "were", "also",
+    "there", "where", "when", "how", "what", "why", "into", "once", "some",
+    "more", "most", "other", "such", "many", "each", "than", "them", "they",
+    "might", "must", "shall", "could", "would", "very", "make", "made",
+    "work", "works", "series", "paperback", "hardcover", "edition", "press"
+}
+
+_KEYWORD_RE = re.compile(r"[a-zA-Z]{4,}")
+
+
+def extract_keywords(text):
+    """Significant keywords (4+ letters, not a stopword) of a piece of text."""
+    return {
+        sys.intern(t) for t in _KEYWORD_RE.findall((text or "").lower())
+        if t not in STOPWORDS
+    }
+
+
+class CandidateIndex:
+    """
+    In-memory candidate retrieval over the Book catalog.
+
+    - `_book_keywords`: per-book keywords from title, author and publisher
+      (used to describe the user's recent books)
+    - `_title_postings`: keyword → books whose *title* contains it
+      (used to score candidates, as the old title-overlap ranking did)
+    - `_pool`: flat list of ISBNs for O(k) random novelty samples
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._built = False
+        self._isbns = []           # ordinal -> isbn
+        self._ordinals = {}        # isbn -> ordinal
+        self._book_keywords = {}   # ordinal -> tuple of keywords
+        self._title_keywords = {}  # ordinal -> tuple of title keywords
+        self._title_postings = {}  # keyword -> set of ordinals
+        self._pool = []            # isbns available for random sampling
+        self._pool_pos = {}        # isbn -> position in _pool
+
+    @property
+    def is_built(self):
+        return self._built
+
+    # ----------------------------------------------------
+    # Building / maintenance
+    # ----------------------------------------------------
+    def build(self):
+        """(Re)build the index from the Book table."""
+        from .models import Book
+
+        with self._lock:
+            self._reset()
+            rows = Book.objects.order_by("id").values_list(
+                "book_isbn", "book_title", "book_author", "publisher"
+            )
+            for isbn, title, author, publisher in rows.iterator(chunk_size=5000):
+                self._add(isbn, title, author, publisher)
+            self._built = True
+        print(f"📇 Candidate index built → {len(self._pool)} books, "
+              f"{len(self._title_postings)} title keywords")
+
+    def ensure_built(self):
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self.build()
+
+    def add_book(self, book_isbn, book_title=None, book_author=None, publisher=None):
+        """Insert or refresh a single book. No-op until the index is built."""
+        with self._lock:
+            if not self._built:
+                return
+            self._remove(book_isbn)
+            self._add(book_isbn, book_title, book_author, publisher)
+
+    def remove_book(self, book_isbn):
+        with self._lock:
+            if self._built:
+                self._remove(book_isbn)
+
+    def _add(self, isbn, title, author, publisher):
+        ordinal = self._ordinals.get(isbn)
+        if ordinal is None:
+            ordinal = len(self._isbns)
+            self._isbns.append(isbn)
+            self._ordinals[isbn] = ordinal
+
+        title_kw = extract_keywords(title)
+        all_kw = title_kw | extract_keywords(author) | extract_keywords(publisher)
+        self._book_keywords[ordinal] = tuple(all_kw)
+        self._title_keywords[ordinal] = tuple(title_kw)
+        for kw in title_kw:
+            self._title_postings.setdefault(kw, set()).add(ordinal)
+
+        self._pool_pos[isbn] = len(self._pool)
+        self._pool.append(isbn)
+
+    def _remove(self, isbn):
+        ordinal = self._ordinals.get(isbn)
+        if ordinal is None or ordinal not in self._book_keywords:
+            return
+        del self._book_keywords[ordinal]
+        for kw in self._title_keywords.pop(ordinal, ()):
+            posting = self._title_postings.get(kw)
+            if posting is not None:
+                posting.discard(ordinal)
+                if not posting:
+                    del self._title_postings[kw]
+
+        # O(1) removal from the random pool: move the last entry into the hole
+        pos = self._pool_pos.pop(isbn)
+        last = self._pool.pop()
+        if last != isbn:
+            self._pool[pos] = last
+            self._pool_pos[last] = pos
+
+    # ----------------------------------------------------
+    # Querying
+    # ----------------------------------------------------
+    def keywords_for(self, isbns):
+        """Union of the precomputed keywords of the given books."""
+        self.ensure_built()
+        keywords = set()
+        with self._lock:
+            for isbn in isbns:
+                ordinal = self._ordinals.get(isbn)
+                if ordinal is not None:
+                    keywords.update(self._book_keywords.get(ordinal, ()))
+        return keywords
+
+    def random_isbns(self, n):
+        self.ensure_built()
+        with self._lock:
+            return random.sample(self._pool, min(n, len(self._pool)))
+
+    def similar(self, keywords, exclude=(), limit=80):
+        """
+        ISBNs of books whose title shares the most keywords with `keywords`,
+        best first (ties in catalog order).
+        """
+        self.ensure_built()
+        with self._lock:
+            scores = {}
+            for kw in keywords:
+                for ordinal in self._title_postings.get(kw, ()):
+                    scores[ordinal] = scores.get(ordinal, 0) + 1
+            for isbn in exclude:
+                scores.pop(self._ordinals.get(isbn), None)
+            ranked = heapq.nsmallest(limit, scores, key=lambda o: (-scores[o], o))
+            return [self._isbns[o] for o in ranked]
+
+
+candidate_index = CandidateIndex()
@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+# --------------------------------------------------------
+# SQLite connection tuning (settings.DATABASE_TUNING)
+# --------------------------------------------------------
+# Applied to every new SQLite connection:
+#   journal_mode=WAL     readers and the single writer no longer block each other
+#   synchronous=NORMAL   fsync at checkpoints only; with WAL a power loss can
+#                        drop the last commits but never corrupts the file
+#   busy_timeout         wait for the write lock instead of failing at once
+#                        with "database is locked"
+#   cache_size, mmap_size, temp_store   keep hot pages and sort temporaries in memory
+# Connections of READ_ONLY_ALIASES also get query_only=ON: the read replica
+# (recommendation reads) is the same file through a connection that cannot write.
+
+DEFAULT_PRAGMAS = {
+    "busy_timeout": 5000,           # ms; first, so the journal_mode switch waits too
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -65536,           # negative = KiB: 64 MiB page cache per connection
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+
+def _config():
+    return getattr(settings, "DATABASE_TUNING", {})
+
+
+def pragmas_for(alias):
+    """PRAGMAs applied to a new connection of `alias` ({} when tuning is off)."""
+    config = _config()
+    if not config.get("ENABLED", True):
+        return {}
+    pragmas = dict(DEFAULT_PRAGMAS, **config.get("PRAGMAS", {}))
+    if alias in config.get("READ_ONLY_ALIASES", ()):
+        pragmas["query_only"] = "ON"       # last: journal_mode=WAL may need to write
+    return pragmas
+
+
+def apply_pragmas(conn, pragmas):
+    """Run the PRAGMAs on a DB-API (sqlite3) connection."""
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+
+def read_db():
+    """Alias for recommendation reads: READ_ALIAS when it is configured, else 'default'."""
+    alias = _config().get("READ_ALIAS")
+    return alias if alias in settings.DATABASES else "default"
+
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    pragmas = pragmas_for(connection.alias)
+    if pragmas:
+        # On the raw connection: not logged, not seen by execute wrappers
+        apply_pragmas(connection.connection, pragmas)
@@ -0,0 +1,106 @@
+from contextlib import contextmanager
+
+from django.db import connection
+from django.db.utils import DatabaseError
+
+
+# --------------------------------------------------------
+# SQLite FTS5 book search (migration 0004)
+# --------------------------------------------------------
+# backend_app_book_fts is a trigram-tokenized external-content index over
+# book_title/book_author/publisher, kept in sync by triggers. It answers the
+# same substring queries as BookSearchIndex without building anything, so
+# search works at once in a fresh worker. The table is optional (other
+# databases, SQLite without trigram support).
+#
+# Note: Django rebuilds a SQLite table for some schema changes, which drops its
+# triggers. A later migration that alters Book must re-create them.
+
+FTS_TABLE = "backend_app_book_fts"
+INSERT_TRIGGER = f"{FTS_TABLE}_ai"
+
+_available = {}       # database name -> bool
+
+
+def fts_available():
+    """True when the FTS table exists in the default database (checked once per database)."""
+    if connection.vendor != "sqlite":
+        return False
+    name = str(connection.settings_dict["NAME"])
+    if name not in _available:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                           [FTS_TABLE])
+            _available[name] = cursor.fetchone() is not None
+    return _available[name]
+
+
+def _match_expression(token):
+    # Column filter + quoted phrase: the token is matched literally as a substring
+    return '{book_title book_author} : "' + token.replace('"', '""') + '"'
+
+
+def search(tokens, limit=50):
+    """
+    ISBNs ranked like BookSearchIndex.search: by how many tokens occur in the
+    title or author, ties by insertion order. Tokens shorter than three
+    characters have no trigram and fall back to LIKE.
+    """
+    scores = {}
+    try:
+        with connection.cursor() as cursor:
+            for token in dict.fromkeys(tokens):
+                if len(token) >= 3:
+                    cursor.execute(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+                                   [_match_expression(token)])
+                else:
+                    pattern = "%" + token.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                    cursor.execute(
+                        "SELECT id FROM backend_app_book "
+                        "WHERE book_title LIKE %s ESCAPE '\\' OR book_author LIKE %s ESCAPE '\\'",
+                        [pattern, pattern])
+                for (book_id,) in cursor.fetchall():
+                    scores[book_id] = scores.get(book_id, 0) + tokens.count(token)
+
+            ranked = sorted(scores, key=lambda i: (-scores[i], i))[:limit]
+            if not ranked:
+                return []
+            placeholders = ", ".join(["%s"] * len(ranked))
+            cursor.execute(f"SELECT id, book_isbn FROM backend_app_book WHERE id IN ({placeholders})",
+                           ranked)
+            isbns = dict(cursor.fetchall())
+    except DatabaseError:
+        return None
+    return [isbns[i] for i in ranked if i in isbns]
+
+
+@contextmanager
+def bulk_indexing():
+    """
+    Index the Books inserted inside the block with one statement at the end
+    instead of one trigger call per row (about 5x faster inserts, for
+    imports). Use inside transaction.atomic(): the insert trigger is dropped
+    and re-created in the same transaction, so a failure rolls both back.
+    """
+    if not fts_available():
+        yield
+        return
+    if not connection.in_atomic_block:
+        raise RuntimeError("fts.bulk_indexing() must run inside transaction.atomic()")
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = %s",
+                       [INSERT_TRIGGER])
+        trigger = cursor.fetchone()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM backend_app_book")
+        last_id = cursor.fetchone()[0]
+        if trigger:
+            cursor.execute(f"DROP TRIGGER {INSERT_TRIGGER}")
+    yield
+    if trigger:
+        with connection.cursor() as cursor:
+            # Ids only grow (AUTOINCREMENT) and no one else writes during our transaction
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}(rowid, book_title, book_author, publisher) "
+                f"SELECT id, book_title, book_author, publisher FROM backend_app_book WHERE id > %s",
+                [last_id])
+            cursor.execute(trigger[0])
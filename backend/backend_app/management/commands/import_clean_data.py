@@ -1,15 +1,29 @@
 from django.core.management.base import BaseCommand
-from backend_app.scripts.import_clean_data import import_users, import_books, import_ratings
+from backend_app.scripts.import_clean_data import (
+    DEFAULT_BATCH_SIZE, import_users, import_books, import_ratings,
+)
 import os
 
 class Command(BaseCommand):
     help = "Import users, books, and ratings from clean_data CSVs"
 
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                            help="rows per parsed chunk and per committed transaction")
+        parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                            help="CSV parsing processes (1 parses in this process)")
+        parser.add_argument("--restart", action="store_true",
+                            help="ignore checkpoints of an interrupted import and start over")
+        parser.add_argument("--delta", action="store_true",
+                            help="skip files and chunks unchanged since the last import")
+
     def handle(self, *args, **options):
         BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         # go up 3 levels: backend_app/management/commands → backend_app
         DATA_DIR = os.path.join(BASE_DIR, '..', '..', 'clean_data')
-        import_users(os.path.join(DATA_DIR, 'users.csv'))
-        import_books(os.path.join(DATA_DIR, 'books.csv'))
-        import_ratings(os.path.join(DATA_DIR, 'ratings.csv'))
+        kwargs = {"batch_size": options["batch_size"], "workers": options["workers"],
+                  "resume": not options["restart"], "delta": options["delta"]}
+        import_users(os.path.join(DATA_DIR, 'users.csv'), **kwargs)
+        import_books(os.path.join(DATA_DIR, 'books.csv'), **kwargs)
+        import_ratings(os.path.join(DATA_DIR, 'ratings.csv'), **kwargs)
         self.stdout.write(self.style.SUCCESS("✅ Data imported successfully!"))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from backend_app import ml
+import json
+
+
+class Command(BaseCommand):
+    help = (
+        "Validate a STAMP model (load, warm-up, sanity eval) in this process, then "
+        "ask the running server workers to hot-swap to it"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("model_path", nargs="?", default=None,
+                            help="artifact directory or checkpoint inside model/ (default: stamp)")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="only validate; do not signal the server")
+
+    def handle(self, *args, **options):
+        try:
+            report = ml.validate_model(options["model_path"])
+        except (RuntimeError, ValueError, FileNotFoundError) as e:
+            raise CommandError(f"Model validation failed: {e}")
+        self.stdout.write(json.dumps(report, indent=2, default=str))
+
+        if options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS("✅ Model validated (dry run, server not signalled)"))
+            return
+        ml.request_reload(report["model_path"])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Reload requested via {settings.ML_RELOAD_TRIGGER}; workers swap within a few seconds"
+        ))
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:44
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+from django.db.models import Max
+from django.db.utils import OperationalError
+
+
+def dedupe_ratings(apps, schema_editor):
+    """Keep the latest row (highest id) of each (user, book) pair."""
+    Rating = apps.get_model('backend_app', 'Rating')
+    db = schema_editor.connection.alias
+    latest = (Rating.objects.using(db).values('user_id', 'book_id')
+              .annotate(latest=Max('id')).values('latest'))
+    deleted, _ = Rating.objects.using(db).exclude(id__in=latest).delete()
+    if deleted:
+        print(f"\n   Removed {deleted} duplicate rating(s)")
+
+
+# Trigram FTS5 over the Book text columns (external content: no copy of the
+# text, just the index). Triggers keep it in sync with every write.
+BOOK_FTS_SQL = [
+    "CREATE VIRTUAL TABLE backend_app_book_fts USING fts5("
+    " book_title, book_author, publisher,"
+    " content='backend_app_book', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER backend_app_book_fts_ai AFTER INSERT ON backend_app_book BEGIN"
+    " INSERT INTO backend_app_book_fts(rowid, book_title, book_author, publisher)"
+    " VALUES (new.id, new.book_title, new.book_author, new.publisher); END",
+    "CREATE TRIGGER backend_app_book_fts_ad AFTER DELETE ON backend_app_book BEGIN"
+    " INSERT INTO backend_app_book_fts(backend_app_book_fts, rowid, book_title, book_author, publisher)"
+    " VALUES ('delete', old.id, old.book_title, old.book_author, old.publisher); END",
+    "CREATE TRIGGER backend_app_book_fts_au AFTER UPDATE ON backend_app_book BEGIN"
+    " INSERT INTO backend_app_book_fts(backend_app_book_fts, rowid, book_title, book_author, publisher)"
+    " VALUES ('delete', old.id, old.book_title, old.book_author, old.publisher);"
+    " INSERT INTO backend_app_book_fts(rowid, book_title, book_author, publisher)"
+    " VALUES (new.id, new.book_title, new.book_author, new.publisher); END",
+    "INSERT INTO backend_app_book_fts(backend_app_book_fts) VALUES ('rebuild')",
+]
+
+DROP_BOOK_FTS_SQL = [
+    "DROP TRIGGER IF EXISTS backend_app_book_fts_ai",
+    "DROP TRIGGER IF EXISTS backend_app_book_fts_ad",
+    "DROP TRIGGER IF EXISTS backend_app_book_fts_au",
+    "DROP TABLE IF EXISTS backend_app_book_fts",
+]
+
+
+def create_book_fts(apps, schema_editor):
+    """Optional: only on SQLite builds with FTS5 and the trigram tokenizer (3.34+)."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            for sql in BOOK_FTS_SQL:
+                schema_editor.execute(sql)
+    except OperationalError as e:
+        print(f"\n   Skipping book full-text index (SQLite without FTS5 trigram support: {e})")
+
+
+def drop_book_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_BOOK_FTS_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_app', '0003_registereduser_city_registereduser_country_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_ratings, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='rating',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='backend_app.user'),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['user', 'id', 'book'], name='rating_user_recent_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='rating',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='rating_unique_user_book'),
+        ),
+        migrations.RunPython(create_book_fts, drop_book_fts),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-18 06:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_app', '0004_rating_indexes_book_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportManifest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20, unique=True)),
+                ('source', models.CharField(max_length=500)),
+                ('file_sha256', models.CharField(max_length=64)),
+                ('file_size', models.BigIntegerField()),
+                ('chunk_digests', models.JSONField(default=list)),
+                ('rows', models.IntegerField(default=0)),
+                ('imported_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
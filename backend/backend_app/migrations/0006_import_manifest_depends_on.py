@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 06:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend_app', '0005_import_manifest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importmanifest',
+            name='depends_on',
+            field=models.JSONField(default=dict),
+        ),
+    ]
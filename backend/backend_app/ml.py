@@ -0,0 +1,155 @@
+import os
+import sys
+import threading
+
+# --------------------------------------------------------
+# Lazy facade over model/utils.py
+# --------------------------------------------------------
+# Importing model/utils.py pulls in torch, which auth, book CRUD and most
+# management commands never need. Views call the ML stack through this module
+# instead; it is imported on first use, or up front by preload() in serving
+# processes (backend/wsgi.py, backend/asgi.py). Serving delegates also start
+# its auto-loader and interaction writer; validate_model() and
+# request_reload() (the reload_model command) do not.
+
+MODEL_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../model'))
+if MODEL_DIR not in sys.path:
+    sys.path.append(MODEL_DIR)
+
+# Same resolution order as utils.py, so both share one lifecycle object (no torch)
+try:
+    from model.interaction_log import apply_events, pending_events
+    from model.lifecycle import ModelNotReady, model_lifecycle
+except ModuleNotFoundError:
+    from interaction_log import apply_events, pending_events
+    from lifecycle import ModelNotReady, model_lifecycle
+
+from django.conf import settings
+
+from .metrics import CallbackMetric
+from .search_index import book_search_index
+
+_utils = None
+_started = False
+_import_lock = threading.Lock()
+
+# Startup metrics need no torch, so they are served before the model loads
+CallbackMetric("stamp_model_ready", "1 once the STAMP model is loaded",
+               lambda: 1.0 if model_lifecycle.is_ready else 0.0)
+CallbackMetric("stamp_model_startup_seconds", "STAMP startup time by phase (total = until ready)",
+               lambda: {k: ms / 1000.0 for k, ms in model_lifecycle.status()["timings_ms"].items()},
+               labelnames=["phase"])
+
+
+def _ml(serving=True):
+    global _utils, _started
+    if _utils is None or (serving and not _started):
+        with _import_lock:
+            if _utils is None:
+                import utils
+                _utils = utils
+            if serving and not _started:
+                _utils.start_background()
+                _started = True
+    return _utils
+
+
+def preload(django_setup_ms=None):
+    """
+    Import the ML stack now (starts the model loader) and build the book
+    search index in the background; for serving processes.
+    """
+    if django_setup_ms is not None:
+        model_lifecycle.record("django_setup", django_setup_ms)
+    book_search_index.build_in_background()
+    _ml()
+
+
+def is_loaded():
+    return _utils is not None
+
+
+# --------------------------------------------------------
+# Delegates
+# --------------------------------------------------------
+def recommend_books(user_id, top_k=5):
+    return _ml().recommend_books(user_id, top_k)
+
+
+def record_interaction(user_id, book_isbn, rating=None, implicit=False):
+    return _ml().record_interaction(user_id, book_isbn, rating, implicit)
+
+
+def flush_interactions():
+    return _ml().flush_interactions() if _utils is not None else 0
+
+
+def pending_interactions(user_id, book_isbn):
+    """
+    Events on (user_id, book_isbn) that any worker process recorded but has
+    not written yet, read from the shared journal without loading the ML
+    stack. Without a journal (ML_INTERACTION_LOG["JOURNAL_DIR"] unset) only
+    this process's buffer can be flushed, so reads see other workers' writes
+    late.
+    """
+    journal_dir = getattr(settings, "ML_INTERACTION_LOG", {}).get("JOURNAL_DIR")
+    if not journal_dir:
+        flush_interactions()
+        return []
+    return pending_events(journal_dir, user_id, book_isbn)
+
+
+def handle_new_user(user_id, age=None, location=None):
+    """
+    Create the ML user. A brand-new user has no session to reset, so this
+    does not load the ML stack in processes that have not loaded it.
+    """
+    if _utils is not None:
+        return _utils.handle_new_user(user_id, age, location)
+    from .models import User
+    user, created = User.objects.get_or_create(
+        user_id=user_id,
+        defaults={"age": age, "location": location},
+    )
+    return {"status": "ok", "message": f"User {user_id} {'created' if created else 'exists'}."}
+
+
+def handle_new_book(book_isbn, **fields):
+    return _ml().handle_new_book(book_isbn, **fields)
+
+
+def reload_model(model_path=None, dry_run=False):
+    return _ml().reload_model(model_path, dry_run=dry_run)
+
+
+def start_reload(model_path=None, publish=True):
+    return _ml().start_reload(model_path, publish=publish)
+
+
+def validate_model(model_path=None):
+    """Load, warm up and sanity-check a model in this process without serving it."""
+    return _ml(serving=False).reload_model(model_path, dry_run=True)
+
+
+def request_reload(model_path):
+    return _ml(serving=False).request_reload(model_path)
+
+
+def get_reload_status():
+    return _ml().get_reload_status()
+
+
+def get_recommend_cache_stats():
+    return _ml().get_recommend_cache_stats()
+
+
+def get_interaction_log_stats():
+    return _ml().get_interaction_log_stats()
+
+
+def get_model_status():
+    return _ml().get_model_status()
+
+
+def wait_model_ready(timeout=None):
+    return _ml().wait_model_ready(timeout)
@@ -75,6 +75,34 @@ class Book(models.Model):
         return f"{self.book_title} ({self.book_isbn})"
 
 class Rating(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # user_id is the leading column of both indexes below, so no separate FK index
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     rating = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # One rating per user and book; lets the interaction writer upsert
+            models.UniqueConstraint(fields=["user", "book"], name="rating_unique_user_book"),
+        ]
+        indexes = [
+            # A user's latest ratings (ORDER BY id DESC) with their books, index-only
+            models.Index(fields=["user", "id", "book"], name="rating_user_recent_idx"),
+        ]
+
+# ----------------------------
+# clean_data import bookkeeping
+# ----------------------------
+class ImportManifest(models.Model):
+    """What import_clean_data last applied from each CSV (see scripts/import_clean_data.py)."""
+    kind = models.CharField(max_length=20, unique=True)           # users / books / ratings
+    source = models.CharField(max_length=500)
+    file_sha256 = models.CharField(max_length=64)
+    file_size = models.BigIntegerField()
+    chunk_digests = models.JSONField(default=list)                # content-defined chunks, in file order
+    rows = models.IntegerField(default=0)                         # rows applied by the last run
+    depends_on = models.JSONField(default=dict)                   # kind -> file_sha256 it was applied against
+    imported_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.kind} ({self.source}, {self.imported_at:%Y-%m-%d %H:%M})"
@@ -1,3 +1,6 @@
+import hmac
+
+from django.conf import settings
 from rest_framework import permissions
 
 
@@ -49,3 +52,16 @@ class BookPermission(permissions.BasePermission):
             return False
 
         return False
+
+
+def metrics_access_allowed(request):
+    """
+    /metrics is for scrapers, not users: allowed from settings.METRICS_ALLOWED_IPS
+    or with "Authorization: Bearer <settings.METRICS_TOKEN>" when a token is set.
+    """
+    if request.META.get("REMOTE_ADDR") in getattr(settings, "METRICS_ALLOWED_IPS", ()):
+        return True
+    token = getattr(settings, "METRICS_TOKEN", None)
+    auth = request.headers.get("Authorization", "")
+    return bool(token) and auth.startswith("Bearer ") \
+        and hmac.compare_digest(auth[len("Bearer "):].encode(), token.encode())
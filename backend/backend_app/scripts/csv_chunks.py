@@ -0,0 +1,202 @@
+import csv
+import hashlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# --------------------------------------------------------
+# Chunked CSV parsing for import_clean_data
+# --------------------------------------------------------
+# Files are cut into chunks of whole records, about `rows` each, at
+# content-defined boundaries: after a record whose CRC is 0 mod `rows`
+# (within [rows/4, 4*rows]). An edit only changes the chunks around it; the
+# boundaries after it are found again, so the other chunks keep their
+# digest and a delta import skips them. Cuts are never made inside quotes
+# (an odd number of '"' so far, which holds for RFC 4180 CSV where quotes
+# are escaped by doubling). Chunks are parsed by pandas in worker processes
+# and come back in file order; the end offset of the last committed chunk is
+# the resume point. No Django here: this module is imported by the workers.
+
+
+def read_header(path):
+    """(header line bytes, offset of the first data byte)."""
+    with open(path, "rb") as f:
+        header = f.readline()
+        return header, f.tell()
+
+
+def header_fields(header):
+    return next(csv.reader([header.decode("utf-8")]))
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_digest(header, chunk):
+    """Fingerprint of a chunk; the header is included so a column change re-imports everything."""
+    return hashlib.blake2b(header + chunk, digest_size=16).hexdigest()
+
+
+def iter_chunks(path, start, rows):
+    """Yield (end offset, bytes) chunks of whole records from `start` to EOF."""
+    min_rows, max_rows = max(1, rows // 4), max(1, rows * 4)
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset, lines, size, quotes = start, [], 0, 0
+        for line in f:
+            lines.append(line)
+            size += len(line)
+            quotes += line.count(b'"')
+            if quotes % 2:                    # inside a quoted field spanning lines
+                continue
+            n = len(lines)
+            if n >= max_rows or (n >= min_rows and zlib.crc32(line) % rows == 0):
+                offset += size
+                yield offset, b"".join(lines)
+                lines, size = [], 0
+        if lines and any(line.strip() for line in lines):
+            yield offset + size, b"".join(lines)
+
+
+# ---------------------------
+# Parsers: chunk -> row tuples
+# ---------------------------
+def _frame(header, chunk):
+    return pd.read_csv(io.BytesIO(header + chunk), dtype=str, keep_default_na=False,
+                       encoding="utf-8")
+
+
+def _column(df, name, width=None):
+    if name not in df:
+        return [""] * len(df)
+    values = df[name]
+    return values.str.slice(0, width).tolist() if width else values.tolist()
+
+
+def _ints(df, name):
+    """int(float(value)), None when empty or not a number (e.g. age '18.0', year '')."""
+    if name not in df:
+        return [None] * len(df)
+    numbers = pd.to_numeric(df[name].str.strip(), errors="coerce").tolist()
+    return [int(x) if math.isfinite(x) else None for x in numbers]
+
+
+def parse_users(header, chunk):
+    """(user_id, age, location) rows."""
+    df = _frame(header, chunk)
+    return list(zip(df["user_id"].tolist(), _ints(df, "age"), _column(df, "location")))
+
+
+def parse_books(header, chunk):
+    """(isbn, title, author, year, publisher, image_url_s, image_url_m, image_url_l) rows."""
+    df = _frame(header, chunk)
+    return list(zip(
+        df["book_isbn"].tolist(),
+        _column(df, "book_title", 255), _column(df, "book_author", 255),
+        _ints(df, "year_of_publication"), _column(df, "publisher", 255),
+        _column(df, "image_url_s", 500), _column(df, "image_url_m", 500),
+        _column(df, "image_url_l", 500),
+    ))
+
+
+def rating_columns(fields):
+    """(user, isbn, rating) column names, accepting the Book-Crossing spellings."""
+    field_map = {name.lower(): name for name in fields}
+    user_col = field_map.get("user_id") or field_map.get("user-id")
+    book_col = field_map.get("book_isbn") or field_map.get("isbn")
+    rating_col = field_map.get("rating") or field_map.get("book_rating") or field_map.get("book-rating")
+    if not all([user_col, book_col, rating_col]):
+        raise ValueError(f"❌ Missing required columns in CSV. Found: {fields}")
+    return user_col, book_col, rating_col
+
+
+def parse_ratings(header, chunk):
+    """(user_id, isbn, rating) rows; rows with an empty id or a non-numeric rating are dropped."""
+    df = _frame(header, chunk)
+    user_col, book_col, rating_col = rating_columns(list(df.columns))
+    users = df[user_col].str.strip()
+    isbns = df[book_col].str.strip()
+    ratings = pd.to_numeric(df[rating_col].str.strip(), errors="coerce")
+    keep = (users != "") & (isbns != "") & ratings.notna()
+    return list(zip(users[keep].tolist(), isbns[keep].tolist(), ratings[keep].tolist()))
+
+
+PARSERS = {"users": parse_users, "books": parse_books, "ratings": parse_ratings}
+
+
+def parse_chunk(kind, header, chunk):
+    return PARSERS[kind](header, chunk)
+
+
+def parse_chunks(kind, header, chunks, workers=1):
+    """
+    (tag, rows) for each (tag, chunk) of `chunks`, in order. With workers > 1
+    chunks are parsed in that many processes, at most 2 * workers in flight.
+    """
+    if workers <= 1:
+        for tag, chunk in chunks:
+            yield tag, parse_chunk(kind, header, chunk)
+        return
+    # spawn: the importer's process has threads and open DB connections
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        in_flight = deque()
+        for tag, chunk in chunks:
+            in_flight.append((tag, pool.submit(parse_chunk, kind, header, chunk)))
+            if len(in_flight) >= 2 * workers:
+                tag, future = in_flight.popleft()
+                yield tag, future.result()
+        while in_flight:
+            tag, future = in_flight.popleft()
+            yield tag, future.result()
+
+
+# ---------------------------
+# Resume checkpoints
+# ---------------------------
+class Checkpoint:
+    """
+    `<csv>.checkpoint` next to the imported file: the offset up to which rows
+    are committed and the digests of the chunks before it. Ignored if the CSV
+    changed since (size or mtime).
+    """
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.path = csv_path + ".checkpoint"
+
+    def _signature(self):
+        st = os.stat(self.csv_path)
+        return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return state if state.get("file") == self._signature() else None
+
+    def save(self, offset, rows, chunks):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"file": self._signature(), "offset": offset, "rows": rows,
+                       "chunks": chunks}, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -1,111 +1,213 @@
-import csv
-from django.db import transaction
-from backend_app.models import User, Book, Rating
-
-
-@transaction.atomic
-def import_users(file_path):
-    with open(file_path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        users = []
-        for row in reader:
-            raw_age = row.get('age', '').strip()
-            if raw_age:
-                try:
-                    age = int(float(raw_age))  # handle '18.0', '20.5', etc.
-                except ValueError:
-                    age = None
-            else:
-                age = None
-
-            users.append(User(
-                user_id=row['user_id'],
-                age=age,
-                location=row.get('location') or ''
-            ))
-        User.objects.bulk_create(users, ignore_conflicts=True)
-    print(f"✅ Imported {len(users)} users.")
-
-@transaction.atomic
-def import_books(file_path):
-    with open(file_path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        books = []
-        for row in reader:
-            # Handle missing or malformed year safely
-            raw_year = row.get('year_of_publication', '').strip()
-            try:
-                year = int(float(raw_year)) if raw_year else None
-            except ValueError:
-                year = None
-
-            books.append(Book(
-                book_isbn=row['book_isbn'],
-                book_title=row.get('book_title', '')[:255],
-                book_author=row.get('book_author', '')[:255],
-                year_of_publication=year,
-                publisher=row.get('publisher', '')[:255],
-                image_url_s=row.get('image_url_s', '')[:500],
-                image_url_m=row.get('image_url_m', '')[:500],
-                image_url_l=row.get('image_url_l', '')[:500],
-            ))
-
-        Book.objects.bulk_create(books, ignore_conflicts=True)
-    print(f"✅ Imported {len(books)} books.")
-
-
-@transaction.atomic
-def import_ratings(file_path):
-    with open(file_path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        ratings = []
-        total = 0
-
-        # Normalize header names to lowercase for safety
-        field_map = {name.lower(): name for name in reader.fieldnames}
-        user_col = field_map.get('user_id') or field_map.get('user-id')
-        book_col = field_map.get('book_isbn') or field_map.get('isbn')
-        rating_col = (
-            field_map.get('rating')
-            or field_map.get('book_rating')
-            or field_map.get('book-rating')
-        )
-
-        if not all([user_col, book_col, rating_col]):
-            raise ValueError(f"❌ Missing required columns in CSV. Found: {reader.fieldnames}")
-
-        # Pre-fetch IDs to avoid ORM lookups
-        user_map = {u.user_id: u.id for u in User.objects.all().only("id", "user_id")}
-        book_map = {b.book_isbn: b.id for b in Book.objects.all().only("id", "book_isbn")}
-
-        for row in reader:
-            total += 1
-            user_id = str(row[user_col]).strip()
-            book_isbn = str(row[book_col]).strip()
-            raw_rating = row[rating_col].strip()
-
-            if not user_id or not book_isbn or not raw_rating:
+import os
+import time
+
+from django.db import connection, transaction
+from django.db.models.constants import OnConflict
+from backend_app import fts
+from backend_app.models import User, Book, Rating, ImportManifest
+from backend_app.scripts.csv_chunks import (
+    Checkpoint, chunk_digest, file_sha256, header_fields, iter_chunks, parse_chunks,
+    rating_columns, read_header,
+)
+
+DEFAULT_BATCH_SIZE = 20_000
+# Rows per fingerprinted chunk. Independent of the batch size so manifests
+# stay comparable across runs; smaller means finer deltas, larger manifests.
+CHUNK_ROWS = 2_000
+PROGRESS_INTERVAL_SECONDS = 5.0
+
+
+# --------------------------------------------------------
+# Streaming import: parse in worker processes, commit per batch
+# --------------------------------------------------------
+def _import(kind, file_path, write_batch, batch_size, workers, resume, delta, depends_on=()):
+    """
+    Stream `file_path` in batches of about `batch_size` rows, writing each
+    with `write_batch(rows)` in its own transaction. A checkpoint after
+    every commit lets an interrupted import resume where it stopped (writes
+    are idempotent, so a batch replayed after a crash is harmless).
+
+    The file is fingerprinted in CHUNK_ROWS chunks. Delta mode skips the
+    file when it is unchanged since the last import and otherwise the
+    chunks whose digest is in the manifest; a full import writes every
+    chunk. Writers upsert, so either run leaves every row of the file
+    applied and records its manifest (ImportManifest) for the next delta.
+
+    Rows whose user or book is unknown are dropped, so the manifest also
+    records the files of the kinds in `depends_on` it was applied against;
+    once one of those was imported anew, a delta run applies every chunk
+    again (unchanged rows are not rewritten) and dropped rows are retried.
+    Imports never delete: rows removed from the CSV stay in the tables, as
+    do users, books and ratings created through the app.
+    A key repeated in several chunks keeps the value of the last *changed*
+    chunk in a delta run; a full import applies the last row of the file.
+    Returns {"rows", "written" (rows inserted or changed), "chunks",
+    "unchanged_chunks", "seconds", "rows_per_s"}.
+    """
+    t0 = last_report = time.perf_counter()
+    header, data_start = read_header(file_path)
+    sha256 = file_sha256(file_path)
+    upstream = dict(ImportManifest.objects.filter(kind__in=depends_on)
+                    .values_list("kind", "file_sha256"))
+    manifest = ImportManifest.objects.filter(kind=kind).first()
+    if manifest and manifest.depends_on != upstream:
+        if delta:
+            print(f"🔄 {kind}: {', '.join(depends_on)} changed since the last import, "
+                  f"applying every chunk")
+        manifest = None
+    if delta and manifest and manifest.file_sha256 == sha256:
+        print(f"⏭️ {kind}: {os.path.basename(file_path)} unchanged since "
+              f"{manifest.imported_at:%Y-%m-%d %H:%M}, skipped")
+        n = len(manifest.chunk_digests)
+        return {"rows": 0, "written": 0, "chunks": n, "unchanged_chunks": n,
+                "seconds": time.perf_counter() - t0, "rows_per_s": 0.0}
+    known = set(manifest.chunk_digests) if delta and manifest else set()
+
+    checkpoint = Checkpoint(file_path)
+    state = checkpoint.load() if resume else None
+    if state:
+        start, rows, digests = state["offset"], state["rows"], state.get("chunks", [])
+        print(f"↩️ Resuming {kind} import after {rows:,} rows")
+    else:
+        start, rows, digests = data_start, 0, []
+
+    unchanged = 0
+
+    def changed_batches():
+        # Changed chunks, concatenated up to batch_size rows; tagged with the
+        # resume point: end offset and number of chunks digested so far
+        nonlocal unchanged
+        parts, size = [], 0
+        for end, chunk in iter_chunks(file_path, start, CHUNK_ROWS):
+            digest = chunk_digest(header, chunk)
+            digests.append(digest)
+            if digest in known:
+                unchanged += 1
                 continue
-
-            try:
-                rating_value = float(raw_rating)
-            except ValueError:
-                continue
-
-            # Directly use IDs — skip DB fetch
-            user_fk = user_map.get(user_id)
-            book_fk = book_map.get(book_isbn)
-            if user_fk and book_fk:
-                ratings.append(Rating(user_id=user_fk, book_id=book_fk, rating=rating_value))
-
-            # Bulk insert every 50,000 rows (larger batch for performance)
-            if len(ratings) >= 50000:
-                Rating.objects.bulk_create(ratings, ignore_conflicts=True)
-                ratings.clear()
-
-        # Final insert
-        if ratings:
-            Rating.objects.bulk_create(ratings, ignore_conflicts=True)
-
-    print(f"✅ Imported {total} ratings from {file_path}")
-
+            parts.append(chunk)
+            size += chunk.count(b"\n")
+            if size >= batch_size:
+                yield (end, len(digests)), b"".join(parts)
+                parts, size = [], 0
+        if parts:
+            yield (end, len(digests)), b"".join(parts)
+
+    done = written = 0
+    for (end, n_digests), batch in parse_chunks(kind, header, changed_batches(), workers):
+        with transaction.atomic():
+            written += write_batch(batch)
+        done += len(batch)
+        checkpoint.save(end, rows + done, digests[:n_digests])
+        if time.perf_counter() - last_report >= PROGRESS_INTERVAL_SECONDS:
+            last_report = time.perf_counter()
+            print(f"   … {rows + done:,} {kind} ({done / (last_report - t0):,.0f} rows/s)")
+
+    ImportManifest.objects.update_or_create(kind=kind, defaults={
+        "source": os.path.abspath(file_path), "file_sha256": sha256,
+        "file_size": os.path.getsize(file_path), "chunk_digests": digests, "rows": rows + done,
+        "depends_on": upstream,
+    })
+    checkpoint.clear()
+
+    seconds = time.perf_counter() - t0
+    stats = {"rows": done, "written": written, "chunks": len(digests), "unchanged_chunks": unchanged,
+             "seconds": seconds, "rows_per_s": done / seconds if seconds else 0.0}
+    print(f"✅ Imported {done:,} {kind} in {seconds:.1f}s ({stats['rows_per_s']:,.0f} rows/s)"
+          + (f", {unchanged} of {len(digests)} chunks unchanged" if delta else ""))
+    return stats
+
+
+# Rows are inserted with executemany on the cursor: building a model instance
+# per row and compiling bulk_create's SQL cost ten times the insert itself.
+# Every write is an upsert on the natural key, and the last row of a key wins,
+# as in file order (the rule migration 0004 applied to duplicate ratings), so
+# a full and a delta import load the same data from the same file.
+def _insert_sql(model, fields, source, unique_fields):
+    ops = connection.ops
+    meta = model._meta
+    table = ops.quote_name(meta.db_table)
+    columns = [meta.get_field(f).column for f in fields]
+    update_columns = [meta.get_field(f).column for f in fields if f not in unique_fields]
+    suffix = ops.on_conflict_suffix_sql(
+        [meta.get_field(f) for f in fields], OnConflict.UPDATE, update_columns,
+        [meta.get_field(f).column for f in unique_fields])
+    # Leave identical rows alone: no write, no FTS trigger, and the rowcount
+    # only counts rows that changed
+    same = "IS" if connection.vendor == "sqlite" else "IS NOT DISTINCT FROM"
+    suffix += " WHERE NOT (" + " AND ".join(
+        f"{table}.{ops.quote_name(c)} {same} EXCLUDED.{ops.quote_name(c)}"
+        for c in update_columns) + ")"
+    return (f"{ops.insert_statement(on_conflict=OnConflict.UPDATE)} {table} "
+            f"({', '.join(map(ops.quote_name, columns))}) {source} {suffix}")
+
+
+def _insert_values(model, fields, rows, unique_fields):
+    sql = _insert_sql(model, fields, "VALUES (" + ", ".join(["%s"] * len(fields)) + ")",
+                      unique_fields)
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+        return cursor.rowcount
+
+
+def _last_per_key(rows, width):
+    """One row per key (the first `width` values); a later row wins, as in file order."""
+    return list({row[:width]: row for row in rows}.values())
+
+
+USER_FIELDS = ["user_id", "age", "location"]
+BOOK_FIELDS = ["book_isbn", "book_title", "book_author", "year_of_publication", "publisher",
+               "image_url_s", "image_url_m", "image_url_l"]
+RATING_STAGE = "import_rating_stage"
+
+
+def _write_users(rows):
+    return _insert_values(User, USER_FIELDS, _last_per_key(rows, 1), ["user_id"])
+
+
+def _write_books(rows):
+    with fts.bulk_indexing():
+        return _insert_values(Book, BOOK_FIELDS, _last_per_key(rows, 1), ["book_isbn"])
+
+
+def _write_ratings(rows):
+    """
+    Stage the batch in a temporary table and resolve user and book ids with
+    one join on their unique columns, instead of holding every id in memory.
+    """
+    qn = connection.ops.quote_name
+    user_key = f"u.{qn(User._meta.get_field('user_id').column)}"
+    isbn_key = f"b.{qn(Book._meta.get_field('book_isbn').column)}"
+    source = (f"SELECT u.id, b.id, s.rating FROM {RATING_STAGE} s "
+              f"JOIN {qn(User._meta.db_table)} u ON {user_key} = s.user_key "
+              f"JOIN {qn(Book._meta.db_table)} b ON {isbn_key} = s.isbn "
+              f"WHERE 1 = 1")       # SQLite: ON CONFLICT after a join needs a WHERE
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS {RATING_STAGE} "
+                       f"(user_key TEXT, isbn TEXT, rating REAL)")
+        cursor.execute(f"DELETE FROM {RATING_STAGE}")
+        cursor.executemany(f"INSERT INTO {RATING_STAGE} VALUES (%s, %s, %s)",
+                           _last_per_key(rows, 2))
+        cursor.execute(_insert_sql(Rating, ["user", "book", "rating"], source, ["user", "book"]))
+        return cursor.rowcount
+
+
+def import_users(file_path, batch_size=DEFAULT_BATCH_SIZE, workers=1, resume=True, delta=False):
+    return _import("users", file_path, _write_users,
+                   batch_size, workers, resume, delta)
+
+
+def import_books(file_path, batch_size=DEFAULT_BATCH_SIZE, workers=1, resume=True, delta=False):
+    return _import("books", file_path, _write_books,
+                   batch_size, workers, resume, delta)
+
+
+def import_ratings(file_path, batch_size=DEFAULT_BATCH_SIZE, workers=1, resume=True, delta=False):
+    # Fail on a bad header before any work is done
+    rating_columns(header_fields(read_header(file_path)[0]))
+    stats = _import("ratings", file_path, _write_ratings,
+                    batch_size, workers, resume, delta, depends_on=("users", "books"))
+    skipped = stats["rows"] - stats["written"]
+    if skipped > 0:
+        print(f"   {skipped:,} ratings not written (unknown user or book, repeated, "
+              f"or already up to date)")
+    return stats
@@ -0,0 +1,179 @@
+import heapq
+import threading
+
+
+# --------------------------------------------------------
+# In-memory inverted index for BookViewSet.search_books
+# --------------------------------------------------------
+# Query tokens come from `query.split()`, so they never contain whitespace.
+# A token is therefore a substring of "<title> <author>" exactly when it is a
+# substring of one of that text's whitespace-separated words. We index those
+# words (the "vocabulary") and resolve each query token against the
+# vocabulary through a trigram index, which keeps the old substring semantics
+# while only touching the books that actually match.
+
+def _book_terms(title, author):
+    return set(f"{title or ''} {author or ''}".lower().split())
+
+
+def _trigrams(term):
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+class BookSearchIndex:
+    """Tokenized title/author index returning ISBNs ranked by matched tokens."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._built = False
+        self._building = False
+        self._isbns = []          # ordinal -> isbn
+        self._ordinals = {}       # isbn -> ordinal
+        self._book_terms = {}     # ordinal -> set of terms
+        self._postings = {}       # term -> set of ordinals
+        self._grams = {}          # trigram -> set of terms
+
+    @property
+    def is_built(self):
+        return self._built
+
+    # ----------------------------------------------------
+    # Building / maintenance
+    # ----------------------------------------------------
+    def build(self):
+        """(Re)build the index from the Book table."""
+        from .models import Book
+
+        with self._lock:
+            self._reset()
+            rows = Book.objects.order_by("id").values_list(
+                "book_isbn", "book_title", "book_author"
+            )
+            for isbn, title, author in rows.iterator(chunk_size=5000):
+                self._add(isbn, title, author)
+            self._built = True
+        print(f"🔎 Book search index built → {len(self._ordinals)} books, "
+              f"{len(self._postings)} terms")
+
+    def ensure_built(self):
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self.build()
+
+    def build_in_background(self):
+        """Build in a daemon thread (once); callers answer from elsewhere meanwhile."""
+        with self._lock:
+            if self._built or self._building:
+                return
+            self._building = True
+
+        def run():
+            from django.db import connection
+            try:
+                self.ensure_built()
+            except Exception as e:
+                print(f"⚠️ Book search index build failed, will retry on first search: {e}")
+            finally:
+                self._building = False
+                connection.close()
+
+        threading.Thread(target=run, name="book-search-index", daemon=True).start()
+
+    def add_book(self, book_isbn, book_title=None, book_author=None):
+        """Insert or refresh a single book. No-op until the index is built."""
+        with self._lock:
+            if not self._built:
+                return
+            self._remove(book_isbn)
+            self._add(book_isbn, book_title, book_author)
+
+    def remove_book(self, book_isbn):
+        with self._lock:
+            if self._built:
+                self._remove(book_isbn)
+
+    def _add(self, isbn, title, author):
+        # Re-indexed books keep their original position for tie-breaking
+        ordinal = self._ordinals.get(isbn)
+        if ordinal is None:
+            ordinal = len(self._isbns)
+            self._isbns.append(isbn)
+            self._ordinals[isbn] = ordinal
+
+        terms = _book_terms(title, author)
+        self._book_terms[ordinal] = terms
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = set()
+                self._index_term(term)
+            posting.add(ordinal)
+
+    def _remove(self, isbn):
+        ordinal = self._ordinals.get(isbn)
+        if ordinal is None:
+            return
+        for term in self._book_terms.pop(ordinal, ()):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            posting.discard(ordinal)
+            if not posting:
+                del self._postings[term]
+                self._unindex_term(term)
+
+    def _index_term(self, term):
+        for gram in _trigrams(term):
+            self._grams.setdefault(gram, set()).add(term)
+
+    def _unindex_term(self, term):
+        for gram in _trigrams(term):
+            bucket = self._grams.get(gram)
+            if bucket is not None:
+                bucket.discard(term)
+                if not bucket:
+                    del self._grams[gram]
+
+    # ----------------------------------------------------
+    # Querying
+    # ----------------------------------------------------
+    def _matching_terms(self, token):
+        """All vocabulary terms containing `token` as a substring."""
+        if len(token) >= 3:
+            buckets = []
+            for gram in _trigrams(token):
+                bucket = self._grams.get(gram)
+                if not bucket:
+                    return []
+                buckets.append(bucket)
+            buckets.sort(key=len)
+            candidates = buckets[0].intersection(*buckets[1:])
+            return [t for t in candidates if token in t]
+
+        # Tokens of one or two characters have no trigram; scan the vocabulary
+        return [t for t in self._postings if token in t]
+
+    def search(self, tokens, limit=50):
+        """
+        Return ISBNs ranked by the number of query tokens found in the book's
+        title/author text (same scoring as the old full-table scan).
+        """
+        self.ensure_built()
+        with self._lock:
+            scores = {}
+            for token in tokens:
+                matched = set()
+                for term in self._matching_terms(token):
+                    matched |= self._postings[term]
+                for ordinal in matched:
+                    scores[ordinal] = scores.get(ordinal, 0) + 1
+
+            ranked = heapq.nsmallest(limit, scores, key=lambda o: (-scores[o], o))
+            return [self._isbns[o] for o in ranked]
+
+
+book_search_index = BookSearchIndex()
@@ -1,6 +1,8 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import RegisteredUser, User
+from .models import RegisteredUser, User, Book
+from .search_index import book_search_index
+from .candidate_index import candidate_index
 
 
 @receiver(post_save, sender=RegisteredUser)
@@ -14,3 +16,16 @@ def create_ml_user(sender, instance, created, **kwargs):
             }
         )
         print(f"✅ ML user created for RegisteredUser: {instance.username}")
+
+
+@receiver(post_save, sender=Book)
+def index_saved_book(sender, instance, **kwargs):
+    book_search_index.add_book(instance.book_isbn, instance.book_title, instance.book_author)
+    candidate_index.add_book(instance.book_isbn, instance.book_title,
+                             instance.book_author, instance.publisher)
+
+
+@receiver(post_delete, sender=Book)
+def unindex_deleted_book(sender, instance, **kwargs):
+    book_search_index.remove_book(instance.book_isbn)
+    candidate_index.remove_book(instance.book_isbn)
@@ -1,3 +1,747 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from unittest import mock, skipUnless
+
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+import torch
+
+from . import db_tuning, fts, ml
+from .models import Book, ImportManifest, Rating, RegisteredUser, User
+from .scripts import csv_chunks, import_clean_data
+from .search_index import BookSearchIndex
+
+# backend_app.ml put model/ on sys.path; resolve the ML modules as model/utils.py does
+try:
+    from model.ann_index import IVFIndex
+    from model.artifact import load_artifact, load_ivf, save_artifact
+    from model.batching import MicroBatcher
+    from model.evaluate import evaluate, target_ranks
+    from model.interaction_log import InteractionLog, coalesce, pending_events
+    from model.item_registry import ItemRegistry
+    from model.rec_cache import RecommendationCache
+    from model.session_store import SessionStore
+    from model.stamp_model import STAMP, NegativeSampler
+except ModuleNotFoundError:
+    from ann_index import IVFIndex
+    from artifact import load_artifact, load_ivf, save_artifact
+    from batching import MicroBatcher
+    from evaluate import evaluate, target_ranks
+    from interaction_log import InteractionLog, coalesce, pending_events
+    from item_registry import ItemRegistry
+    from rec_cache import RecommendationCache
+    from session_store import SessionStore
+    from stamp_model import STAMP, NegativeSampler
+
+
+# --------------------------------------------------------
+# Query plans of the hot Rating/Book queries (migration 0004)
+# --------------------------------------------------------
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN output is SQLite-specific")
+class RatingQueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([User(user_id=f"u{i}") for i in range(20)])
+        cls.books = Book.objects.bulk_create(
+            [Book(book_isbn=f"isbn{i}", book_title=f"Title {i}") for i in range(50)])
+        Rating.objects.bulk_create([
+            Rating(user=u, book=b, rating=5.0)
+            for u in cls.users for b in cls.books[:10]
+        ])
+
+    def test_pair_lookup_uses_unique_index(self):
+        # record_interaction / api_get_rating
+        plan = Rating.objects.filter(user__user_id="u1", book__book_isbn="isbn1").explain()
+        # SQLite backs rating_unique_user_book with an automatic index
+        self.assertIn("backend_app_rating USING INDEX sqlite_autoindex_backend_app_rating_1 "
+                      "(user_id=? AND book_id=?)", plan)
+        self.assertNotIn("SCAN backend_app_rating", plan)
+
+    def test_recent_ratings_are_read_from_the_covering_index(self):
+        # recommend_books' session fallback
+        plan = (Rating.objects.filter(user__user_id="u1").order_by("-id")
+                .values_list("book__book_isbn", flat=True)[:5].explain())
+        self.assertIn("COVERING INDEX rating_user_recent_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_one_rating_per_user_and_book(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Rating.objects.create(user=self.users[0], book=self.books[0], rating=1.0)
+
+    def test_upsert_on_the_unique_constraint(self):
+        Rating.objects.bulk_create(
+            [Rating(user=self.users[0], book=self.books[0], rating=9.0)],
+            update_conflicts=True, unique_fields=["user", "book"], update_fields=["rating"])
+        Rating.objects.bulk_create(
+            [Rating(user=self.users[0], book=self.books[0], rating=7.14)], ignore_conflicts=True)
+        self.assertEqual(
+            list(Rating.objects.filter(user=self.users[0], book=self.books[0])
+                 .values_list("rating", flat=True)), [9.0])
+
+
+class BookFullTextSearchTests(TestCase):
+    def setUp(self):
+        if not fts.fts_available():
+            self.skipTest("SQLite without FTS5 trigram support")
+        Book.objects.create(book_isbn="a", book_title="The Harry Potter Collection",
+                            book_author="J. K. Rowling")
+        Book.objects.create(book_isbn="b", book_title="Potter's Field", book_author="Ellis Peters")
+        Book.objects.create(book_isbn="c", book_title="Unrelated", book_author="Nobody")
+
+    def test_match_uses_the_fts_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN SELECT rowid FROM {fts.FTS_TABLE} "
+                           f"WHERE {fts.FTS_TABLE} MATCH %s", ['"potter"'])
+            plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn("VIRTUAL TABLE INDEX", plan)
+        self.assertIn(fts.FTS_TABLE, plan)
+
+    def test_search_ranks_like_the_in_memory_index(self):
+        self.assertEqual(fts.search(["potter", "rowling"]), ["a", "b"])
+        self.assertEqual(fts.search(["arr"]), ["a"])
+        self.assertEqual(fts.search(["zz"]), [])
+
+    def test_triggers_keep_the_index_in_sync(self):
+        book = Book.objects.get(book_isbn="c")
+        book.book_title = "A Potter Cookbook"
+        book.save()
+        self.assertEqual(fts.search(["cookbook"]), ["c"])
+        Book.objects.filter(book_isbn="a").delete()
+        self.assertEqual(fts.search(["potter"]), ["b", "c"])
+
+
+# --------------------------------------------------------
+# SQLite connection tuning (db_tuning.py)
+# --------------------------------------------------------
+@skipUnless(connection.vendor == "sqlite", "PRAGMAs are SQLite-specific")
+class ConnectionTuningTests(TestCase):
+    databases = {"default", "replica"}
+
+    def _pragma(self, alias, name):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_new_connections_get_the_pragmas(self):
+        self.assertEqual(self._pragma("default", "busy_timeout"),
+                         db_tuning.DEFAULT_PRAGMAS["busy_timeout"])
+        self.assertEqual(self._pragma("default", "synchronous"), 1)      # NORMAL
+        self.assertEqual(self._pragma("default", "query_only"), 0)
+
+    def test_replica_is_read_only(self):
+        self.assertEqual(db_tuning.read_db(), "replica")
+        self.assertEqual(self._pragma("replica", "query_only"), 1)
+        with self.assertRaises(OperationalError):
+            User.objects.using("replica").create(user_id="nope")
+
+
+# --------------------------------------------------------
+# /metrics access
+# --------------------------------------------------------
+@override_settings(METRICS_ALLOWED_IPS=["127.0.0.1"], METRICS_TOKEN="s3cret")
+class MetricsAccessTests(TestCase):
+    def test_allowed_address(self):
+        response = self.client.get("/metrics", REMOTE_ADDR="127.0.0.1")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"stamp_model_ready", response.content)
+
+    def test_other_addresses_need_the_token(self):
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.0.0.7").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.0.0.7",
+                                         HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.0.0.7",
+                                         HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+
+    def test_empty_allowlist_needs_the_token_from_loopback(self):
+        # Behind a local reverse proxy every client arrives as 127.0.0.1
+        with self.settings(METRICS_ALLOWED_IPS=[]):
+            self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="127.0.0.1").status_code, 403)
+            self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="127.0.0.1",
+                                             HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+
+
+# --------------------------------------------------------
+# Readiness probe
+# --------------------------------------------------------
+class ModelReadyTests(TestCase):
+    def test_bad_wait_is_a_client_error(self):
+        response = self.client.get("/api/model/ready/", {"wait": "soon"})
+        self.assertEqual(response.status_code, 400)
+
+
+# --------------------------------------------------------
+# Streaming CSV import (scripts/import_clean_data.py)
+# --------------------------------------------------------
+class CsvImportTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def _csv(self, name, header, rows):
+        path = os.path.join(self.dir, name)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+        return path
+
+    def test_chunks_are_cut_between_records(self):
+        rows = [[f"isbn{i}", f'Line one\nline "two", {i}' if i % 3 == 0 else f"Title {i}"]
+                for i in range(50)]
+        path = self._csv("books.csv", ["book_isbn", "book_title"], rows)
+        header, start = csv_chunks.read_header(path)
+        parsed = []
+        for _, chunk in csv_chunks.iter_chunks(path, start, rows=3):
+            parsed.extend(csv_chunks.parse_books(header, chunk))
+        self.assertEqual([(r[0], r[1]) for r in parsed], [tuple(r) for r in rows])
+
+    def test_import_matches_the_csv_rows(self):
+        users = self._csv("users.csv", ["user_id", "age", "location"],
+                          [["1", "18.0", "a, b"], ["2", "", ""], ["3", "abc", "c"]])
+        books = self._csv("books.csv", ["book_isbn", "book_title", "year_of_publication"],
+                          [["x", "Potter's Field", "1999"], ["y", "Y" * 300, "n/a"]])
+        ratings = self._csv("ratings.csv", ["User-ID", "ISBN", "Book-Rating"],
+                            [["1", "x", "8"], ["2", "y", "5.5"], ["1", "x", "2"],
+                             ["9", "x", "3"], ["3", "y", ""]])
+        import_clean_data.import_users(users)
+        import_clean_data.import_books(books)
+        stats = import_clean_data.import_ratings(ratings)
+
+        self.assertEqual(list(User.objects.order_by("user_id").values_list("age", flat=True)),
+                         [18, None, None])
+        self.assertEqual(Book.objects.get(book_isbn="y").book_title, "Y" * 255)
+        self.assertIsNone(Book.objects.get(book_isbn="y").year_of_publication)
+        # The last rating of a pair wins; unknown users and empty ratings are skipped
+        self.assertEqual(
+            sorted(Rating.objects.values_list("user__user_id", "book__book_isbn", "rating")),
+            [("1", "x", 2.0), ("2", "y", 5.5)])
+        self.assertEqual((stats["rows"], stats["written"]), (4, 2))
+        if fts.fts_available():
+            self.assertEqual(fts.search(["potter"]), ["x"])
+
+    def test_resumes_after_the_checkpoint(self):
+        path = self._csv("users.csv", ["user_id", "age", "location"],
+                         [[str(i), "", ""] for i in range(10)])
+        header, start = csv_chunks.read_header(path)
+        with open(path, "rb") as f:
+            f.seek(start)
+            first_five = b"".join(f.readline() for _ in range(5))
+        csv_chunks.Checkpoint(path).save(start + len(first_five), 5, [])
+
+        stats = import_clean_data.import_users(path)
+        self.assertEqual(stats["rows"], 5)
+        self.assertEqual(sorted(User.objects.values_list("user_id", flat=True)),
+                         [str(i) for i in range(5, 10)])
+        self.assertIsNone(csv_chunks.Checkpoint(path).load())
+
+    @mock.patch.object(import_clean_data, "CHUNK_ROWS", 20)
+    def test_delta_import_applies_only_changed_chunks(self):
+        users = [[str(i), "30", "old"] for i in range(400)]
+        path = self._csv("users.csv", ["user_id", "age", "location"], users)
+        full = import_clean_data.import_users(path)
+        self.assertEqual(import_clean_data.import_users(path, delta=True)["rows"], 0)
+
+        users[150][2] = "new"                   # one row changed, one appended
+        users.append(["400", "", "added"])
+        self._csv("users.csv", ["user_id", "age", "location"], users)
+        stats = import_clean_data.import_users(path, delta=True)
+
+        self.assertEqual(User.objects.get(user_id="150").location, "new")
+        self.assertEqual(User.objects.get(user_id="400").location, "added")
+        self.assertEqual(User.objects.count(), 401)
+        self.assertLess(stats["rows"], 100)
+        self.assertEqual(stats["written"], 2)
+        self.assertGreaterEqual(stats["unchanged_chunks"], full["chunks"] - 3)
+        self.assertEqual(ImportManifest.objects.get(kind="users").chunk_digests,
+                         [csv_chunks.chunk_digest(*pair) for pair in self._chunks(path, 20)])
+
+    def test_delta_import_updates_ratings(self):
+        users = self._csv("users.csv", ["user_id"], [["1"], ["2"]])
+        books = self._csv("books.csv", ["book_isbn", "book_title"], [["x", "X"]])
+        ratings = self._csv("ratings.csv", ["user_id", "book_isbn", "rating"],
+                            [["1", "x", "8"], ["2", "x", "3"]])
+        import_clean_data.import_users(users)
+        import_clean_data.import_books(books)
+        import_clean_data.import_ratings(ratings)
+
+        self._csv("ratings.csv", ["user_id", "book_isbn", "rating"],
+                  [["1", "x", "8"], ["2", "x", "9"], ["2", "x", "10"]])
+        import_clean_data.import_ratings(ratings, delta=True)
+        self.assertEqual(
+            sorted(Rating.objects.values_list("user__user_id", "rating")), [("1", 8.0), ("2", 10.0)])
+
+    def test_delta_after_a_full_import_sees_its_changes(self):
+        users = self._csv("users.csv", ["user_id"], [["1"], ["2"]])
+        books = self._csv("books.csv", ["book_isbn", "book_title"], [["x", "X"]])
+        ratings = self._csv("ratings.csv", ["user_id", "book_isbn", "rating"],
+                            [["1", "x", "5"], ["2", "x", "3"]])
+        import_clean_data.import_users(users)
+        import_clean_data.import_books(books)
+        import_clean_data.import_ratings(ratings)
+
+        # A full import of the changed file must apply it, since it records the manifest
+        self._csv("ratings.csv", ["user_id", "book_isbn", "rating"], [["1", "x", "9"], ["2", "x", "3"]])
+        self.assertEqual(import_clean_data.import_ratings(ratings)["written"], 1)
+        self.assertEqual(import_clean_data.import_ratings(ratings, delta=True)["rows"], 0)
+        self.assertEqual(
+            sorted(Rating.objects.values_list("user__user_id", "rating")), [("1", 9.0), ("2", 3.0)])
+
+        self._csv("ratings.csv", ["user_id", "book_isbn", "rating"], [["1", "x", "9"], ["2", "x", "4"]])
+        import_clean_data.import_ratings(ratings, delta=True)
+        self.assertEqual(Rating.objects.get(user__user_id="2").rating, 4.0)
+
+    def test_delta_retries_ratings_once_their_user_is_imported(self):
+        users = self._csv("users.csv", ["user_id"], [["1"]])
+        books = self._csv("books.csv", ["book_isbn", "book_title"], [["x", "X"]])
+        ratings = self._csv("ratings.csv", ["user_id", "book_isbn", "rating"],
+                            [["1", "x", "8"], ["2", "x", "3"]])
+        import_clean_data.import_users(users, delta=True)
+        import_clean_data.import_books(books, delta=True)
+        self.assertEqual(import_clean_data.import_ratings(ratings, delta=True)["written"], 1)
+        self.assertEqual(import_clean_data.import_ratings(ratings, delta=True)["rows"], 0)
+
+        self._csv("users.csv", ["user_id"], [["1"], ["2"]])
+        import_clean_data.import_users(users, delta=True)
+        stats = import_clean_data.import_ratings(ratings, delta=True)
+        self.assertEqual((stats["rows"], stats["written"]), (2, 1))
+        self.assertEqual(
+            sorted(Rating.objects.values_list("user__user_id", "rating")), [("1", 8.0), ("2", 3.0)])
+        self.assertEqual(import_clean_data.import_ratings(ratings, delta=True)["rows"], 0)
+
+    def _chunks(self, path, rows):
+        header, start = csv_chunks.read_header(path)
+        return [(header, chunk) for _, chunk in csv_chunks.iter_chunks(path, start, rows)]
+
+
+# --------------------------------------------------------
+# Offline evaluation (model/evaluate.py)
+# --------------------------------------------------------
+class EvaluationTests(SimpleTestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = STAMP(num_items=300, embed_dim=16)
+        g = torch.Generator().manual_seed(0)
+        self.sessions = [torch.randint(1, 300, (6,), generator=g).tolist() for _ in range(100)]
+
+    def test_ties_rank_below_the_target(self):
+        with torch.no_grad():
+            for p in self.model.parameters():
+                p.zero_()
+        for mode in ("full", "sampled"):
+            res = evaluate(self.model, self.sessions, ks=(10,), mode=mode, n_neg=100)
+            self.assertEqual(res["recall@10"], 0.0, mode)
+
+    def test_full_mode_ranks_added_items_too(self):
+        self.model.add_items(40, init=torch.randn(40, 16))
+        self.model.eval()
+        seqs, targets = torch.randint(1, 340, (32, 5)), torch.randint(1, 340, (32,))
+        ranks = target_ranks(self.model, seqs, targets, chunk_size=64)
+
+        with torch.no_grad():
+            h = self.model.session_representation(seqs)
+            target_scores = (h * self.model.embed_items(targets)).sum(dim=1, keepdim=True)
+            scores = h @ self.model.item_weight.T
+        scores[:, 0] = float("-inf")
+        scores[torch.arange(32), targets] = float("-inf")
+        self.assertTrue(torch.equal(ranks, (scores >= target_scores).sum(dim=1)))
+
+
+# --------------------------------------------------------
+# ML facade (backend_app/ml.py)
+# --------------------------------------------------------
+class MlFacadeTests(SimpleTestCase):
+    def test_commands_do_not_start_the_serving_threads(self):
+        utils = ml._ml(serving=False)
+        self.assertTrue(hasattr(utils, "reload_model"))
+        self.assertEqual(ml.model_lifecycle.state, ml.model_lifecycle.IDLE)
+        names = {t.name for t in threading.enumerate()}
+        self.assertNotIn("stamp-autoload", names)
+        self.assertNotIn("interaction-writer", names)
+
+
+# --------------------------------------------------------
+# Full-catalog top-k (model/stamp_model.py STAMP.topk)
+# --------------------------------------------------------
+class TopKTests(SimpleTestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = STAMP(num_items=50, embed_dim=8).eval()
+        self.model.add_items(6, init=torch.randn(6, 8))
+        self.seqs = torch.randint(1, 56, (4, 5))
+        self.exclude = torch.tensor([[3, 7, 0], [55, 0, 0], [1, 2, 3], [0, 0, 0]])
+
+    def _expected(self, k):
+        with torch.no_grad():
+            scores = self.model.session_representation(self.seqs) @ self.model.item_weight.T
+        scores[:, 0] = float("-inf")
+        scores[torch.arange(4).unsqueeze(1), self.exclude] = float("-inf")
+        top = torch.topk(scores, min(k, scores.size(1)))
+        return [[i for s, i in zip(row_s, row_i) if s != float("-inf")]
+                for row_s, row_i in zip(top.values.tolist(), top.indices.tolist())]
+
+    def test_matches_torch_topk(self):
+        for k in (1, 10, 55):
+            with torch.no_grad():
+                _, items = self.model.topk(self.seqs, k, chunk_size=16, exclude_items=self.exclude)
+            got = [[i for i in row if i >= 0] for row in items.tolist()]
+            self.assertEqual(got, self._expected(k), k)
+
+    def test_k_beyond_the_catalog_returns_only_valid_items(self):
+        with torch.no_grad():
+            scores, items = self.model.topk(self.seqs, 100, chunk_size=16, exclude_items=self.exclude)
+        self.assertEqual(items.size(1), 55)             # 56 rows minus padding
+        self.assertFalse(bool(torch.isin(items[0], torch.tensor([0, 3, 7])).any()))
+        self.assertEqual((items[2] == -1).sum().item(), 3)
+        self.assertTrue(bool(torch.isfinite(scores[items >= 0]).all()))
+
+
+# --------------------------------------------------------
+# Hot reload sanity gate (model/utils.py reload_model)
+# --------------------------------------------------------
+class ReloadSanityTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.utils = ml._ml(serving=False)
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([User(user_id=f"u{i}") for i in range(40)])
+        books = Book.objects.bulk_create(
+            [Book(book_isbn=f"isbn{i}", book_title=f"Title {i}") for i in range(80)])
+        g = torch.Generator().manual_seed(0)
+        Rating.objects.bulk_create([
+            Rating(user=u, book=books[j], rating=5.0)
+            for u in users for j in torch.randperm(80, generator=g)[:10].tolist()
+        ])
+
+    def _reload(self, model):
+        model.eval()
+        state = {
+            "trained_model": model, "model_version": "candidate", "model_path": "candidate",
+            "book_index": {f"isbn{i}": i + 1 for i in range(80)},
+            "ann_index": IVFIndex(n_lists=4, n_probe=4).build(
+                model.item_embedding.weight, lookup=model.embed_items),
+        }
+        with mock.patch.object(self.utils, "resolve_model_path", return_value="candidate"), \
+                mock.patch.object(self.utils, "prepare_model", return_value=state):
+            return self.utils.reload_model(dry_run=True)
+
+    def test_zero_weight_model_is_refused(self):
+        model = STAMP(num_items=81, embed_dim=16)
+        with torch.no_grad():
+            for p in model.parameters():
+                p.zero_()
+        with self.assertRaisesMessage(ValueError, "alike"):
+            self._reload(model)
+
+    def test_random_model_is_refused(self):
+        torch.manual_seed(0)
+        with self.assertRaisesMessage(ValueError, "ML_RELOAD_MIN_RECALL"):
+            self._reload(STAMP(num_items=81, embed_dim=16))
+        self.assertEqual(self.utils.get_reload_status()["state"], "failed")
+
+    def test_candidate_must_keep_up_with_the_live_model(self):
+        self.utils._check_sanity({"recall@10": 0.45}, {"recall@10": 0.5})
+        with self.assertRaisesMessage(ValueError, "live model"):
+            self.utils._check_sanity({"recall@10": 0.3}, {"recall@10": 0.5})
+
+
+# --------------------------------------------------------
+# Append-only item registry (model/item_registry.py)
+# --------------------------------------------------------
+class ItemRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, "items.txt")
+
+    def test_ids_survive_appends_and_reloads(self):
+        ItemRegistry(["b", "a"]).save(self.path)
+        serving, training = ItemRegistry.load(self.path), ItemRegistry.load(self.path)
+        self.assertEqual(serving.add("new"), (3, True))          # handle_new_book
+        self.assertEqual(training.extend(["a", "c", "new", "c"]), 1)
+
+        reloaded = ItemRegistry.load(self.path)
+        self.assertEqual(reloaded.book_index(), {"b": 1, "a": 2, "new": 3, "c": 4})
+        self.assertEqual(serving.sync(), 1)
+        self.assertEqual(serving.get("c"), 4)
+        self.assertEqual(serving.add("c"), (4, False))
+
+
+# --------------------------------------------------------
+# Write-behind interaction log (model/interaction_log.py)
+# --------------------------------------------------------
+CRASHING_WORKER = """
+import os, sys
+sys.path.insert(0, sys.argv[1])
+from interaction_log import InteractionLog
+log = InteractionLog(lambda events: None, journal_dir=sys.argv[2], flush_interval=3600)
+log.record("u1", "a", 8.0)
+log.record("u1", "b", implicit=True)
+os._exit(1)
+"""
+
+
+class InteractionLogTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.written = []
+
+    def _log(self, writer=None, **kwargs):
+        log = InteractionLog(writer or self.written.extend, journal_dir=self.dir,
+                             flush_interval=3600, **kwargs)
+        self.addCleanup(log.close)
+        return log
+
+    def test_coalesce_keeps_rating_semantics(self):
+        events = [("u", "a", None, True), ("u", "a", 6.0, False), ("u", "b", 3.0, False),
+                  ("u", "a", None, True), ("u", "a", 9.0, False), ("v", "a", None, True)]
+        self.assertEqual(coalesce(events),
+                         [("u", "a", 9.0, False), ("u", "b", 3.0, False), ("v", "a", None, True)])
+
+    def test_journal_of_a_crashed_worker_is_replayed(self):
+        subprocess.run([sys.executable, "-c", CRASHING_WORKER, ml.MODEL_DIR, self.dir], check=False)
+        self.assertEqual(len(pending_events(self.dir, "u1", "a")), 1)
+
+        log = self._log()
+        log.start()
+        log.close()                     # the writer thread replays before it stops
+        self.assertEqual(sorted(self.written), [("u1", "a", 8.0, False), ("u1", "b", None, True)])
+        self.assertEqual(log.stats()["recovered"], 2)
+        self.assertEqual(pending_events(self.dir, "u1", "a"), [])
+
+    def test_failing_event_is_dead_lettered(self):
+        def writer(events):
+            if any(e[1] == "bad" for e in events):
+                raise ValueError("no such book")
+            self.written.extend(events)
+
+        log = self._log(writer, max_attempts=1)
+        for isbn in ("a", "bad", "b"):
+            log.record("u", isbn, 5.0)
+        self.assertEqual(log.flush(), 3)
+        self.assertEqual(sorted(e[1] for e in self.written), ["a", "b"])
+        self.assertEqual(log.stats()["dead_lettered"], 1)
+        [dead] = [n for n in os.listdir(self.dir) if n.startswith("dead-letter-")]
+        with open(os.path.join(self.dir, dead)) as f:
+            self.assertEqual(json.loads(f.readline())["event"], ["u", "bad", 5.0, False])
+        self.assertEqual(pending_events(self.dir, "u", "bad"), [])
+
+
+class PendingRatingTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.client = APIClient()
+        self.client.force_authenticate(RegisteredUser.objects.create(username="r", email="r@x.io"))
+        Rating.objects.create(user=User.objects.create(user_id="u1"),
+                              book=Book.objects.create(book_isbn="a", book_title="A"), rating=3.0)
+
+    def _rating(self, isbn):
+        with self.settings(ML_INTERACTION_LOG={"JOURNAL_DIR": self.dir}):
+            response = self.client.get("/api/model/rating/", {"user_id": "u1", "book_isbn": isbn})
+        return response.json()["rating"]
+
+    def test_reads_ratings_queued_by_another_worker(self):
+        other = InteractionLog(lambda events: None, journal_dir=self.dir, flush_interval=3600)
+        self.addCleanup(other.close)
+        self.assertEqual(self._rating("a"), 3.0)
+        other.record("u1", "a", 9.0)
+        other.record("u1", "b", implicit=True)
+        self.assertEqual(self._rating("a"), 9.0)
+        self.assertEqual(self._rating("b"), 7.14)
+
+
+# --------------------------------------------------------
+# In-memory book search (backend_app/search_index.py)
+# --------------------------------------------------------
+WORDS = ["harry", "potter", "pot", "rowling", "field", "peters", "the", "of", "a",
+         "stone", "chamber", "secrets", "tolkien", "ring", "lord", "x"]
+
+
+def _scan_search(tokens, limit=50):
+    """The full-table scan search_books used before the index."""
+    scores = {}
+    for book in Book.objects.order_by("id"):
+        text = f"{book.book_title or ''} {book.book_author or ''}".lower()
+        score = sum(token in text for token in tokens)
+        if score > 0:
+            scores[book.book_isbn] = score
+    return sorted(scores, key=lambda isbn: -scores[isbn])[:limit]
+
+
+class BookSearchIndexTests(TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        for i in range(300):
+            Book.objects.create(
+                book_isbn=f"isbn{i}",
+                book_title=" ".join(rng.choice(WORDS).title() for _ in range(rng.randint(1, 5))),
+                book_author=rng.choice([None, "J. K. Rowling", "Ellis Peters", "J.R.R. Tolkien"]))
+        self.queries = [["potter"], ["pot", "row"], ["the", "x"], ["a"], ["tolkien", "ring", "lord"],
+                        ["ers"], ["j."], ["nothing"], ["harry", "potter", "rowling", "stone"]]
+
+    def test_ranks_like_the_table_scan(self):
+        index = BookSearchIndex()
+        for tokens in self.queries:
+            self.assertEqual(index.search(tokens, limit=40), _scan_search(tokens, limit=40), tokens)
+
+    def test_follows_book_updates(self):
+        index = BookSearchIndex()
+        index.build()
+        book = Book.objects.get(book_isbn="isbn7")
+        book.book_title, book.book_author = "Potter Potter", "Nobody"
+        book.save()
+        index.add_book(book.book_isbn, book.book_title, book.book_author)
+        Book.objects.filter(book_isbn="isbn8").delete()
+        index.remove_book("isbn8")
+        for tokens in self.queries:
+            self.assertEqual(index.search(tokens), _scan_search(tokens), tokens)
+
+
+# --------------------------------------------------------
+# Micro-batched scoring (model/batching.py)
+# --------------------------------------------------------
+class MicroBatcherTests(SimpleTestCase):
+    def test_batched_results_match_single_requests(self):
+        torch.manual_seed(0)
+        model = STAMP(num_items=200, embed_dim=16).eval()
+        ivf = IVFIndex(n_lists=8, n_probe=8).build(model.item_embedding.weight,
+                                                   lookup=model.embed_items)
+        g = random.Random(0)
+        requests = [dict(seq_idx=[g.randrange(1, 200) for _ in range(g.randint(1, 30))],
+                         candidate_idxs=g.sample(range(1, 200), g.randint(0, 20)),
+                         top_k=g.choice([1, 5, 10]), ann_index=g.choice([ivf, None]),
+                         ann_k=g.choice([0, 10])) for _ in range(40)]
+        requests.append(dict(seq_idx=[3], candidate_idxs=[], top_k=5, ann_index=None, ann_k=0))
+
+        single = MicroBatcher(max_batch_size=1, max_wait_ms=0, max_seq_len=20)
+        expected = [single.score(model, timeout=10, **r) for r in requests]
+
+        batched = MicroBatcher(max_batch_size=16, max_wait_ms=50, max_seq_len=20)
+        futures = [batched.submit(model, **r) for r in requests]
+        self.assertEqual([f.result(timeout=10) for f in futures], expected)
+        self.assertGreater(batched.stats()["max_batch_size"], 1)
+
+
+# --------------------------------------------------------
+# Negative sampling (model/stamp_model.py NegativeSampler)
+# --------------------------------------------------------
+class NegativeSamplerTests(SimpleTestCase):
+    def test_draws_follow_popularity(self):
+        freq = {i: (i % 7 + 1) ** 2 for i in range(1, 30)}
+        sampler = NegativeSampler(num_items=30, item_freq_counter=freq, power=0.75, seed=1)
+        expected = sampler.probs
+
+        # The alias table encodes the distribution exactly
+        implied = sampler.prob_table.copy()
+        for p, a in zip(sampler.prob_table, sampler.alias_table):
+            implied[a] += 1.0 - p
+        self.assertLess(abs(implied / 30 - expected).max(), 1e-9)
+
+        draws = sampler.sample(1000, 200).ravel()
+        empirical = torch.bincount(torch.from_numpy(draws), minlength=30).double() / draws.size
+        self.assertLess((empirical - torch.from_numpy(expected)).abs().max().item(), 0.005)
+
+        sampler.to("cpu", seed=1)
+        draws = sampler.sample_tensor(1000, 200).ravel()
+        empirical = torch.bincount(draws, minlength=30).double() / draws.numel()
+        self.assertLess((empirical - torch.from_numpy(expected)).abs().max().item(), 0.005)
+
+
+# --------------------------------------------------------
+# Session store and result cache (model/session_store.py, model/rec_cache.py)
+# --------------------------------------------------------
+class SessionStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, "sessions.sqlite3")
+
+    def test_evicted_users_are_reloaded_from_the_shared_tier(self):
+        store = SessionStore(path=self.path, max_len=3, local_max_users=2)
+        store.extend(1, ["a", "b"])
+        store.extend("2", ["c"])
+        store.extend("3", ["d"])
+        self.assertEqual(store.stats()["evictions"], 1)
+        self.assertEqual(store.append("1", "e"), ["a", "b", "e"])
+        self.assertEqual(store.append(1, "f"), ["b", "e", "f"])
+
+        restarted = SessionStore(path=self.path, max_len=3, local_max_users=2)
+        self.assertEqual(restarted.get("1"), ["b", "e", "f"])
+        self.assertEqual(restarted.get(3), ["d"])
+        self.assertEqual(restarted.get("nobody"), [])
+        self.assertEqual((restarted.stats()["shared_hits"], restarted.stats()["misses"]), (2, 1))
+
+    def test_expired_sessions_are_purged(self):
+        store = SessionStore(path=self.path, ttl_seconds=60, purge_every=2)
+        with mock.patch("time.time", return_value=1000.0):
+            store.append("old", "a")
+        with mock.patch("time.time", return_value=2000.0):
+            self.assertEqual(store.get("old"), [])
+            store.append("new", "b")
+        self.assertEqual(store.stats()["expired"], 1)
+
+
+class RecommendationCacheTests(SimpleTestCase):
+    def test_hits_until_the_session_or_model_changes(self):
+        cache = RecommendationCache()
+        key = cache.key(["a", "b"], 5, "v1")
+        cache.put("u", key, ["x"])
+        self.assertEqual(cache.get("u", cache.key(["a", "b"], 5, "v1")), ["x"])
+        self.assertIsNone(cache.get("u", cache.key(["a", "b", "c"], 5, "v1")))
+        self.assertIsNone(cache.get("u", cache.key(["a", "b"], 5, "v2")))
+        cache.invalidate("u")
+        self.assertIsNone(cache.get("u", key))
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (1, 3))
+
+
+# --------------------------------------------------------
+# Serving artifact (model/artifact.py)
+# --------------------------------------------------------
+class ArtifactTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, "stamp")
+        torch.manual_seed(0)
+        self.model = STAMP(num_items=120, embed_dim=16).eval()
+        self.registry = ItemRegistry([f"isbn{i}" for i in range(1, 120)])
+        self.manifest = save_artifact(self.path, self.model.state_dict(), self.registry)
+
+    def test_round_trip(self):
+        loaded, manifest = load_artifact(self.path, STAMP)
+        self.assertEqual(manifest["version"], self.manifest["version"])
+        self.assertTrue(torch.equal(loaded.item_embedding.weight, self.model.item_embedding.weight))
+        seqs = torch.randint(1, 120, (8, 6))
+        with torch.no_grad():
+            self.assertTrue(torch.allclose(loaded.session_representation(seqs),
+                                           self.model.session_representation(seqs)))
+        ivf = load_ivf(self.path, manifest, loaded.embed_items)
+        self.assertEqual(len(ivf), 119)
+        self.assertEqual(ItemRegistry.load(os.path.join(self.path, "items.txt")).get("isbn5"), 5)
+
+    def test_registry_must_match_the_manifest(self):
+        items = os.path.join(self.path, "items.txt")
+        with open(items, "a") as f:            # serving appends new books: still valid
+            f.write("isbn-new\n")
+        load_artifact(self.path, STAMP)
+        with open(items) as f:
+            lines = f.readlines()
+        lines[0], lines[1] = lines[1], lines[0]
+        with open(items, "w") as f:
+            f.writelines(lines)
+        with self.assertRaisesMessage(ValueError, "does not match"):
+            load_artifact(self.path, STAMP)
 
-# Create your tests here.
@@ -0,0 +1,153 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from contextlib import ExitStack, contextmanager
+
+
+# --------------------------------------------------------
+# Structured, non-blocking logging for the serving hot path
+# --------------------------------------------------------
+# Loggers live under "stamp." and are configured by settings.LOGGING. Hot-path
+# code logs one record per request with its timing spans; anything that needs
+# extra work (queries, formatting sessions) is guarded by isEnabledFor(DEBUG).
+
+def get_logger(name):
+    return logging.getLogger(f"stamp.{name}")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra={"fields": {...}}` becomes top-level keys."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class NonBlockingHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to a bounded queue; a QueueListener thread formats them and
+    writes them to `stream`, so a request never waits on stdout. When the
+    queue is full records are dropped (and counted) rather than blocking.
+    The listener is (re)started per process, so it survives forking workers.
+    """
+
+    def __init__(self, stream=None, maxsize=10_000):
+        super().__init__(queue.Queue(maxsize))
+        self.maxsize = maxsize
+        self.target = logging.StreamHandler(stream or sys.stdout)
+        self.target.setFormatter(JsonFormatter())
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        atexit.register(self.stop)
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Keep `fields`; only freeze the message and drop unpicklable bits
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self.target.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def _start(self):
+        self._pid = os.getpid()
+        # A fresh queue: the parent's may have been locked mid-put at fork
+        self.queue = queue.Queue(self.maxsize)
+        self._listener = logging.handlers.QueueListener(self.queue, self.target)
+        self._listener.start()
+
+    def stop(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+            self._pid = None
+
+
+# --------------------------------------------------------
+# Per-request timing spans
+# --------------------------------------------------------
+class Trace:
+    """
+    Collects named timing spans of one request and logs them as a single
+    structured record on `finish()`:
+
+        trace = Trace(logger, "recommend", user_id=user_id)
+        with trace.span("candidates"):
+            ...
+        trace.finish(n=len(result))
+
+    `db()` times the Django queries run inside it ("db" span plus a count),
+    on the default connection and on the read alias (db_tuning.read_db()).
+    """
+
+    __slots__ = ("logger", "event", "fields", "spans", "started_at")
+
+    def __init__(self, logger, event, **fields):
+        self.logger = logger
+        self.event = event
+        self.fields = fields
+        self.spans = {}
+        self.started_at = time.perf_counter()
+
+    @contextmanager
+    def span(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - t0) * 1000)
+
+    def add(self, name, ms):
+        self.spans[name] = self.spans.get(name, 0.0) + ms
+
+    @contextmanager
+    def db(self):
+        from django.db import connections
+        from .db_tuning import read_db
+
+        def timed(execute, sql, params, many, context):
+            t0 = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                self.add("db", (time.perf_counter() - t0) * 1000)
+                self.fields["db_queries"] = self.fields.get("db_queries", 0) + 1
+
+        with ExitStack() as stack:
+            for alias in dict.fromkeys(("default", read_db())):
+                stack.enter_context(connections[alias].execute_wrapper(timed))
+            yield
+
+    def finish(self, level=logging.INFO, **fields):
+        """Log the request; returns {span: ms} including "total"."""
+        self.spans["total"] = (time.perf_counter() - self.started_at) * 1000
+        if self.logger.isEnabledFor(level):
+            self.fields.update(fields)
+            self.fields["spans_ms"] = {k: round(v, 2) for k, v in self.spans.items()}
+            self.logger.log(level, self.event, extra={"fields": self.fields})
+        return self.spans
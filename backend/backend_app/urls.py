@@ -14,6 +14,9 @@ urlpatterns = [
     path('api/model/record/', views.api_record_interaction, name='record_interaction'),
     path('api/model/recommend/<str:user_id>/', views.api_recommend, name='recommend'),
     path('api/model/rating/', views.api_get_rating, name='get_rating'),  
+    path('api/model/reload/', views.api_model_reload, name='model_reload'),
+    path('api/model/ready/', views.api_model_ready, name='model_ready'),
+    path('metrics', views.metrics, name='metrics'),
     
     path('api/auth/me/', views.MeAPIView.as_view(), name='me'),
 
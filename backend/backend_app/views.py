@@ -1,4 +1,3 @@
-import sys, os
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
@@ -16,22 +15,16 @@ from .serializers import (
 from .utils_auth import generate_tokens_for_registered_user
 from rest_framework.permissions import IsAuthenticated
 from .permissions import IsRegisteredAdmin
+from .search_index import book_search_index
+from . import fts
+from .db_tuning import read_db
 
 
-MODEL_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../model'))
-if MODEL_DIR not in sys.path:
-    sys.path.append(MODEL_DIR)
-
-from utils import (
-    load_model, load_mappings_from_db, recommend_books,
-    record_interaction, handle_new_user, handle_new_book
-)
-try:
-    from stamp_model import STAMP
-except ModuleNotFoundError:
-    # If it's inside utils.py
-    from utils import STAMP
-from .permissions import BookPermission
+from django.http import HttpResponse
+from . import ml
+from .ml import ModelNotReady
+from .metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .permissions import BookPermission, metrics_access_allowed
 
 # -------------------------
 # AUTH VIEWS
@@ -43,7 +36,7 @@ class RegisterAPIView(APIView):
         serializer = RegisteredUserSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
-        handle_new_user(user.id)  # Add ML user
+        ml.handle_new_user(user.id)  # Add ML user
         return Response({"message": "Registered successfully", "user_id": user.id}, status=status.HTTP_201_CREATED)
 
 
@@ -111,7 +104,7 @@ class BookViewSet(viewsets.ModelViewSet):
         if not isbns:
             return Response({"error": "No ISBNs provided."}, status=400)
         
-        books = Book.objects.filter(book_isbn__in=isbns)
+        books = Book.objects.using(read_db()).filter(book_isbn__in=isbns)
         serializer = self.get_serializer(books, many=True)
         return Response(serializer.data)
     @action(detail=False, methods=['get'], url_path=r'search/(?P<query>[^/.]+)')
@@ -124,17 +117,15 @@ class BookViewSet(viewsets.ModelViewSet):
         tokens = [token.strip().lower() for token in query.split() if token.strip()]
         if not tokens:
             return Response({"error": "Empty search query."}, status=400)
-        book_scores = {}
-
-        for book in Book.objects.only('book_isbn', 'book_title', 'book_author'):
-            text = f"{book.book_title or ''} {book.book_author or ''}".lower()
-            score = sum(token in text for token in tokens)
-            if score > 0:
-                book_scores[book.book_isbn] = score
 
-        ranked_isbns = sorted(book_scores.keys(), key=lambda x: -book_scores[x])
         top_n = int(request.GET.get('limit', 50))
-        ranked_isbns = ranked_isbns[:top_n]
+        ranked_isbns = None
+        # Until the in-memory index is built, answer from the SQLite FTS table
+        if not book_search_index.is_built and fts.fts_available():
+            book_search_index.build_in_background()
+            ranked_isbns = fts.search(tokens, limit=top_n)
+        if ranked_isbns is None:
+            ranked_isbns = book_search_index.search(tokens, limit=top_n)
 
         return Response({
             "query": query,
@@ -158,7 +149,10 @@ def api_record_interaction(request):
     book_isbn = request.data.get('book_isbn')
     rating = request.data.get('rating', None)
     implicit = request.data.get('implicit', False)
-    res = record_interaction(user_id, book_isbn, rating, implicit)
+    try:
+        res = ml.record_interaction(user_id, book_isbn, rating, implicit)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     return Response(res)
 
 
@@ -167,9 +161,73 @@ def api_record_interaction(request):
 def api_recommend(request, user_id):
     """Get top-k recommendations"""
     top_k = int(request.GET.get('top_k', 5))
-    res = recommend_books(str(user_id), top_k)
+    try:
+        res = ml.recommend_books(str(user_id), top_k)
+    except ModelNotReady as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        headers={"Retry-After": "5"})
+    except TimeoutError:
+        return Response({"error": "Scoring timed out, try again."},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={"Retry-After": "1"})
     return Response(res)
 
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def api_model_ready(request):
+    """
+    GET /api/model/ready/ → 200 once the STAMP model is loaded, 503 before.
+    Includes the startup timing breakdown; ?wait=<seconds> blocks up to that long.
+    """
+    try:
+        wait = float(request.GET.get('wait', 0) or 0)
+    except ValueError:
+        return Response({"error": "wait must be a number of seconds"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if wait > 0:
+        ml.wait_model_ready(min(wait, 60.0))
+    data = ml.get_model_status()
+    return Response(data, status=status.HTTP_200_OK if data["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+def metrics(request):
+    """
+    GET /metrics → Prometheus text format: recommend stage histograms, cache
+    and session hit rates, interaction queue depth, model load/reload times.
+    Per worker process; does not load the ML stack. Only for allowed scrapers
+    (see permissions.metrics_access_allowed), 403 otherwise.
+    """
+    if not metrics_access_allowed(request):
+        return HttpResponse("Forbidden\n", status=403, content_type="text/plain")
+    return HttpResponse(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsRegisteredAdmin])
+def api_model_reload(request):
+    """
+    GET  /api/model/reload/  → status of the last reload and the live model version
+    POST /api/model/reload/  {"model_path": optional, "dry_run": bool, "wait": bool}
+         Loads, warms up and sanity-checks the model, then swaps it in.
+         By default runs in the background (202) and tells the other workers
+         to reload too; dry_run/wait run in this request and return the report.
+    """
+    if request.method == 'GET':
+        return Response(ml.get_reload_status())
+
+    model_path = request.data.get('model_path') or None
+    dry_run = bool(request.data.get('dry_run', False))
+    wait = bool(request.data.get('wait', False))
+    try:
+        if dry_run or wait:
+            report = ml.reload_model(model_path, dry_run=dry_run)
+            return Response(report)
+        return Response(ml.start_reload(model_path), status=status.HTTP_202_ACCEPTED)
+    except RuntimeError as e:
+        return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+    except (ValueError, FileNotFoundError) as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def api_get_rating(request):
@@ -184,25 +242,21 @@ def api_get_rating(request):
     if not user_id or not book_isbn:
         return Response({"error": "user_id and book_isbn are required."}, status=400)
 
-    try:
-        user = User.objects.get(user_id=user_id)
-        book = Book.objects.get(book_isbn=book_isbn)
-        rating = Rating.objects.filter(user=user, book=book).first()
-        if rating:
-            data = {
-                "user_id": user_id,
-                "book_isbn": book_isbn,
-                "rating": rating.rating
-            }
-        else:
-            data = {
-                "user_id": user_id,
-                "book_isbn": book_isbn,
-                "rating": 0.0
-            }
-        return Response(data)
-    except (User.DoesNotExist, Book.DoesNotExist):
-        return Response({"user_id": user_id, "book_isbn": book_isbn, "rating": 0.0})
+    # Ratings are written behind: read events still journaled by any worker
+    # before the table (an event no longer journaled was committed first)
+    pending = ml.pending_interactions(user_id, book_isbn)
+    # One query: unique user_id / book_isbn lookups, then the (user, book) unique index
+    rating = (
+        Rating.objects.filter(user__user_id=user_id, book__book_isbn=book_isbn)
+        .values_list("rating", flat=True)
+        .first()
+    )
+    rating = ml.apply_events(rating, pending)
+    return Response({
+        "user_id": user_id,
+        "book_isbn": book_isbn,
+        "rating": rating if rating is not None else 0.0
+    })
 
  
 class MeAPIView(APIView):
@@ -0,0 +1,430 @@
+"""
+Load test: latency and throughput of the recommendation API.
+
+    python benchmarks/bench_api.py                        # Book-Crossing-sized, in-process
+    python benchmarks/bench_api.py --scale 0.1 --concurrency 1 8 32
+    python benchmarks/bench_api.py --url http://localhost:8000 --token <JWT> --scale 0.1
+    python benchmarks/bench_api.py --compare benchmarks/results/bench_api-<sha>.json
+
+Seeds a SQLite database (cached in --work-dir between runs) with a synthetic
+catalog shaped like Book-Crossing: ~271k books, ~105k rating users and ~1.15M
+ratings at --scale 1, Zipf-distributed book popularity, long-tailed user
+activity and titles drawn from a shared vocabulary so keyword candidates and
+search behave realistically. A randomly initialised STAMP artifact matching
+the catalog is served; latency does not depend on the weights.
+
+Scenarios (each at every --concurrency level):
+
+- recommend: GET  /api/model/recommend/<user_id>/
+- record   : POST /api/model/record/      (explicit and implicit, 1:3)
+- search   : GET  /api/books/search/<query>/
+- bulk     : POST /api/books/bulk/        (20 ISBNs)
+
+In-process mode drives Django's test client from worker threads against the
+seeded database; --url sends the same requests to a running server (which
+must serve the seeded database or a similar one). Results (p50/p95/p99,
+throughput, errors, RSS) are printed and written as JSON for comparison
+across commits.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BACKEND_DIR = os.path.join(ROOT, "backend")
+MODEL_DIR = os.path.join(ROOT, "model")
+MIGRATIONS_DIR = os.path.join(BACKEND_DIR, "backend_app", "migrations")
+
+# Book-Crossing at scale 1
+FULL_BOOKS = 271_000
+FULL_USERS = 105_000
+FULL_RATINGS = 1_150_000
+
+VOCABULARY = (
+    "love night house dark secret world story river garden shadow king queen "
+    "war peace summer winter journey island mountain city murder mystery ghost "
+    "dream heart fire water stone light death life child mother father sister "
+    "brother family friend stranger letter diary island empire dragon magic "
+    "witch wizard sword crown kingdom forest ocean storm star moon sunrise "
+    "cooking history science guide travel poems letters spirit angel devil "
+    "detective crime lawyer doctor nurse soldier pilot horse cats dogs "
+).split()
+
+SETTINGS_TEMPLATE = '''\
+from backend.settings import *
+DATABASES = {{alias: dict(cfg, NAME={db!r}) for alias, cfg in DATABASES.items()}}
+ALLOWED_HOSTS = ["testserver", "localhost", "127.0.0.1"]
+ML_SESSION_STORE = dict(ML_SESSION_STORE, PATH={sessions!r})
+ML_INTERACTION_LOG = dict(ML_INTERACTION_LOG, JOURNAL_DIR={journal!r})
+ML_RELOAD_TRIGGER = {trigger!r}
+ML_RECOMMEND_CACHE = dict(ML_RECOMMEND_CACHE, TTL_SECONDS={cache_ttl!r})
+LOGGING["loggers"]["stamp"]["level"] = "WARNING"
+'''
+
+
+# --------------------------------------------------------
+# Synthetic catalog
+# --------------------------------------------------------
+def seed_database(db_path, n_books, n_users, n_ratings, seed=0):
+    """Fill the (migrated) database with books, users and ratings; fast raw inserts."""
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    vocab = np.array(VOCABULARY)
+
+    def books():
+        words = rng.integers(0, len(vocab), size=(n_books, 3))
+        years = rng.integers(1950, 2005, size=n_books)
+        for i in range(n_books):
+            w = vocab[words[i]]
+            yield (f"B{i:09d}", f"The {w[0].title()} {w[1].title()} of {w[2].title()}",
+                   f"Author {i % 40_000}", int(years[i]), f"Publisher {i % 5_000}")
+
+    conn.executemany(
+        "INSERT INTO backend_app_book (book_isbn, book_title, book_author, "
+        "year_of_publication, publisher) VALUES (?, ?, ?, ?, ?)", books())
+    conn.executemany(
+        "INSERT INTO backend_app_user (user_id, age, location) VALUES (?, ?, ?)",
+        ((f"U{u}", int(18 + u % 60), "benchville, usa") for u in range(n_users)))
+    book_ids = [r[0] for r in conn.execute("SELECT id FROM backend_app_book ORDER BY id")]
+    user_ids = [r[0] for r in conn.execute("SELECT id FROM backend_app_user ORDER BY id")]
+
+    # Zipf popularity over books, long-tailed activity over users
+    book_rank = rng.zipf(1.3, size=n_ratings) - 1
+    book_rank = np.where(book_rank < n_books, book_rank, rng.integers(0, n_books, size=n_ratings))
+    activity = rng.zipf(1.8, size=n_users).astype(float)
+    user_pick = rng.choice(n_users, size=n_ratings, p=activity / activity.sum())
+    perm = rng.permutation(n_books)
+    # One rating per (user, book), like the real dataset
+    pairs = np.unique(np.stack([user_pick, perm[book_rank]], axis=1), axis=0)
+    pairs = pairs[rng.permutation(len(pairs))]
+    scores = rng.integers(1, 11, size=len(pairs))
+    conn.executemany(
+        "INSERT INTO backend_app_rating (user_id, book_id, rating) VALUES (?, ?, ?)",
+        ((user_ids[u], book_ids[b], float(s))
+         for (u, b), s in zip(pairs.tolist(), scores.tolist())))
+    conn.commit()
+    conn.close()
+
+
+def build_model_artifact(db_path, out_dir, embed_dim=100, seed=0):
+    """Random-weight STAMP artifact whose registry is the seeded catalog."""
+    import torch
+    sys.path.insert(0, MODEL_DIR)
+    from artifact import save_artifact
+    from item_registry import ItemRegistry
+    from stamp_model import STAMP
+
+    conn = sqlite3.connect(db_path)
+    isbns = [r[0] for r in conn.execute("SELECT book_isbn FROM backend_app_book ORDER BY id")]
+    conn.close()
+    torch.manual_seed(seed)
+    model = STAMP(num_items=len(isbns) + 1, embed_dim=embed_dim)
+    save_artifact(out_dir, model.state_dict(), ItemRegistry(isbns),
+                  metadata={"source": "bench_api synthetic"})
+
+
+def prepare(args):
+    """
+    Seed the work dir (or reuse its seeded copy) and start every run from a
+    pristine database, session store and journal. Returns (work dir, catalog).
+    """
+    work = os.path.abspath(args.work_dir)
+    os.makedirs(work, exist_ok=True)
+    db_path = os.path.join(work, "db.sqlite3")
+    seed_path = os.path.join(work, "db.seed.sqlite3")
+    meta_path = os.path.join(work, "catalog.json")
+    catalog = {"books": int(FULL_BOOKS * args.scale), "users": int(FULL_USERS * args.scale),
+               "ratings": int(FULL_RATINGS * args.scale), "seed": args.seed,
+               "migrations": sorted(f for f in os.listdir(MIGRATIONS_DIR) if f[:4].isdigit())}
+
+    with open(os.path.join(work, "bench_settings.py"), "w") as f:
+        f.write(SETTINGS_TEMPLATE.format(
+            db=db_path, sessions=os.path.join(work, "ml_sessions.sqlite3"),
+            journal=os.path.join(work, "interaction_journal"),
+            trigger=os.path.join(work, "ml_reload.json"),
+            cache_ttl=300.0 if args.cache else 0.0))
+
+    for name in ("db.sqlite3", "db.sqlite3-wal", "db.sqlite3-shm",
+                 "ml_sessions.sqlite3", "ml_sessions.sqlite3-wal", "ml_sessions.sqlite3-shm"):
+        if os.path.exists(os.path.join(work, name)):
+            os.remove(os.path.join(work, name))
+    shutil.rmtree(os.path.join(work, "interaction_journal"), ignore_errors=True)
+
+    existing = None
+    if os.path.exists(meta_path) and os.path.exists(seed_path):
+        with open(meta_path) as f:
+            existing = json.load(f)
+    if existing != catalog or args.reseed:
+        env = dict(os.environ, PYTHONPATH=work, DJANGO_SETTINGS_MODULE="bench_settings")
+        subprocess.run([sys.executable, "manage.py", "migrate", "-v0"], cwd=BACKEND_DIR,
+                       env=env, check=True)
+        t0 = time.perf_counter()
+        seed_database(db_path, catalog["books"], catalog["users"], catalog["ratings"], args.seed)
+        print(f"🌱 Seeded {catalog['books']} books, {catalog['users']} users, "
+              f"{catalog['ratings']} ratings in {time.perf_counter() - t0:.1f}s")
+        build_model_artifact(db_path, os.path.join(work, "stamp"), seed=args.seed)
+        shutil.copyfile(db_path, seed_path)
+        with open(meta_path, "w") as f:
+            json.dump(catalog, f)
+    else:
+        shutil.copyfile(seed_path, db_path)
+    return work, catalog
+
+
+# --------------------------------------------------------
+# Request drivers
+# --------------------------------------------------------
+class InProcessClient:
+    """Django test client per thread (the test client is not thread-safe)."""
+
+    def __init__(self, token):
+        self.token = token
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            from django.test import Client
+            client = self._local.client = Client(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        return client
+
+    def get(self, path):
+        return self._client().get(path).status_code
+
+    def post(self, path, body):
+        return self._client().post(path, data=json.dumps(body),
+                                   content_type="application/json").status_code
+
+
+class HttpClient:
+    def __init__(self, base_url, token):
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+    def _send(self, request):
+        try:
+            with urllib.request.urlopen(request, timeout=30) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def get(self, path):
+        return self._send(urllib.request.Request(self.base_url + path, headers=self.headers))
+
+    def post(self, path, body):
+        return self._send(urllib.request.Request(self.base_url + path, data=json.dumps(body).encode(),
+                                                 headers=self.headers, method="POST"))
+
+
+def make_scenarios(client, catalog, seed):
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def pick(fn):
+        with lock:
+            return fn(rng)
+
+    n_users, n_books = catalog["users"], catalog["books"]
+
+    def recommend():
+        user = pick(lambda r: r.randrange(n_users))
+        return client.get(f"/api/model/recommend/U{user}/?top_k=10")
+
+    def record():
+        user, book, implicit, score = pick(lambda r: (r.randrange(n_users), r.randrange(n_books),
+                                                      r.random() < 0.75, r.randint(1, 10)))
+        body = {"user_id": f"U{user}", "book_isbn": f"B{book:09d}"}
+        body.update({"implicit": True} if implicit else {"rating": score})
+        return client.post("/api/model/record/", body)
+
+    def search():
+        words = pick(lambda r: r.sample(VOCABULARY, r.randint(1, 3)))
+        return client.get(f"/api/books/search/{'%20'.join(words)}/?limit=50")
+
+    def bulk():
+        isbns = pick(lambda r: [f"B{r.randrange(n_books):09d}" for _ in range(20)])
+        return client.post("/api/books/bulk/", {"isbns": isbns})
+
+    return {"recommend": recommend, "record": record, "search": search, "bulk": bulk}
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return None
+
+
+def run_scenario(fn, n_requests, concurrency, warmup):
+    for _ in range(warmup):
+        fn()
+    latencies = np.empty(n_requests)
+    statuses = [0] * n_requests
+
+    def one(i):
+        t0 = time.perf_counter()
+        statuses[i] = fn()
+        latencies[i] = time.perf_counter() - t0
+
+    rss_before = _rss_mb()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(n_requests)))
+    elapsed = time.perf_counter() - t0
+    ms = latencies * 1000
+    errors = sum(1 for s in statuses if not 200 <= s < 300)
+    return {
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": n_requests / elapsed,
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+        "rss_mb": _rss_mb(),
+        "rss_delta_mb": (_rss_mb() - rss_before) if rss_before is not None else None,
+    }
+
+
+# --------------------------------------------------------
+# Reporting
+# --------------------------------------------------------
+def git_revision():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return rev + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_table(results, baseline=None):
+    print(f"{'scenario':10s} {'conc':>4s} {'rps':>9s} {'p50 ms':>8s} {'p95 ms':>8s} "
+          f"{'p99 ms':>8s} {'errors':>6s}" + ("  p95 vs baseline" if baseline else ""))
+    for name, runs in results.items():
+        for conc, r in runs.items():
+            line = (f"{name:10s} {r['concurrency']:4d} {r['throughput_rps']:9.1f} {r['p50_ms']:8.2f} "
+                    f"{r['p95_ms']:8.2f} {r['p99_ms']:8.2f} {r['errors']:6d}")
+            old = (baseline or {}).get(name, {}).get(conc)
+            if old:
+                line += f"  {(r['p95_ms'] / old['p95_ms'] - 1) * 100:+6.1f}%"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0, help="fraction of Book-Crossing size")
+    parser.add_argument("--requests", type=int, default=2000, help="per scenario and concurrency")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--scenarios", nargs="+", default=["recommend", "record", "search", "bulk"])
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--no-cache", dest="cache", action="store_false",
+                        help="disable the recommendation result cache (in-process mode)")
+    parser.add_argument("--url", default=None, help="benchmark a running server instead")
+    parser.add_argument("--token", default=None, help="JWT access token for --url")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "bench_api"),
+                        help="seeded database and model, reused while --scale/--seed match")
+    parser.add_argument("--reseed", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="result JSON (default benchmarks/results/)")
+    parser.add_argument("--compare", default=None, help="baseline result JSON to diff against")
+    args = parser.parse_args()
+
+    work, catalog = prepare(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    if args.url:
+        if not args.token:
+            parser.error("--url needs --token")
+        client = HttpClient(args.url, args.token)
+        startup = None
+    else:
+        sys.path.insert(0, work)
+        sys.path.insert(0, BACKEND_DIR)
+        os.environ["DJANGO_SETTINGS_MODULE"] = "bench_settings"
+        os.environ["ML_PRELOAD"] = "0"
+        import django
+        django.setup()
+        from backend_app import ml
+        from backend_app.models import RegisteredUser
+        from backend_app.utils_auth import generate_tokens_for_registered_user
+
+        # Serve the synthetic model: wait out the repo model's auto-load, then swap ours in
+        t0 = time.perf_counter()
+        ml.preload()
+        ml.wait_model_ready(300)
+        utils = ml._ml()
+        utils.load_model(os.path.join(work, "stamp"), utils._stamp_class())
+        utils.candidate_index.ensure_built()
+        startup = {"model_and_index_s": time.perf_counter() - t0, "rss_mb": _rss_mb()}
+
+        admin, _ = RegisteredUser.objects.get_or_create(
+            username="bench", defaults={"email": "bench@example.com", "password": "!", "is_admin": True})
+        client = InProcessClient(generate_tokens_for_registered_user(admin)["access"])
+
+    scenarios = make_scenarios(client, catalog, args.seed)
+    results = {}
+    for name in args.scenarios:
+        results[name] = {}
+        for conc in args.concurrency:
+            r = run_scenario(scenarios[name], args.requests, conc, args.warmup)
+            results[name][str(conc)] = r
+            print(f"✅ {name} @ {conc}: p50 {r['p50_ms']:.2f} ms, p95 {r['p95_ms']:.2f} ms, "
+                  f"p99 {r['p99_ms']:.2f} ms, {r['throughput_rps']:.0f} req/s, {r['errors']} errors")
+
+    extra = {}
+    if not args.url:
+        t0 = time.perf_counter()
+        flushed = ml.flush_interactions()
+        extra["interaction_flush"] = {"events": flushed, "ms": (time.perf_counter() - t0) * 1000}
+        extra["recommend_cache"] = ml.get_recommend_cache_stats()
+
+    print()
+    print_table(results, baseline)
+    report = {
+        "revision": git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "mode": "http" if args.url else "in-process",
+        "catalog": catalog,
+        "config": {k: getattr(args, k) for k in ("requests", "concurrency", "warmup", "cache", "url")},
+        "python": sys.version.split()[0],
+        "cpu_count": os.cpu_count(),
+        "startup": startup,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "results": results,
+        **extra,
+    }
+    out = args.out or os.path.join(ROOT, "benchmarks", "results", f"bench_api-{report['revision']}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"\n📄 Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Micro-benchmark: collate_fn vs SessionCollator (and length bucketing).
+
+    python benchmarks/bench_collate.py --sessions 20000 --batch-size 512
+
+Sessions get a long-tailed length distribution similar to Book-Crossing
+(most users rate a handful of books, a few rate thousands).
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../model")))
+from stamp_model import SessionDataset, SessionCollator, LengthBucketBatchSampler, collate_fn  # noqa: E402
+
+
+def make_sessions(n_sessions, num_items, seed=0):
+    rng = np.random.default_rng(seed)
+    lengths = np.minimum(2 + rng.zipf(1.6, size=n_sessions), 3000)
+    return [rng.integers(1, num_items, size=n).tolist() for n in lengths]
+
+
+def time_batches(fn, batches, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for b in batches:
+            fn(b)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(batches) * 1e6
+
+
+def padding_waste(dataset, index_batches, max_seq_len):
+    lengths = np.minimum(np.asarray(dataset.pair_t), max_seq_len)
+    real = padded = 0
+    for idx in index_batches:
+        l = lengths[idx]
+        real += l.sum()
+        padded += l.max() * len(idx)
+    return 1.0 - real / padded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20000)
+    parser.add_argument("--num-items", type=int, default=270000)
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--max-seq-len", type=int, default=50)
+    parser.add_argument("--batches", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    sessions = make_sessions(args.sessions, args.num_items)
+    dataset = SessionDataset(sessions)
+    print(f"{len(sessions)} sessions → {len(dataset)} pairs")
+
+    rng = np.random.default_rng(1)
+    random_idx = [rng.choice(len(dataset), args.batch_size, replace=False)
+                  for _ in range(args.batches)]
+    sampler = LengthBucketBatchSampler(dataset, args.batch_size, max_seq_len=args.max_seq_len)
+    bucket_idx = [np.asarray(b) for _, b in zip(range(args.batches), iter(sampler))]
+
+    # The legacy path received Python lists; the new one receives array views.
+    legacy_batches = [[(dataset[i][0].tolist(), dataset[i][1]) for i in b] for b in random_idx]
+    view_batches = [[dataset[i] for i in b] for b in random_idx]
+    bucket_batches = [[dataset[i] for i in b] for b in bucket_idx]
+
+    collator = SessionCollator(pad_idx=0, max_seq_len=args.max_seq_len)
+    legacy = lambda b: collate_fn(b, pad_idx=0, max_seq_len=args.max_seq_len)
+
+    # Both paths must produce identical tensors
+    for a, b in zip(map(legacy, legacy_batches[:5]), map(collator, view_batches[:5])):
+        assert all((x == y).all() for x, y in zip(a, b))
+
+    t_legacy = time_batches(legacy, legacy_batches, args.repeat)
+    t_new = time_batches(collator, view_batches, args.repeat)
+    t_bucket = time_batches(collator, bucket_batches, args.repeat)
+
+    print(f"collate_fn            : {t_legacy:9.1f} µs/batch")
+    print(f"SessionCollator       : {t_new:9.1f} µs/batch  ({t_legacy / t_new:.1f}x)")
+    print(f"SessionCollator+bucket: {t_bucket:9.1f} µs/batch  ({t_legacy / t_bucket:.1f}x)")
+    print(f"padding waste random  : {padding_waste(dataset, random_idx, args.max_seq_len):.1%}")
+    print(f"padding waste bucketed: {padding_waste(dataset, bucket_idx, args.max_seq_len):.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Import-time benchmark: Django boot with and without the ML stack.
+
+    python benchmarks/bench_import_time.py --repeat 3
+
+Each scenario runs in a fresh interpreter under `python -X importtime`:
+
+- lazy : django.setup() + URLconf/views import (what auth-only workers and
+         management commands pay); torch must not be imported
+- eager: the same plus backend_app.ml.preload() (what serving workers pay,
+         and what every process paid when views imported model/utils.py)
+
+Reports wall time, summed import time, peak RSS and the heaviest imports.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../backend"))
+
+CHILD = r"""
+import json, resource, sys, time
+t0 = time.perf_counter()
+import django
+django.setup()
+import backend.urls  # noqa: F401  (imports every view module)
+if {eager}:
+    from backend_app import ml
+    ml.preload()
+elapsed = time.perf_counter() - t0
+print("BENCH " + json.dumps({{
+    "wall_ms": elapsed * 1000,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "torch_imported": "torch" in sys.modules,
+}}), flush=True)
+"""
+
+_LINE_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def run_scenario(eager, env):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD.format(eager=eager)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    # The model loader thread prints too (possibly on the same line)
+    start = proc.stdout.index("BENCH ") + len("BENCH ")
+    result, _ = json.JSONDecoder().raw_decode(proc.stdout[start:])
+    top_level = []
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        # Indentation 1 = imported directly by the script, cumulative includes children
+        if m and len(m.group(3)) == 1:
+            top_level.append((int(m.group(2)), m.group(4)))
+    result["import_ms"] = sum(us for us, _ in top_level) / 1000
+    result["heaviest"] = sorted(top_level, reverse=True)[:5]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--settings", default=os.environ.get("DJANGO_SETTINGS_MODULE", "backend.settings"))
+    args = parser.parse_args()
+
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=args.settings, ML_PRELOAD="0")
+    results = {}
+    for name, eager in (("lazy", False), ("eager", True)):
+        runs = [run_scenario(eager, env) for _ in range(args.repeat)]
+        best = min(runs, key=lambda r: r["wall_ms"])
+        results[name] = best
+        print(f"{name:5s}: wall {best['wall_ms']:8.1f} ms | imports {best['import_ms']:8.1f} ms | "
+              f"peak RSS {best['max_rss_mb']:7.1f} MB | torch imported: {best['torch_imported']}")
+        for us, module in best["heaviest"]:
+            print(f"         {us / 1000:8.1f} ms  {module}")
+
+    lazy, eager = results["lazy"], results["eager"]
+    assert not lazy["torch_imported"], "lazy boot imported torch"
+    print(f"lazy boot: {lazy['wall_ms'] / eager['wall_ms']:.0%} of the time, "
+          f"{lazy['max_rss_mb'] / eager['max_rss_mb']:.0%} of the memory of the eager boot")
+
+
+if __name__ == "__main__":
+    main()
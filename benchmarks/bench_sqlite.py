@@ -0,0 +1,210 @@
+"""
+Benchmark: SQLite write/read throughput with Django's defaults vs the tuned setup.
+
+    python benchmarks/bench_sqlite.py
+    python benchmarks/bench_sqlite.py --workers 8 --readers 2 --seconds 10
+
+Several processes (like gunicorn workers) hammer one database file at the
+same time:
+
+- writers run the interaction write of model/utils.py: a transaction that
+  looks up the user and book ids, then upserts the Rating
+- readers run the recommendation reads: the user's latest rated books
+  (the session fallback) and a 20-book bulk fetch
+
+Configurations:
+
+- default: what settings.py had before backend_app/db_tuning.py: rollback
+  journal, synchronous=FULL, deferred transactions, Python's 5 s busy
+  timeout and a new connection per request (CONN_MAX_AGE=0)
+- tuned: db_tuning.DEFAULT_PRAGMAS (WAL, synchronous=NORMAL, ...), BEGIN
+  IMMEDIATE for writes, query_only reader connections, connections reused
+
+Each run starts from the same seeded database. Prints operations/s, "database
+is locked" errors and p50/p99 latency per role.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+from backend_app.db_tuning import DEFAULT_PRAGMAS, apply_pragmas  # noqa: E402
+
+CONFIGS = {
+    "default": {"pragmas": {}, "begin": "BEGIN", "persistent": False, "timeout": 5.0},
+    "tuned": {"pragmas": DEFAULT_PRAGMAS, "begin": "BEGIN IMMEDIATE", "persistent": True,
+              "timeout": 5.0},
+}
+
+SCHEMA = [
+    "CREATE TABLE backend_app_user (id INTEGER PRIMARY KEY, user_id TEXT UNIQUE NOT NULL)",
+    "CREATE TABLE backend_app_book (id INTEGER PRIMARY KEY, book_isbn TEXT UNIQUE NOT NULL,"
+    " book_title TEXT, book_author TEXT, publisher TEXT)",
+    "CREATE TABLE backend_app_rating (id INTEGER PRIMARY KEY, rating REAL NOT NULL,"
+    " user_id INTEGER NOT NULL, book_id INTEGER NOT NULL, UNIQUE (user_id, book_id))",
+    "CREATE INDEX rating_user_recent_idx ON backend_app_rating (user_id, id, book_id)",
+]
+
+UPSERT = ("INSERT INTO backend_app_rating (rating, user_id, book_id) VALUES (?, ?, ?)"
+          " ON CONFLICT (user_id, book_id) DO UPDATE SET rating = excluded.rating")
+RECENT = ("SELECT b.book_isbn FROM backend_app_rating r"
+          " JOIN backend_app_user u ON u.id = r.user_id"
+          " JOIN backend_app_book b ON b.id = r.book_id"
+          " WHERE u.user_id = ? ORDER BY r.id DESC LIMIT 5")
+BULK = "SELECT * FROM backend_app_book WHERE book_isbn IN ({})".format(", ".join("?" * 20))
+
+
+def seed(path, n_users, n_books, n_ratings, seed=0):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    for sql in SCHEMA:
+        conn.execute(sql)
+    conn.executemany("INSERT INTO backend_app_user (user_id) VALUES (?)",
+                     ((f"u{i}",) for i in range(n_users)))
+    conn.executemany(
+        "INSERT INTO backend_app_book (book_isbn, book_title, book_author, publisher)"
+        " VALUES (?, ?, ?, ?)",
+        ((f"b{i:09d}", f"Title {i}", f"Author {i % 5000}", "Publisher") for i in range(n_books)))
+    conn.executemany(
+        "INSERT OR IGNORE INTO backend_app_rating (rating, user_id, book_id) VALUES (?, ?, ?)",
+        ((rng.randint(1, 10), rng.randint(1, n_users), rng.randint(1, n_books))
+         for _ in range(n_ratings)))
+    conn.commit()
+    conn.close()
+
+
+# --------------------------------------------------------
+# Worker processes
+# --------------------------------------------------------
+def _connect(path, config, read_only):
+    conn = sqlite3.connect(path, timeout=config["timeout"], isolation_level=None)
+    pragmas = dict(config["pragmas"])
+    if pragmas and read_only:
+        pragmas["query_only"] = "ON"
+    apply_pragmas(conn, pragmas)
+    return conn
+
+
+def _write(conn, config, rng, n_users, n_books):
+    conn.execute(config["begin"])
+    try:
+        user = conn.execute("SELECT id FROM backend_app_user WHERE user_id = ?",
+                            (f"u{rng.randrange(n_users)}",)).fetchone()[0]
+        book = conn.execute("SELECT id FROM backend_app_book WHERE book_isbn = ?",
+                            (f"b{rng.randrange(n_books):09d}",)).fetchone()[0]
+        conn.execute(UPSERT, (rng.randint(1, 10), user, book))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _read(conn, config, rng, n_users, n_books):
+    conn.execute(RECENT, (f"u{rng.randrange(n_users)}",)).fetchall()
+    conn.execute(BULK, [f"b{rng.randrange(n_books):09d}" for _ in range(20)]).fetchall()
+
+
+def worker(path, config, role, seconds, n_users, n_books, seed, start_at, results):
+    rng = random.Random(seed)
+    op = _write if role == "write" else _read
+    conn = _connect(path, config, role == "read") if config["persistent"] else None
+    latencies, errors = [], 0
+    while time.time() < start_at:
+        time.sleep(0.001)
+    deadline = start_at + seconds
+    while time.time() < deadline:
+        t0 = time.perf_counter()
+        c = conn or _connect(path, config, role == "read")
+        try:
+            op(c, config, rng, n_users, n_books)
+            latencies.append(time.perf_counter() - t0)
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) and "busy" not in str(e):
+                raise
+            errors += 1
+        finally:
+            if conn is None:
+                c.close()
+    results.put((role, latencies, errors))
+
+
+def run(path, config, args):
+    results = mp.Queue()
+    start_at = time.time() + 1.0                # every process starts together
+    procs = [mp.Process(target=worker, args=(path, config, role, args.seconds, args.users,
+                                             args.books, args.seed + i, start_at, results))
+             for i, role in enumerate(["write"] * args.workers + ["read"] * args.readers)]
+    for p in procs:
+        p.start()
+    collected = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    summary = {}
+    for role in ("write", "read"):
+        lat = [x for r, l, _ in collected if r == role for x in l]
+        errors = sum(e for r, _, e in collected if r == role)
+        ms = np.asarray(lat or [float("nan")]) * 1000
+        summary[role] = {
+            "ops": len(lat), "ops_per_s": len(lat) / args.seconds, "errors": errors,
+            "p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99)),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4, help="writer processes")
+    parser.add_argument("--readers", type=int, default=4, help="reader processes")
+    parser.add_argument("--seconds", type=float, default=5.0, help="per configuration")
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--books", type=int, default=50_000)
+    parser.add_argument("--ratings", type=int, default=200_000)
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "bench_sqlite"))
+    parser.add_argument("--out", default=None, help="also write the results as JSON")
+    args = parser.parse_args()
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    seed_path = os.path.join(args.work_dir, "seed.sqlite3")
+    if os.path.exists(seed_path):
+        os.remove(seed_path)
+    seed(seed_path, args.users, args.books, args.ratings, args.seed)
+
+    results = {}
+    for name in args.configs:
+        path = os.path.join(args.work_dir, f"{name}.sqlite3")
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        shutil.copyfile(seed_path, path)
+        results[name] = run(path, CONFIGS[name], args)
+        w, r = results[name]["write"], results[name]["read"]
+        print(f"✅ {name}: {w['ops_per_s']:.0f} writes/s ({w['errors']} locked), "
+              f"{r['ops_per_s']:.0f} reads/s ({r['errors']} locked)")
+
+    print()
+    print(f"{'config':8s} {'role':5s} {'ops/s':>9s} {'p50 ms':>8s} {'p99 ms':>8s} {'locked':>7s}")
+    for name, summary in results.items():
+        for role, s in summary.items():
+            print(f"{name:8s} {role:5s} {s['ops_per_s']:9.0f} {s['p50_ms']:8.2f} "
+                  f"{s['p99_ms']:8.2f} {s['errors']:7d}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
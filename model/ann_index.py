@@ -0,0 +1,246 @@
+# ann_index.py
+import math
+import time
+import torch
+
+try:
+    from model.stamp_model import chunked_topk
+except ModuleNotFoundError:
+    from stamp_model import chunked_topk
+
+
+# ---------------------------
+# IVF (inverted file) index for maximum inner product search
+# ---------------------------
+class IVFIndex:
+    """
+    Approximate top-N retrieval over STAMP item embeddings.
+
+    Items are clustered with k-means into `n_lists` inverted lists. A query
+    (the session representation `h`) is compared to the centroids, and only
+    the items in the `n_probe` best lists are scored exactly. Raising
+    `n_probe` trades latency for recall; `recall()` measures it against the
+    full dense score so the two can be tuned together.
+
+    The lists hold item ids only; vectors are read through `lookup`
+    (ids -> (n, D), e.g. STAMP.embed_items), so the index never copies the
+    embedding table. Built once with the artifact (state_dict / load), it
+    opens without re-clustering.
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, n_iter=10, max_train_points=50_000, seed=42):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.max_train_points = max_train_points
+        self.seed = seed
+
+        self.lookup = None      # item ids -> (n, D) vectors
+        self.centroids = None   # (n_lists, D)
+        self._ids = None        # (N,) item ids grouped by list
+        self._offsets = None    # (n_lists + 1,) list boundaries in _ids
+        self._extra_ids = None  # items added since build(), scanned exactly
+
+    def __len__(self):
+        n = 0 if self._ids is None else self._ids.numel()
+        return n + (0 if self._extra_ids is None else self._extra_ids.numel())
+
+    # ---------------------------
+    # Build
+    # ---------------------------
+    @torch.no_grad()
+    def build(self, embeddings, exclude_ids=(0,), lookup=None):
+        """
+        Cluster `embeddings` (num_items, D); rows in `exclude_ids` (padding) are
+        not indexed. Searches read vectors through `lookup` (default: rows of
+        `embeddings`). Only the k-means sample is copied, never the table.
+        """
+        t0 = time.perf_counter()
+        embeddings = embeddings.detach()
+        keep = torch.ones(embeddings.size(0), dtype=torch.bool, device=embeddings.device)
+        for i in exclude_ids:
+            if 0 <= i < embeddings.size(0):
+                keep[i] = False
+        ids = keep.nonzero(as_tuple=True)[0]
+        n = ids.numel()
+        if n == 0:
+            raise ValueError("IVFIndex.build: no vectors to index")
+
+        n_lists = self.n_lists or max(1, int(2 * math.sqrt(n)))
+        n_lists = min(n_lists, n)
+
+        generator = torch.Generator(device="cpu").manual_seed(self.seed)
+        centroids = self._kmeans(embeddings, ids, n_lists, generator)
+        assign = torch.cat([
+            self._assign(embeddings[ids[start:start + 65536]].float(), centroids)
+            for start in range(0, n, 65536)
+        ])
+
+        order = torch.argsort(assign, stable=True)
+        counts = torch.bincount(assign, minlength=n_lists)
+        offsets = torch.zeros(n_lists + 1, dtype=torch.long, device=ids.device)
+        offsets[1:] = torch.cumsum(counts, dim=0)
+
+        self.n_lists = n_lists
+        self.centroids = centroids
+        self._ids = ids[order].contiguous()
+        self._offsets = offsets
+        self._extra_ids = None
+        self.lookup = lookup or (lambda item_ids: embeddings[item_ids])
+
+        print(f"🧭 IVF index built → {n} items, {n_lists} lists "
+              f"in {time.perf_counter() - t0:.2f}s")
+        return self
+
+    def _kmeans(self, embeddings, ids, n_lists, generator):
+        n = ids.numel()
+        n_train = min(n, max(n_lists, self.max_train_points))
+        sample = torch.randperm(n, generator=generator)[:n_train].to(ids.device)
+        train = embeddings[ids[sample]].float()
+        centroids = train[torch.randperm(n_train, generator=generator)[:n_lists].to(ids.device)].clone()
+
+        for _ in range(self.n_iter):
+            assign = self._assign(train, centroids)
+            sums = torch.zeros_like(centroids).index_add_(0, assign, train)
+            counts = torch.bincount(assign, minlength=n_lists).unsqueeze(1)
+            empty = counts.squeeze(1) == 0
+            centroids = torch.where(empty.unsqueeze(1), centroids, sums / counts.clamp(min=1))
+        return centroids
+
+    @staticmethod
+    def _assign(vectors, centroids, chunk_size=65536):
+        """Nearest centroid (by inner product) for each vector, in bounded-memory chunks."""
+        out = torch.empty(vectors.size(0), dtype=torch.long, device=vectors.device)
+        for start in range(0, vectors.size(0), chunk_size):
+            block = vectors[start:start + chunk_size]
+            out[start:start + chunk_size] = (block @ centroids.T).argmax(dim=1)
+        return out
+
+    @torch.no_grad()
+    def add(self, ids):
+        """
+        Index new items (their vectors must be reachable through `lookup`)
+        without re-clustering. They are kept in a small side list that every
+        search scans exactly, until the next build().
+        """
+        if self.centroids is None:
+            raise ValueError("IVFIndex.add called before build()")
+        ids = torch.as_tensor(ids, dtype=torch.long, device=self._ids.device).reshape(-1)
+        if self._extra_ids is None:
+            self._extra_ids = ids
+        else:
+            self._extra_ids = torch.cat([self._extra_ids, ids])
+
+    # ---------------------------
+    # Persistence
+    # ---------------------------
+    def state_dict(self):
+        """Centroids and lists (ids only) as tensors, for torch.save."""
+        if self.centroids is None:
+            raise ValueError("IVFIndex.state_dict called before build()")
+        return {"centroids": self.centroids.cpu(), "ids": self._ids.cpu(),
+                "offsets": self._offsets.cpu()}
+
+    @classmethod
+    def from_state_dict(cls, state, lookup, n_probe=8, device="cpu"):
+        index = cls(n_lists=state["centroids"].size(0), n_probe=n_probe)
+        index.centroids = state["centroids"].float().to(device)
+        index._ids = state["ids"].long().to(device)
+        index._offsets = state["offsets"].long().to(device)
+        index.lookup = lookup
+        return index
+
+    @classmethod
+    def load(cls, path, lookup, n_probe=8, device="cpu"):
+        state = torch.load(path, map_location="cpu", weights_only=True)
+        return cls.from_state_dict(state, lookup, n_probe=n_probe, device=device)
+
+    # ---------------------------
+    # Search
+    # ---------------------------
+    @torch.no_grad()
+    def search(self, queries, k=100, n_probe=None, exclude=None):
+        """
+        Approximate top-k item ids by inner product for each query row.
+
+        queries : (B, D) tensor of session representations
+        exclude : optional iterable of item ids to skip (e.g. the session itself)
+        Returns (scores, ids), both (B, k); missing slots are -inf / -1.
+        """
+        if self.centroids is None:
+            raise ValueError("IVFIndex.search called before build()")
+        queries = queries.detach().float().to(self.centroids.device)
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        B = queries.size(0)
+
+        out_scores = torch.full((B, k), float("-inf"), device=queries.device)
+        out_ids = torch.full((B, k), -1, dtype=torch.long, device=queries.device)
+        exclude_t = None
+        if exclude is not None:
+            exclude_t = torch.as_tensor(list(exclude), dtype=torch.long, device=queries.device)
+
+        probes = torch.topk(queries @ self.centroids.T, n_probe, dim=1).indices
+        starts = self._offsets[probes].tolist()
+        ends = self._offsets[probes + 1].tolist()
+        for b in range(B):
+            ids = torch.cat([self._ids[s:e] for s, e in zip(starts[b], ends[b]) if e > s]
+                            or [torch.empty(0, dtype=torch.long, device=queries.device)])
+            scores = self.lookup(ids).float().to(queries.device) @ queries[b]
+            if self._extra_ids is not None:
+                # Looked up apart, so each lookup is all trained or all added rows
+                ids = torch.cat([ids, self._extra_ids])
+                scores = torch.cat([
+                    scores, self.lookup(self._extra_ids).float().to(queries.device) @ queries[b]])
+            if ids.numel() == 0:
+                continue
+            if exclude_t is not None and exclude_t.numel():
+                scores = scores.masked_fill(torch.isin(ids, exclude_t), float("-inf"))
+            top = torch.topk(scores, min(k, scores.numel()))
+            n = top.values.numel()
+            out_scores[b, :n] = top.values
+            out_ids[b, :n] = ids[top.indices]
+        return out_scores, out_ids
+
+    @torch.no_grad()
+    def exact_search(self, queries, k=100):
+        """Exact top-k over all indexed items (the dense baseline for `recall`)."""
+        queries = queries.detach().float().to(self.centroids.device)
+        ids = self._ids
+        if self._extra_ids is not None:
+            ids = torch.cat([ids, self._extra_ids])
+        scores, rows = chunked_topk(queries, self.lookup(ids).float(), k, pad_idx=-1)
+        return scores, torch.where(rows >= 0, ids[rows.clamp(min=0)], -1)
+
+    # ---------------------------
+    # Quality / tuning
+    # ---------------------------
+    @torch.no_grad()
+    def recall(self, queries, k=100, n_probe=None):
+        """Mean fraction of the exact top-k ids that the IVF search also returns."""
+        _, approx = self.search(queries, k=k, n_probe=n_probe)
+        _, exact = self.exact_search(queries, k=k)
+        hits = sum(
+            torch.isin(exact[b], approx[b]).sum().item() for b in range(queries.size(0))
+        )
+        return hits / exact.numel() if exact.numel() else 0.0
+
+    @torch.no_grad()
+    def tune(self, queries, k=100, target_recall=0.95, max_probe=None):
+        """
+        Smallest n_probe reaching `target_recall` on `queries`; sets and returns it
+        together with a {n_probe: (recall, ms_per_query)} report.
+        """
+        max_probe = min(max_probe or self.n_lists, self.n_lists)
+        report = {}
+        n_probe = 1
+        while True:
+            t0 = time.perf_counter()
+            self.search(queries, k=k, n_probe=n_probe)
+            ms = (time.perf_counter() - t0) * 1000 / max(1, queries.size(0))
+            rec = self.recall(queries, k=k, n_probe=n_probe)
+            report[n_probe] = (rec, ms)
+            if rec >= target_recall or n_probe >= max_probe:
+                break
+            n_probe = min(n_probe * 2, max_probe)
+        self.n_probe = n_probe
+        return n_probe, report
@@ -0,0 +1,202 @@
+# artifact.py
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+try:
+    from model.ann_index import IVFIndex
+    from model.item_registry import ItemRegistry, registry_path_for
+except ModuleNotFoundError:
+    from ann_index import IVFIndex
+    from item_registry import ItemRegistry, registry_path_for
+
+
+# ---------------------------
+# Directory-based STAMP artifact
+# ---------------------------
+# stamp/
+#   manifest.json   format version, shapes, dtype, id-mapping hash, training metadata
+#   embeddings.bin  raw item embedding matrix (num_items, embed_dim), C order
+#   dense.pt        every other parameter (a few hundred KB)
+#   ivf.pt          IVF centroids and item-id lists (ann_index.py), built at save time
+#   items.txt       item registry (see item_registry.py), appended to by serving
+#
+# embeddings.bin starts at offset 0, so it is page aligned and np.memmap
+# can map it directly: workers share one copy through the page cache and
+# loading does not depend on catalog size. The IVF lists hold ids, not
+# vectors, so opening the index copies nothing either.
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+EMBEDDINGS = "embeddings.bin"
+DENSE = "dense.pt"
+IVF = "ivf.pt"
+ITEMS = "items.txt"
+EMBEDDING_KEY = "item_embedding.weight"
+
+
+def is_artifact(path):
+    return os.path.isfile(os.path.join(str(path), MANIFEST))
+
+
+def registry_digest(path, num_ids=None):
+    """sha256 of the first `num_ids` registry lines (all when None) and the count hashed."""
+    digest = hashlib.sha256()
+    count = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if num_ids is not None and count >= num_ids:
+                break
+            digest.update(line)
+            count += 1
+    return digest.hexdigest(), count
+
+
+def save_artifact(out_dir, state_dict, registry, pad_idx=0, metadata=None):
+    """
+    Write `state_dict` (a STAMP state dict) and its `registry` as an artifact
+    directory. The directory is replaced atomically-by-rename, so a loader
+    never sees a half-written artifact.
+    """
+    out_dir = os.path.abspath(str(out_dir))
+    tmp_dir = f"{out_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    emb = state_dict[EMBEDDING_KEY].detach().cpu().float().contiguous().numpy()
+    num_items, embed_dim = emb.shape
+    emb.tofile(os.path.join(tmp_dir, EMBEDDINGS))
+    dense = {k: v.detach().cpu() for k, v in state_dict.items() if k != EMBEDDING_KEY}
+    torch.save(dense, os.path.join(tmp_dir, DENSE))
+    ivf = IVFIndex().build(torch.from_numpy(emb), exclude_ids=(pad_idx,))
+    torch.save(ivf.state_dict(), os.path.join(tmp_dir, IVF))
+
+    # A copy, so the caller's registry keeps appending to its own file
+    items = ItemRegistry([registry.isbn(i) for i in range(1, registry.num_items)])
+    items_path = items.save(os.path.join(tmp_dir, ITEMS))
+    items_hash, items_count = registry_digest(items_path)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "version": hashlib.sha256(emb.tobytes()).hexdigest()[:16],
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "num_items": int(num_items),
+        "embed_dim": int(embed_dim),
+        "pad_idx": pad_idx,
+        "dtype": "float32",
+        "embeddings": EMBEDDINGS,
+        "dense": DENSE,
+        "ivf": IVF,
+        "items": ITEMS,
+        "items_count": items_count,
+        "items_sha256": items_hash,
+        "metadata": metadata or {},
+    }
+    with open(os.path.join(tmp_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    old_dir = f"{out_dir}.old-{os.getpid()}"
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return manifest
+
+
+def read_manifest(path):
+    with open(os.path.join(str(path), MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format {manifest.get('format_version')!r} at {path}")
+    return manifest
+
+
+def load_artifact(path, model_class, device="cpu", verify_items=True):
+    """
+    Open an artifact directory. The embedding table is memory-mapped
+    copy-on-write (pages stay shared until a row is modified) and is not
+    copied on CPU. Returns (model, manifest).
+    """
+    path = str(path)
+    manifest = read_manifest(path)
+    num_items, embed_dim = manifest["num_items"], manifest["embed_dim"]
+
+    if verify_items:
+        items_path = os.path.join(path, manifest["items"])
+        digest, count = registry_digest(items_path, manifest["items_count"])
+        if digest != manifest["items_sha256"] or count != manifest["items_count"]:
+            raise ValueError(f"Item registry {items_path} does not match the artifact manifest")
+
+    emb = np.memmap(os.path.join(path, manifest["embeddings"]), dtype=manifest["dtype"],
+                    mode="c", shape=(num_items, embed_dim))
+    weight = torch.from_numpy(emb)
+
+    # Build with a 1-row table, then point it at the mapped matrix
+    model = model_class(num_items=1, embed_dim=embed_dim, pad_idx=manifest["pad_idx"])
+    dense = torch.load(os.path.join(path, manifest["dense"]), map_location="cpu", weights_only=True)
+    model.load_state_dict(dense, strict=False)
+    model.item_embedding = nn.Embedding.from_pretrained(weight, freeze=True,
+                                                        padding_idx=manifest["pad_idx"])
+    model.num_items = num_items
+    model.to(device)
+    model.eval()
+    return model, manifest
+
+
+def load_ivf(path, manifest, lookup, n_probe=8, device="cpu"):
+    """The artifact's saved IVF index over `lookup`; None for artifacts saved without one."""
+    if not manifest.get("ivf"):
+        return None
+    index = IVFIndex.load(os.path.join(str(path), manifest["ivf"]), lookup,
+                          n_probe=n_probe, device=device)
+    if len(index) != manifest["num_items"] - 1:
+        raise ValueError(f"IVF index at {path} does not match the artifact's embeddings")
+    return index
+
+
+def convert_checkpoint(checkpoint_path, out_dir, registry_path=None):
+    """stamp.pt (+ stamp.items) → artifact directory."""
+    checkpoint = torch.load(checkpoint_path, map_location="cpu", weights_only=False)
+    state_dict = checkpoint.get("model_state", checkpoint)
+    registry_path = registry_path or registry_path_for(checkpoint_path)
+    if not os.path.exists(registry_path):
+        raise FileNotFoundError(f"No item registry at {registry_path}")
+    registry = ItemRegistry.load(registry_path)
+    metadata = {"source": os.path.abspath(checkpoint_path)}
+    if "epoch" in checkpoint:
+        metadata["epoch"] = checkpoint["epoch"]
+    return save_artifact(out_dir, state_dict, registry, metadata=metadata)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert or inspect STAMP model artifacts.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="stamp.pt → artifact directory")
+    convert.add_argument("checkpoint")
+    convert.add_argument("out_dir")
+    convert.add_argument("--registry", default=None, help="defaults to <checkpoint>.items")
+    inspect = sub.add_parser("inspect", help="print an artifact's manifest and load time")
+    inspect.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        manifest = convert_checkpoint(args.checkpoint, args.out_dir, args.registry)
+        print(f"✅ Wrote {args.out_dir} (version {manifest['version']}, "
+              f"{manifest['num_items']} × {manifest['embed_dim']})")
+    else:
+        try:
+            from model.stamp_model import STAMP
+        except ModuleNotFoundError:
+            from stamp_model import STAMP
+        t0 = time.perf_counter()
+        model, manifest = load_artifact(args.path, STAMP)
+        load_ivf(args.path, manifest, model.embed_items)
+        print(json.dumps(manifest, indent=2))
+        print(f"⏱️ Loaded (model + IVF index) in {(time.perf_counter() - t0) * 1000:.1f} ms")
@@ -0,0 +1,246 @@
+# batching.py
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import torch
+
+try:
+    from model.stamp_model import collate_fn, chunked_topk
+except ModuleNotFoundError:
+    from stamp_model import collate_fn, chunked_topk
+
+
+# ---------------------------
+# Micro-batching scheduler for STAMP scoring
+# ---------------------------
+class _ScoreRequest:
+    __slots__ = ("model", "ann_index", "seq_idx", "candidate_idxs", "ann_k", "top_k",
+                 "future", "enqueued_at")
+
+    def __init__(self, model, ann_index, seq_idx, candidate_idxs, ann_k, top_k):
+        self.model = model
+        self.ann_index = ann_index
+        self.seq_idx = seq_idx
+        self.candidate_idxs = candidate_idxs
+        self.ann_k = ann_k
+        self.top_k = top_k
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Collects concurrent recommend requests for up to `max_wait_ms` (or until
+    `max_batch_size` are queued), left-pads their sessions like `collate_fn`,
+    runs one batched STAMP pass (session encoder, IVF retrieval, candidate
+    scoring) and hands each caller its own ranked candidates. Without an IVF
+    index the retrieval stage falls back to exact chunked full-catalog top-k.
+
+    Requests are grouped by model object, so a request submitted before a
+    model swap is scored by the model it was submitted with.
+
+    `observe(stage, seconds)`, if given, is called with the queue wait of
+    each request and the tensor_build / forward / retrieval / topk times of
+    each batch.
+    """
+
+    def __init__(self, max_batch_size=32, max_wait_ms=3.0, pad_idx=0, max_seq_len=50, observe=None):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.pad_idx = pad_idx
+        self.max_seq_len = max_seq_len
+        self.observe = observe
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    # ---------------------------
+    # Public API
+    # ---------------------------
+    def submit(self, model, seq_idx, candidate_idxs, top_k, ann_index=None, ann_k=0):
+        """Queue a scoring request; the Future resolves to ranked candidate item ids."""
+        req = _ScoreRequest(model, ann_index, list(seq_idx), list(candidate_idxs), ann_k, top_k)
+        with self._cond:
+            self._ensure_worker()
+            self._queue.append(req)
+            self._cond.notify()
+        return req.future
+
+    def score(self, model, seq_idx, candidate_idxs, top_k, ann_index=None, ann_k=0, timeout=None):
+        """
+        Blocking form of `submit`. Raises TimeoutError after `timeout` seconds;
+        the request is then dropped if it has not been picked up yet.
+        """
+        future = self.submit(model, seq_idx, candidate_idxs, top_k, ann_index, ann_k)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def stats(self):
+        with self._stats_lock:
+            waits = sorted(self._recent_waits_ms)
+            batches = self._batches
+            return {
+                "batches": batches,
+                "requests": self._requests,
+                "avg_batch_size": self._requests / batches if batches else 0.0,
+                "max_batch_size": self._max_batch,
+                "batch_size_histogram": dict(sorted(self._batch_hist.items())),
+                "avg_queue_wait_ms": self._wait_total_ms / self._requests if self._requests else 0.0,
+                "p95_queue_wait_ms": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                "max_queue_wait_ms": self._wait_max_ms,
+                "queue_depth": len(self._queue),
+            }
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._reset_stats()
+
+    # ---------------------------
+    # Worker
+    # ---------------------------
+    def _reset_stats(self):
+        self._batches = 0
+        self._requests = 0
+        self._max_batch = 0
+        self._batch_hist = {}
+        self._wait_total_ms = 0.0
+        self._wait_max_ms = 0.0
+        self._recent_waits_ms = deque(maxlen=1024)
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="stamp-microbatcher", daemon=True)
+            self._thread.start()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            deadline = self._queue[0].enqueued_at + self.max_wait_ms / 1000.0
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            n = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(n)]
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                # Requests that timed out before being picked up are skipped
+                batch = [r for r in self._next_batch() if r.future.set_running_or_notify_cancel()]
+                if batch:
+                    self._record(batch, time.perf_counter())
+                    self._dispatch(batch)
+            except Exception as e:
+                # Fail this batch's callers and keep serving the next ones
+                for req in batch:
+                    if not req.future.done():
+                        req.future.set_exception(e)
+
+    def _dispatch(self, batch):
+        groups = {}
+        for req in batch:
+            groups.setdefault(id(req.model), []).append(req)
+        for reqs in groups.values():
+            try:
+                results = self._score_batch(reqs)
+            except Exception as e:
+                for req in reqs:
+                    req.future.set_exception(e)
+                continue
+            for req, result in zip(reqs, results):
+                req.future.set_result(result)
+
+    def _record(self, batch, started):
+        waits = [(started - r.enqueued_at) * 1000.0 for r in batch]
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._max_batch = max(self._max_batch, len(batch))
+            self._batch_hist[len(batch)] = self._batch_hist.get(len(batch), 0) + 1
+            self._wait_total_ms += sum(waits)
+            self._wait_max_ms = max(self._wait_max_ms, max(waits))
+            self._recent_waits_ms.extend(waits)
+        if self.observe is not None:
+            for w in waits:
+                self.observe("queue_wait", w / 1000.0)
+
+    @torch.no_grad()
+    def _score_batch(self, reqs):
+        model = reqs[0].model
+        device = next(model.parameters()).device
+        timings = dict.fromkeys(("tensor_build", "forward", "retrieval", "topk"), 0.0)
+        t = time.perf_counter()
+
+        def lap(stage):
+            nonlocal t
+            now = time.perf_counter()
+            timings[stage] += now - t
+            t = now
+
+        seq_tensor, _, _ = collate_fn(
+            [(r.seq_idx, 0) for r in reqs], pad_idx=self.pad_idx, max_seq_len=self.max_seq_len
+        )
+        lap("tensor_build")
+        h = model.session_representation(seq_tensor.to(device))
+        lap("forward")
+
+        # Per-request candidate lists: keyword candidates + embedding-space neighbours
+        candidates = []
+        for b, r in enumerate(reqs):
+            cands = list(r.candidate_idxs)
+            if r.ann_k:
+                if r.ann_index is not None:
+                    _, ann_ids = r.ann_index.search(h[b:b + 1], k=r.ann_k, exclude=r.seq_idx)
+                else:
+                    # No IVF index: exact full-catalog retrieval in bounded memory
+                    _, ann_ids = chunked_topk(
+                        h[b:b + 1], model.item_tables(), r.ann_k,
+                        exclude_items=torch.tensor([r.seq_idx], device=device),
+                        pad_idx=model.pad_idx,
+                    )
+                seen = set(cands)
+                for i in ann_ids[0].tolist():
+                    if i >= 0 and i not in seen:
+                        seen.add(i)
+                        cands.append(i)
+            candidates.append(cands)
+        lap("retrieval")
+
+        K = max((len(c) for c in candidates), default=0)
+        if K == 0:
+            return [[] for _ in reqs]
+        cand_tensor = torch.full((len(reqs), K), self.pad_idx, dtype=torch.long)
+        valid = torch.zeros((len(reqs), K), dtype=torch.bool)
+        for b, cands in enumerate(candidates):
+            if cands:
+                cand_tensor[b, :len(cands)] = torch.tensor(cands, dtype=torch.long)
+                valid[b, :len(cands)] = True
+        lap("tensor_build")
+
+        logits = model.score(h, cand_tensor.to(device))
+        logits = logits.masked_fill(~valid.to(device), float("-inf"))
+        lap("forward")
+        k = min(K, max(r.top_k for r in reqs))
+        top = torch.topk(logits, k, dim=1).indices.cpu().tolist()
+        lap("topk")
+        if self.observe is not None:
+            for stage, seconds in timings.items():
+                self.observe(stage, seconds)
+
+        return [
+            [cands[i] for i in row[:min(r.top_k, len(cands))]]
+            for r, cands, row in zip(reqs, candidates, top)
+        ]
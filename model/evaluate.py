@@ -0,0 +1,144 @@
+# evaluate.py
+import argparse
+from contextlib import contextmanager
+
+import torch
+
+try:
+    from model.stamp_model import SessionDataset, SessionCollator, row_blocks
+except ModuleNotFoundError:
+    from stamp_model import SessionDataset, SessionCollator, row_blocks
+
+
+# ---------------------------
+# Offline ranking evaluation (Recall@K, MRR@K, NDCG@K)
+# ---------------------------
+# Every metric is derived from one tensor: the 0-based rank of each target
+# among the scored items. One forward pass per batch produces it, whatever
+# the number of metrics or K values requested.
+
+@torch.no_grad()
+def target_ranks(model, seq_tensor, targets, mode="full", n_neg=500, chunk_size=65536,
+                 generator=None):
+    """
+    Rank of each target for a batch of left-padded sessions.
+
+    mode="full":    against every item of the catalog (chunked, bounded memory)
+    mode="sampled": against n_neg uniformly sampled negatives per row
+    Items scoring the same as the target count as ranked above it, so a
+    model that scores everything alike does not get a perfect rank.
+    """
+    h = model.session_representation(seq_tensor)
+    target_scores = (h * model.embed_items(targets)).sum(dim=1, keepdim=True)   # (B, 1)
+
+    if mode == "sampled":
+        negs = torch.randint(1, model.num_items, (targets.size(0), n_neg),
+                             device=seq_tensor.device, generator=generator)
+        neg_scores = model.score(h, negs).masked_fill(negs == targets.unsqueeze(1), float("-inf"))
+        return (neg_scores >= target_scores).sum(dim=1)
+
+    if mode != "full":
+        raise ValueError(f"Unknown evaluation mode: {mode!r}")
+    rows = torch.arange(targets.size(0), device=seq_tensor.device)
+    ranks = torch.zeros(targets.size(0), dtype=torch.long, device=seq_tensor.device)
+    # Block by block over the item tables: a grown table is never concatenated
+    for start, block in row_blocks(model.item_tables(), chunk_size):
+        scores = h @ block.T
+        if start <= model.pad_idx < start + scores.size(1):
+            scores[:, model.pad_idx - start] = float("-inf")
+        # The target's own column can differ from target_scores by rounding
+        in_chunk = (targets >= start) & (targets < start + scores.size(1))
+        scores[rows[in_chunk], targets[in_chunk] - start] = float("-inf")
+        ranks += (scores >= target_scores).sum(dim=1)
+    return ranks
+
+
+def metrics_from_ranks(ranks, ks=(5, 10, 20)):
+    """Recall@K (hit rate), MRR@K and NDCG@K for every K from one rank tensor."""
+    ranks = ranks.double()
+    n = max(1, ranks.numel())
+    out = {}
+    for k in ks:
+        hit = ranks < k
+        out[f"recall@{k}"] = hit.sum().item() / n
+        out[f"mrr@{k}"] = torch.where(hit, 1.0 / (ranks + 1), 0.0).sum().item() / n
+        out[f"ndcg@{k}"] = torch.where(hit, 1.0 / torch.log2(ranks + 2), 0.0).sum().item() / n
+    return out
+
+
+@contextmanager
+def _torch_threads(num_threads):
+    if not num_threads:
+        yield
+        return
+    previous = torch.get_num_threads()
+    torch.set_num_threads(num_threads)
+    try:
+        yield
+    finally:
+        torch.set_num_threads(previous)
+
+
+@torch.no_grad()
+def evaluate(model, sessions, ks=(5, 10, 20), mode="full", n_neg=500, batch_size=512,
+             max_seq_len=50, num_threads=None, chunk_size=65536, seed=42, return_ranks=False):
+    """
+    Evaluate next-item prediction on `sessions` (lists of item ids, or a SessionDataset).
+
+    Returns {"recall@K", "mrr@K", "ndcg@K" for each K, "n": pairs evaluated};
+    with return_ranks=True also the raw rank tensor.
+    """
+    model.eval()
+    device = next(model.parameters()).device
+    dataset = sessions if isinstance(sessions, SessionDataset) else SessionDataset(sessions)
+    collate = SessionCollator(pad_idx=model.pad_idx, max_seq_len=max_seq_len)
+    generator = torch.Generator(device=device).manual_seed(seed)
+
+    ranks = []
+    with _torch_threads(num_threads):
+        for start in range(0, len(dataset), batch_size):
+            batch = [dataset[i] for i in range(start, min(start + batch_size, len(dataset)))]
+            seq_tensor, _, targets = collate(batch)
+            ranks.append(target_ranks(
+                model, seq_tensor.to(device), targets.to(device), mode=mode, n_neg=n_neg,
+                chunk_size=chunk_size, generator=generator,
+            ).cpu())
+
+    ranks = torch.cat(ranks) if ranks else torch.empty(0, dtype=torch.long)
+    results = metrics_from_ranks(ranks, ks)
+    results["n"] = ranks.numel()
+    if return_ranks:
+        return results, ranks
+    return results
+
+
+def format_metrics(results, ks=None):
+    """One-line summary, e.g. 'Recall@5 0.0812 | MRR@5 0.0410 | NDCG@5 0.0510 | ...'."""
+    ks = ks or sorted({int(key.split("@")[1]) for key in results if "@" in key})
+    parts = []
+    for k in ks:
+        parts += [f"Recall@{k} {results[f'recall@{k}']:.4f}",
+                  f"MRR@{k} {results[f'mrr@{k}']:.4f}",
+                  f"NDCG@{k} {results[f'ndcg@{k}']:.4f}"]
+    return " | ".join(parts)
+
+
+if __name__ == "__main__":
+    # Smoke run on random sessions: python model/evaluate.py --items 50000
+    parser = argparse.ArgumentParser(description="Evaluate a randomly initialised STAMP model.")
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--mode", choices=["full", "sampled"], default="full")
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        from model.stamp_model import STAMP
+    except ModuleNotFoundError:
+        from stamp_model import STAMP
+    g = torch.Generator().manual_seed(0)
+    sessions = [torch.randint(1, args.items, (int(2 + 20 * torch.rand(1, generator=g)),),
+                              generator=g).tolist() for _ in range(args.sessions)]
+    model = STAMP(num_items=args.items, embed_dim=64)
+    res = evaluate(model, sessions, mode=args.mode, num_threads=args.threads)
+    print(f"{res['n']} pairs | {format_metrics(res)}")
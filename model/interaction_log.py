@@ -0,0 +1,390 @@
+# interaction_log.py
+import atexit
+import glob
+import json
+import os
+import re
+import threading
+import time
+
+
+def coalesce(events):
+    """
+    Collapse events on the same (user, book) pair, keeping rating semantics:
+    an explicit rating beats any implicit view and the last explicit rating
+    wins. Returns [(user_id, book_isbn, rating, implicit)] in first-seen order.
+    """
+    merged = {}
+    for event in events:
+        key = event[:2]
+        if event[3] and key in merged:      # a view never overrides an earlier event
+            continue
+        merged[key] = event
+    return list(merged.values())
+
+
+# Rating given to a viewed (implicit) book that has no rating yet
+IMPLICIT_RATING = 7.14
+
+
+def apply_events(rating, events, implicit_rating=IMPLICIT_RATING):
+    """
+    `rating` (None when there is none) after `events`, as the writer applies
+    them: an explicit rating overwrites, a view only fills in a missing one.
+    """
+    for _, _, value, implicit in events:
+        if not implicit:
+            rating = value
+        elif rating is None:
+            rating = implicit_rating
+    return rating
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# ---------------------------
+# Write-behind interaction log
+# ---------------------------
+# Journal files (JSON lines), owned by one process <pid>-<token> each:
+#   interactions-<pid>-<token>.jsonl          events not yet handed to the writer
+#   interactions-<pid>-<token>.<n>.flushing   a batch being written to the DB
+#   recovering-<pid>-<token>-<name>           a dead process's file, being replayed
+#   dead-letter-<pid>-<token>.jsonl           events that could not be written, kept
+#                                             for inspection and never replayed
+# A file is deleted once its events are committed, so whatever is left on
+# disk after a crash is replayed by the next process that starts. The token
+# tells a reused pid apart from the process that wrote the file.
+_JOURNAL_RE = re.compile(r"^(interactions|recovering)-(\d+)-([0-9a-f]+)[.-]")
+
+
+def pending_events(journal_dir, user_id, book_isbn, attempts=3):
+    """
+    Events on (user_id, book_isbn) that any process journaled but has not
+    committed yet, oldest first. Reading them before the Rating table gives
+    read-your-writes across worker processes: an event missing here was
+    committed first. A file renamed while being listed (a flush started)
+    is found by listing again.
+    """
+    key = (str(user_id), str(book_isbn))
+    found = []
+    for _ in range(attempts):
+        found, vanished, files = [], False, []
+        for path in glob.glob(os.path.join(str(journal_dir), "*")):
+            if _JOURNAL_RE.match(os.path.basename(path)):
+                try:
+                    files.append((os.stat(path).st_mtime_ns, path))
+                except FileNotFoundError:
+                    vanished = True
+        for _, path in sorted(files):
+            try:
+                events = InteractionLog._read_journal(path)
+            except FileNotFoundError:
+                vanished = True
+                continue
+            found.extend(e for e in events if (e[0], e[1]) == key)
+        if not vanished:
+            break
+    return found
+
+
+class InteractionLog:
+    """
+    Buffers rating events in memory and hands them to `writer(events)` in
+    coalesced batches from a background thread, every `flush_interval`
+    seconds or as soon as `max_batch` events are queued. Each event is
+    appended to a per-process journal before `record()` returns, so a crash
+    loses nothing that was acknowledged (with `fsync=True`, not even on
+    power loss). `writer` must be idempotent: replays may repeat events.
+
+    A batch that fails `max_attempts` times in a row is retried one event at
+    a time; events that still fail on their own are moved to a dead-letter
+    file, so one bad event cannot block every later flush. Exceptions in
+    `transient_errors` (e.g. the database being locked or down) never
+    dead-letter anything: those batches are retried until they go through.
+
+    With `flush_interval=None` events are written synchronously (no thread,
+    no journal), which is what tests and one-off scripts want.
+    """
+
+    def __init__(self, writer, journal_dir=None, flush_interval=0.5, max_batch=500, fsync=False,
+                 max_attempts=5, transient_errors=()):
+        self.writer = writer
+        self.journal_dir = str(journal_dir) if journal_dir else None
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self.max_attempts = max_attempts
+        self.transient_errors = tuple(transient_errors)
+
+        self._buffer = []
+        self._segments = []               # journal segments covering the buffered events
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._journal = None
+        self._journal_seq = 0
+        self._attempts = 0                # consecutive failed flushes
+        self._pid = None
+        self._token = None
+        self._thread = None
+        self._closed = False
+
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+        atexit.register(self.close)
+
+    # ---------------------------
+    # Public API
+    # ---------------------------
+    def start(self):
+        """Start the writer thread (which first replays orphaned journals)."""
+        if self.flush_interval is not None:
+            with self._cond:
+                self._ensure_started()
+
+    def record(self, user_id, book_isbn, rating=None, implicit=False):
+        event = (str(user_id), str(book_isbn), rating, bool(implicit))
+        self._count("recorded")
+        if self.flush_interval is None:
+            self._write([event])
+            return
+        with self._cond:
+            self._ensure_started()
+            self._journal_append(event)
+            self._buffer.append(event)
+            if len(self._buffer) >= self.max_batch:
+                self._cond.notify()
+
+    def flush(self):
+        """Write everything recorded so far; returns the number of events written."""
+        with self._flush_lock:
+            with self._cond:
+                events, self._buffer = self._buffer, []
+                segments = self._segments + self._rotate_journal()
+                self._segments = []
+            if not events:
+                self._unlink(segments)
+                return 0
+            try:
+                try:
+                    self._write(coalesce(events), raw_count=len(events))
+                except self.transient_errors:
+                    raise
+                except Exception:
+                    self._attempts += 1
+                    if self._attempts < self.max_attempts:
+                        raise
+                    self._write_each(coalesce(events))
+            except Exception:
+                # Keep them (and their journal) for the next attempt
+                with self._cond:
+                    self._buffer[:0] = events
+                    self._segments[:0] = segments
+                raise
+            self._attempts = 0
+            self._unlink(segments)
+            return len(events)
+
+    def recover(self):
+        """Replay journals left behind by dead processes; returns events replayed."""
+        if not self.journal_dir or not os.path.isdir(self.journal_dir):
+            return 0
+        replayed = 0
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, "*"))):
+            name = os.path.basename(path)
+            m = _JOURNAL_RE.match(name)
+            if m is None or not self._is_orphan(int(m.group(2)), m.group(3)):
+                continue
+            if m.group(1) == "recovering":
+                name = name[m.end():]
+            claimed = os.path.join(self.journal_dir, f"recovering-{self._owner()}-{name}")
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:          # another process claimed it first
+                continue
+            events = self._read_journal(claimed)
+            for start in range(0, len(events), self.max_batch):
+                chunk = events[start:start + self.max_batch]
+                try:
+                    self._write(coalesce(chunk), raw_count=len(chunk))
+                except self.transient_errors:
+                    raise
+                except Exception:
+                    # Already failed once: find the bad events instead of retrying forever
+                    self._write_each(coalesce(chunk))
+            os.remove(claimed)
+            replayed += len(events)
+        if replayed:
+            self._count("recovered", replayed)
+            print(f"♻️ Replayed {replayed} journaled interaction(s) from a previous run")
+        return replayed
+
+    def close(self):
+        """Stop the writer thread after a final flush."""
+        with self._cond:
+            if self._closed or self._pid != os.getpid():
+                return
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"⚠️ Interactions left in the journal for replay: {e}")
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        with self._cond:
+            stats["pending"] = len(self._buffer)
+        stats["journal_dir"] = self.journal_dir
+        return stats
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._reset_stats()
+
+    # ---------------------------
+    # Writer thread
+    # ---------------------------
+    def _ensure_started(self):
+        # Called with self._cond held; (re)starts per process, so it works after fork
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._token = os.urandom(4).hex()
+        self._buffer, self._segments, self._journal, self._closed = [], [], None, False
+        self._thread = threading.Thread(target=self._run, name="interaction-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.recover()
+        except Exception as e:
+            print(f"⚠️ Interaction journal replay failed: {e}")
+        while True:
+            with self._cond:
+                if not self._closed and len(self._buffer) < self.max_batch:
+                    self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                self._count("failures")
+                print(f"⚠️ Interaction flush failed, retrying: {e}")
+                time.sleep(self.flush_interval)
+
+    def _write_each(self, events):
+        """
+        Write `events` one at a time; those that fail on their own go to the
+        dead-letter file. A transient error aborts (the caller retries all).
+        """
+        failed = []
+        for event in events:
+            try:
+                self._write([event])
+            except self.transient_errors:
+                raise
+            except Exception as e:
+                failed.append((event, e))
+        if failed:
+            self._dead_letter(failed)
+
+    def _dead_letter(self, failed):
+        self._count("dead_lettered", len(failed))
+        if not self.journal_dir:
+            print(f"☠️ Dropped {len(failed)} interaction(s) that cannot be written: "
+                  f"{[(event, str(e)) for event, e in failed]}")
+            return
+        os.makedirs(self.journal_dir, exist_ok=True)
+        path = os.path.join(self.journal_dir, f"dead-letter-{self._owner()}.jsonl")
+        with open(path, "a", encoding="utf-8") as f:
+            for event, e in failed:
+                f.write(json.dumps({"event": event, "error": repr(e)}, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        print(f"☠️ Moved {len(failed)} interaction(s) that cannot be written to {path}: "
+              f"{failed[0][1]}")
+
+    def _write(self, events, raw_count=None):
+        t0 = time.perf_counter()
+        self.writer(events)
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["flushed"] += raw_count if raw_count is not None else len(events)
+            self._stats["written"] += len(events)
+            self._stats["last_flush_ms"] = (time.perf_counter() - t0) * 1000
+
+    # ---------------------------
+    # Journal
+    # ---------------------------
+    def _owner(self):
+        return f"{self._pid}-{self._token}"
+
+    def _is_orphan(self, pid, token):
+        if pid == os.getpid():
+            return token != self._token
+        return not _pid_alive(pid)
+
+    def _journal_path(self):
+        return os.path.join(self.journal_dir, f"interactions-{self._owner()}.jsonl")
+
+    def _journal_append(self, event):
+        if not self.journal_dir:
+            return
+        if self._journal is None:
+            os.makedirs(self.journal_dir, exist_ok=True)
+            self._journal = open(self._journal_path(), "a", encoding="utf-8")
+        self._journal.write(json.dumps(event) + "\n")
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def _rotate_journal(self):
+        # Called with self._cond held: later events go to a fresh file
+        if self._journal is None:
+            return []
+        self._journal.close()
+        self._journal = None
+        self._journal_seq += 1
+        segment = os.path.join(self.journal_dir,
+                               f"interactions-{self._owner()}.{self._journal_seq}.flushing")
+        os.replace(self._journal_path(), segment)
+        return [segment]
+
+    @staticmethod
+    def _read_journal(path):
+        events = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    user_id, book_isbn, rating, implicit = json.loads(line)
+                except ValueError:        # torn last line of a crashed writer
+                    continue
+                events.append((user_id, book_isbn, rating, implicit))
+        return events
+
+    @staticmethod
+    def _unlink(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _reset_stats(self):
+        self._stats = {"recorded": 0, "flushed": 0, "written": 0, "batches": 0,
+                       "failures": 0, "recovered": 0, "dead_lettered": 0, "last_flush_ms": 0.0}
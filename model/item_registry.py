@@ -0,0 +1,162 @@
+# item_registry.py
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are not coordinated across processes
+    fcntl = None
+
+
+def registry_path_for(model_path):
+    """Registry of a checkpoint (stamp.pt → stamp.items) or inside an artifact directory."""
+    if os.path.isdir(model_path):
+        return os.path.join(str(model_path), "items.txt")
+    return os.path.splitext(str(model_path))[0] + ".items"
+
+
+# ---------------------------
+# Append-only ISBN ↔ embedding row registry
+# ---------------------------
+class ItemRegistry:
+    """
+    Maps book ISBNs to STAMP item ids (embedding rows). Id 0 is the padding
+    row, so line N of the file (1-based) is the ISBN of item id N.
+
+    Ids are never reused or reordered: new books are appended, both in memory
+    and to the file, so a checkpoint and its registry always agree and adding
+    a book costs O(1). With several worker processes, `add` takes an exclusive
+    file lock and first reads lines appended by other workers, so every
+    process hands out the same id for the same ISBN.
+    """
+
+    def __init__(self, isbns=(), path=None):
+        self.path = str(path) if path else None
+        self._lock = threading.Lock()
+        self._isbns = [None]      # id -> isbn, id 0 = padding
+        self._ids = {}            # isbn -> id
+        self._offset = 0          # bytes of the file already read
+        for isbn in isbns:
+            self._append(isbn)
+
+    @classmethod
+    def load(cls, path):
+        registry = cls(path=path)
+        registry.sync()
+        return registry
+
+    def save(self, path=None):
+        """Write the whole registry (used by training); later adds append to it."""
+        self.path = str(path or self.path)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for isbn in self._isbns[1:]:
+                f.write(f"{isbn}\n")
+        os.replace(tmp, self.path)
+        self._offset = os.path.getsize(self.path)
+        return self.path
+
+    # ---------------------------
+    # Lookups
+    # ---------------------------
+    def __len__(self):
+        """Number of registered books (excluding padding)."""
+        return len(self._isbns) - 1
+
+    def __contains__(self, isbn):
+        return isbn in self._ids
+
+    @property
+    def num_items(self):
+        """Embedding rows needed to cover every id, padding included."""
+        return len(self._isbns)
+
+    def get(self, isbn, default=None):
+        return self._ids.get(isbn, default)
+
+    def isbn(self, item_id):
+        return self._isbns[item_id]
+
+    def book_index(self):
+        return dict(self._ids)
+
+    def index_book(self):
+        return {i: isbn for isbn, i in self._ids.items()}
+
+    # ---------------------------
+    # Growth
+    # ---------------------------
+    def add(self, isbn):
+        """Id of `isbn`, registering it (and appending to the file) if new. Returns (id, created)."""
+        with self._lock:
+            if isbn in self._ids:
+                return self._ids[isbn], False
+            if self.path is None:
+                return self._append(isbn), True
+            with self._locked_file() as f:
+                if isbn in self._ids:
+                    return self._ids[isbn], False
+                self._write_lines(f, [isbn])
+                return self._ids[isbn], True
+
+    def extend(self, isbns):
+        """Register every new ISBN of `isbns`, in order, with one append; returns how many."""
+        with self._lock:
+            if self.path is None:
+                new = [isbn for isbn in dict.fromkeys(isbns) if isbn not in self._ids]
+                for isbn in new:
+                    self._append(isbn)
+                return len(new)
+            with self._locked_file() as f:
+                new = [isbn for isbn in dict.fromkeys(isbns) if isbn not in self._ids]
+                if new:
+                    self._write_lines(f, new)
+                return len(new)
+
+    @contextmanager
+    def _locked_file(self):
+        # Called with self._lock held; yields the file, caught up with other writers
+        with open(self.path, "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self._read_new_lines(f)
+                yield f
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write_lines(self, f, isbns):
+        f.seek(0, os.SEEK_END)
+        f.write("".join(f"{isbn}\n" for isbn in isbns).encode("utf-8"))
+        f.flush()
+        self._offset = f.tell()
+        for isbn in isbns:
+            self._append(isbn)
+
+    def sync(self):
+        """Pick up books appended to the file by other processes; returns how many."""
+        if self.path is None or not os.path.exists(self.path):
+            return 0
+        with self._lock, open(self.path, "rb") as f:
+            return self._read_new_lines(f)
+
+    def _read_new_lines(self, f):
+        f.seek(self._offset)
+        data = f.read()
+        # Only consume complete lines; a concurrent writer may be mid-line
+        end = data.rfind(b"\n") + 1
+        added = 0
+        for line in data[:end].splitlines():
+            # Every line is an id, even a duplicate, so rows never shift
+            self._append(line.decode("utf-8"))
+            added += 1
+        self._offset += end
+        return added
+
+    def _append(self, isbn):
+        item_id = len(self._isbns)
+        self._isbns.append(isbn)
+        self._ids.setdefault(isbn, item_id)
+        return item_id
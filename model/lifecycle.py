@@ -0,0 +1,128 @@
+# lifecycle.py
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ModelNotReady(ValueError):
+    """The STAMP model is still loading (or failed to load)."""
+
+
+# ---------------------------
+# Model lifecycle: single-flight loading, readiness, startup timings
+# ---------------------------
+# Kept free of torch/Django imports and of module-level side effects, so the
+# state here survives a re-import of utils.py and is cheap to import from
+# readiness probes.
+class ModelLifecycle:
+    """
+    Tracks the STAMP auto-load: `start()` runs the loader at most once per
+    process (later calls are no-ops while it runs or after it succeeded),
+    `wait_ready()` blocks requests until it finishes, and `phase()` records
+    how long each startup step took.
+    """
+
+    IDLE, LOADING, READY, FAILED = "idle", "loading", "ready", "failed"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._done = threading.Event()
+        self._thread = None
+        self.state = self.IDLE
+        self.error = None
+        self.timings = {}          # phase -> ms, in the order they ran
+        self.created_at = time.perf_counter()   # ≈ when utils.py started importing
+        self.started_at = None
+        self.ready_at = None
+
+    # ---------------------------
+    # Loading
+    # ---------------------------
+    def start(self, loader, background=True):
+        """Run `loader()` once (in a daemon thread by default); returns True if this call started it."""
+        with self._lock:
+            if self.state in (self.LOADING, self.READY):
+                return False
+            self.state = self.LOADING
+            self.error = None
+            self.started_at = time.perf_counter()
+            self._done.clear()
+            if background:
+                self._thread = threading.Thread(target=self._run, args=(loader,),
+                                                name="stamp-autoload", daemon=True)
+                self._thread.start()
+                return True
+        self._run(loader)
+        return True
+
+    def _run(self, loader):
+        try:
+            loaded = loader()
+        except Exception as e:
+            self.mark_failed(e)
+        else:
+            if loaded is False:
+                self.mark_failed("no model found")
+            else:
+                self.mark_ready()
+
+    def mark_ready(self):
+        with self._lock:
+            self.state = self.READY
+            self.ready_at = time.perf_counter()
+            self.timings["total"] = (self.ready_at - self.created_at) * 1000
+        self._ready.set()
+        self._done.set()
+        print(f"⏱️ STAMP startup breakdown: {self.format_timings()}")
+
+    def mark_failed(self, error):
+        with self._lock:
+            self.state = self.FAILED
+            self.error = str(error)
+        self._done.set()
+
+    # ---------------------------
+    # Readiness
+    # ---------------------------
+    @property
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        """Block until the model is ready, loading failed, or `timeout` seconds passed; returns is_ready."""
+        if self._ready.is_set():
+            return True
+        self._done.wait(timeout)
+        return self._ready.is_set()
+
+    def status(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "ready": self._ready.is_set(),
+                "error": self.error,
+                "timings_ms": dict(self.timings),
+            }
+
+    # ---------------------------
+    # Startup profiling
+    # ---------------------------
+    @contextmanager
+    def phase(self, name):
+        """Record the duration of a startup step (accumulates if repeated)."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - t0) * 1000)
+
+    def record(self, name, ms):
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + ms
+
+    def format_timings(self):
+        return " | ".join(f"{name} {ms:.0f} ms" for name, ms in self.timings.items())
+
+
+model_lifecycle = ModelLifecycle()
@@ -0,0 +1,101 @@
+# rec_cache.py
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def session_fingerprint(seq):
+    """Short stable digest of a session sequence (order matters)."""
+    return hashlib.blake2b("\x1f".join(map(str, seq)).encode(), digest_size=8).hexdigest()
+
+
+# ---------------------------
+# Per-user recommendation result cache
+# ---------------------------
+class RecommendationCache:
+    """
+    LRU + TTL cache of recommend_books() results.
+
+    Entries are grouped by user and keyed by (session fingerprint, top_k,
+    model version), so a changed session or a swapped model never serves an
+    old result, even when the change happened in another worker. Explicit
+    invalidation (`invalidate(user_id)`, `clear()`) just frees the entries
+    early. `max_entries` bounds the total number of results kept.
+    """
+
+    def __init__(self, max_entries=100_000, ttl_seconds=300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._users = OrderedDict()        # user_id -> {key: (result, stored_at)}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    @staticmethod
+    def key(seq, top_k, model_version):
+        return (session_fingerprint(seq), top_k, model_version)
+
+    def get(self, user_id, key):
+        """Cached result for `key`, or None."""
+        now = time.time()
+        with self._lock:
+            entries = self._users.get(user_id)
+            entry = entries.get(key) if entries else None
+            if entry is not None and now - entry[1] < self.ttl_seconds:
+                self._users.move_to_end(user_id)
+                self._stats["hits"] += 1
+                return entry[0]
+            if entry is not None:
+                del entries[key]
+                self._size -= 1
+                self._stats["expired"] += 1
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, user_id, key, result):
+        now = time.time()
+        with self._lock:
+            entries = self._users.setdefault(user_id, {})
+            # Keys for a previous session or model can never hit again
+            stale = [k for k in entries if k[0] != key[0] or k[2] != key[2]]
+            for k in stale:
+                del entries[k]
+            self._size -= len(stale)
+            if key not in entries:
+                self._size += 1
+            entries[key] = (result, now)
+            self._users.move_to_end(user_id)
+            while self._size > self.max_entries:
+                _, evicted = self._users.popitem(last=False)
+                self._size -= len(evicted)
+                self._stats["evictions"] += len(evicted)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            entries = self._users.pop(user_id, None)
+            if entries:
+                self._size -= len(entries)
+                self._stats["invalidations"] += len(entries)
+
+    def clear(self):
+        with self._lock:
+            self._stats["invalidations"] += self._size
+            self._users.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+            stats["users"] = len(self._users)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            self._reset_stats()
+
+    def _reset_stats(self):
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
@@ -0,0 +1,232 @@
+# session_store.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# ---------------------------
+# Two-tier store for users' recent interaction sequences
+# ---------------------------
+class SessionStore:
+    """
+    Recent-books sequence of each user, shared by every worker process.
+
+    - local tier : bounded in-process LRU (`local_max_users` entries); an entry
+                   is trusted for `local_ttl_seconds`, which bounds how stale a
+                   worker can be about appends made by another worker
+    - shared tier: SQLite file (WAL) that every worker reads and writes, so a
+                   restarted or cold worker finds sessions without touching the
+                   Rating table. With `path=None` the store is local-only.
+
+    Sessions not touched for `ttl_seconds` are treated as missing; every
+    `purge_every` writes the expired ones are deleted (0 disables it).
+    User ids are keyed as strings in both tiers, so 42 and "42" are one user.
+    Locks are striped by user id, so memory does not grow with users ever seen.
+    """
+
+    def __init__(self, path=None, max_len=20, local_max_users=50_000, local_ttl_seconds=5.0,
+                 ttl_seconds=7 * 24 * 3600, n_stripes=64, purge_every=1000):
+        self.path = str(path) if path else None
+        self.max_len = max_len
+        self.local_max_users = local_max_users
+        self.local_ttl_seconds = local_ttl_seconds
+        self.ttl_seconds = ttl_seconds
+        self.purge_every = purge_every
+
+        self._local = OrderedDict()        # user_id -> (tuple of isbns, fetched_at)
+        self._local_lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(n_stripes)]
+        self._conns = threading.local()
+        self._schema_ready = False
+
+        self._stats_lock = threading.Lock()
+        self._writes_since_purge = 0
+        self._reset_stats()
+
+    # ---------------------------
+    # Public API
+    # ---------------------------
+    def get(self, user_id):
+        """The user's sequence (oldest first); [] when unknown or expired."""
+        user_id = str(user_id)
+        now = time.time()
+        with self._local_lock:
+            entry = self._local.get(user_id)
+            if entry is not None and now - entry[1] < self.local_ttl_seconds:
+                self._local.move_to_end(user_id)
+                self._count("local_hits")
+                return list(entry[0])
+
+        if self.path is None:
+            if entry is not None and now - entry[1] < self.ttl_seconds:
+                self._count("local_hits")
+                return list(entry[0])
+            self._count("misses")
+            return []
+
+        items = self._shared_get(user_id, now)
+        if items is None:
+            self._count("misses")
+            return []
+        self._count("shared_hits")
+        self._cache(user_id, items, now)
+        return list(items)
+
+    def append(self, user_id, book_isbn):
+        return self.extend(user_id, [book_isbn])
+
+    def extend(self, user_id, book_isbns):
+        """Append to the user's sequence (keeping the last `max_len`); returns it."""
+        user_id = str(user_id)
+        book_isbns = list(book_isbns)
+        now = time.time()
+        with self._stripe(user_id):
+            if self.path is None:
+                with self._local_lock:
+                    entry = self._local.get(user_id)
+                current = list(entry[0]) if entry and now - entry[1] < self.ttl_seconds else []
+                items = tuple((current + book_isbns)[-self.max_len:])
+            else:
+                items = self._shared_extend(user_id, book_isbns, now)
+            self._cache(user_id, items, now)
+        self._count("writes")
+        self._maybe_purge()
+        return list(items)
+
+    def reset(self, user_id):
+        """Start the user over with an empty sequence."""
+        user_id = str(user_id)
+        with self._stripe(user_id):
+            if self.path is not None:
+                conn = self._conn()
+                conn.execute("DELETE FROM ml_sessions WHERE user_id = ?", (user_id,))
+            with self._local_lock:
+                self._local.pop(user_id, None)
+
+    def purge_expired(self):
+        """Drop sessions idle for longer than `ttl_seconds`; returns how many."""
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+        with self._local_lock:
+            if self.path is None:
+                expired = [u for u, (_, t) in self._local.items() if t < cutoff]
+                for u in expired:
+                    del self._local[u]
+                removed = len(expired)
+        if self.path is not None:
+            removed = self._conn().execute(
+                "DELETE FROM ml_sessions WHERE updated_at < ?", (cutoff,)
+            ).rowcount
+        self._count("expired", removed)
+        return removed
+
+    def _maybe_purge(self):
+        if not self.purge_every:
+            return
+        with self._stats_lock:
+            self._writes_since_purge += 1
+            if self._writes_since_purge < self.purge_every:
+                return
+            self._writes_since_purge = 0
+        try:
+            self.purge_expired()
+        except sqlite3.Error as e:
+            # Busy or locked: the next round of writes tries again
+            print(f"⚠️ Session purge failed: {e}")
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["local_hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["local_hits"] + stats["shared_hits"]) / lookups if lookups else 0.0
+        stats["local_size"] = len(self._local)
+        stats["shared"] = self.path
+        return stats
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._reset_stats()
+
+    # ---------------------------
+    # Local tier
+    # ---------------------------
+    def _cache(self, user_id, items, now):
+        with self._local_lock:
+            self._local[user_id] = (tuple(items), now)
+            self._local.move_to_end(user_id)
+            evicted = 0
+            while len(self._local) > self.local_max_users:
+                self._local.popitem(last=False)
+                evicted += 1
+        if evicted:
+            self._count("evictions", evicted)
+
+    def _stripe(self, user_id):
+        return self._stripes[hash(user_id) % len(self._stripes)]
+
+    # ---------------------------
+    # Shared tier (SQLite)
+    # ---------------------------
+    def _conn(self):
+        # One connection per thread, reopened after fork (gunicorn --preload)
+        conn = getattr(self._conns, "conn", None)
+        if conn is None or self._conns.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._schema_ready:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS ml_sessions ("
+                    " user_id TEXT PRIMARY KEY,"
+                    " items TEXT NOT NULL,"
+                    " updated_at REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS ml_sessions_updated_at ON ml_sessions (updated_at)"
+                )
+                self._schema_ready = True
+            self._conns.conn = conn
+            self._conns.pid = os.getpid()
+        return conn
+
+    def _shared_get(self, user_id, now):
+        row = self._conn().execute(
+            "SELECT items, updated_at FROM ml_sessions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None or now - row[1] >= self.ttl_seconds:
+            return None
+        return tuple(json.loads(row[0]))
+
+    def _shared_extend(self, user_id, book_isbns, now):
+        # BEGIN IMMEDIATE serialises the read-modify-write across processes
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            current = self._shared_get(user_id, now) or ()
+            items = tuple((list(current) + book_isbns)[-self.max_len:])
+            conn.execute(
+                "INSERT INTO ml_sessions (user_id, items, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET items = excluded.items, "
+                "updated_at = excluded.updated_at",
+                (user_id, json.dumps(items), now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return items
+
+    # ---------------------------
+    # Metrics
+    # ---------------------------
+    def _reset_stats(self):
+        self._stats = {"local_hits": 0, "shared_hits": 0, "misses": 0,
+                       "writes": 0, "evictions": 0, "expired": 0}
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
@@ -1,9 +1,10 @@
 # stamp_model.py
+import os
 import random
 import numpy as np
 import torch
 import torch.nn as nn
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, Sampler, get_worker_info
 
 # ---------------------------
 # Utility: seed & device
@@ -18,21 +19,90 @@ device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 # Dataset: (session_seq, target)
 # ---------------------------
 class SessionDataset(Dataset):
+    """
+    Next-item (prefix, target) pairs over a list of sessions.
+
+    All sessions live in one flat int32 array `items` with boundaries in
+    `offsets` (session i is items[offsets[i]:offsets[i + 1]]). Sample j is the
+    index pair (pair_session[j], pair_t[j]); its prefix is materialized lazily
+    as a view, so memory is O(total items) rather than O(sum of L^2).
+
+    `save()` writes the arrays as .npy files and `load(..., mmap=True)` maps
+    them read-only; a mapped dataset pickles as its path, so DataLoader
+    workers share the page cache instead of receiving a copy.
+    """
+
+    _FILES = ("items", "offsets", "pair_session", "pair_t")
+
     def __init__(self, sessions, min_len=2):
-        self.pairs = []
-        for s in sessions:
-            if len(s) < min_len:
-                continue
-            for t in range(1, len(s)):
-                prefix = s[:t]
-                target = s[t]
-                self.pairs.append((prefix, target))
+        sessions = [s for s in sessions if len(s) >= min_len]
+        lengths = np.fromiter((len(s) for s in sessions), dtype=np.int64, count=len(sessions))
+        offsets = np.zeros(len(sessions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        items = np.fromiter(
+            (item for s in sessions for item in s), dtype=np.int32, count=int(offsets[-1])
+        )
+        self._set_arrays(items, offsets)
+        self._path = None
+
+    @classmethod
+    def from_arrays(cls, items, offsets, pair_session=None, pair_t=None, path=None):
+        ds = cls.__new__(cls)
+        ds._set_arrays(items, offsets, pair_session, pair_t)
+        ds._path = path
+        return ds
+
+    def _set_arrays(self, items, offsets, pair_session=None, pair_t=None):
+        self.items = items
+        self.offsets = offsets
+        if pair_session is None:
+            # One pair per session position except the first: t = 1 .. len - 1
+            lengths = np.diff(offsets)
+            n_pairs = np.maximum(lengths - 1, 0)
+            pair_session = np.repeat(np.arange(len(lengths), dtype=np.int32), n_pairs)
+            first = np.repeat(np.cumsum(n_pairs) - n_pairs, n_pairs)
+            pair_t = (np.arange(len(pair_session), dtype=np.int64) - first + 1).astype(np.int32)
+        self.pair_session = pair_session
+        self.pair_t = pair_t
+
+    # ---------------------------
+    # On-disk (mmap-able) form
+    # ---------------------------
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in self._FILES:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        return path
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+                  for name in cls._FILES}
+        return cls.from_arrays(**arrays, path=path if mmap else None)
 
+    def __getstate__(self):
+        if self._path is not None:
+            return {"_path": self._path}
+        return self.__dict__
+
+    def __setstate__(self, state):
+        if set(state) == {"_path"}:
+            loaded = self.load(state["_path"], mmap=True)
+            self.__dict__.update(loaded.__dict__)
+        else:
+            self.__dict__.update(state)
+
+    # ---------------------------
+    # Dataset protocol
+    # ---------------------------
     def __len__(self):
-        return len(self.pairs)
+        return len(self.pair_session)
 
     def __getitem__(self, idx):
-        return self.pairs[idx]
+        start = self.offsets[self.pair_session[idx]]
+        pos = start + self.pair_t[idx]
+        return self.items[start:pos], int(self.items[pos])
 
 
 def collate_fn(batch, pad_idx=0, max_seq_len=None):
@@ -45,7 +115,7 @@ def collate_fn(batch, pad_idx=0, max_seq_len=None):
     for s in seqs:
         s = s[-max_len:]
         pad_len = max_len - len(s)
-        padded.append([pad_idx] * pad_len + s)
+        padded.append([pad_idx] * pad_len + list(s))
 
     seq_tensor = torch.LongTensor(padded)
     lengths = torch.LongTensor(lengths)
@@ -53,6 +123,169 @@ def collate_fn(batch, pad_idx=0, max_seq_len=None):
     return seq_tensor, lengths, targets
 
 
+class SessionCollator:
+    """
+    Picklable, vectorized replacement for `collate_fn`.
+
+    Pads each batch straight into a preallocated int64 tensor (pinned when
+    `pin_memory` and CUDA are available): every prefix, already a view into
+    SessionDataset's flat storage, is copied with one NumPy slice assignment
+    instead of per-row Python list concatenation. Output matches collate_fn.
+
+    With a `neg_sampler`, negatives are drawn here too, i.e. inside the
+    DataLoader workers, and appended to the batch: (B, n_neg), or (n_neg,)
+    when `shared_negatives`. Each worker reseeds its sampler copy once.
+    """
+
+    def __init__(self, pad_idx=0, max_seq_len=None, pin_memory=False,
+                 neg_sampler=None, n_neg=0, shared_negatives=False):
+        self.pad_idx = pad_idx
+        self.max_seq_len = max_seq_len
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self.neg_sampler = neg_sampler
+        self.n_neg = n_neg
+        self.shared_negatives = shared_negatives
+        self._seeded_worker = None
+
+    def __call__(self, batch):
+        B = len(batch)
+        lengths = np.fromiter((len(b[0]) for b in batch), dtype=np.int64, count=B)
+        targets = np.fromiter((b[1] for b in batch), dtype=np.int64, count=B)
+        longest = int(lengths.max()) if B else 0
+        max_len = min(longest, self.max_seq_len or longest)
+
+        seq_tensor = torch.full((B, max_len), self.pad_idx, dtype=torch.long,
+                                pin_memory=self.pin_memory)
+        buf = seq_tensor.numpy()
+        for row, (seq, _) in enumerate(batch):
+            n = min(len(seq), max_len)
+            if n:
+                buf[row, max_len - n:] = seq[len(seq) - n:]
+        out = (seq_tensor, torch.from_numpy(lengths), torch.from_numpy(targets))
+
+        if self.neg_sampler is None or not self.n_neg:
+            return out
+        self._reseed_for_worker()
+        if self.shared_negatives:
+            negs = self.neg_sampler.sample_shared(self.n_neg)
+        else:
+            negs = self.neg_sampler.sample(B, self.n_neg)
+        return out + (torch.from_numpy(negs),)
+
+    def _reseed_for_worker(self):
+        info = get_worker_info()
+        if info is not None and self._seeded_worker != info.id:
+            self.neg_sampler.reseed(info.seed % 2**32)
+            self._seeded_worker = info.id
+
+
+class LengthBucketBatchSampler(Sampler):
+    """
+    Batches of SessionDataset indices with similar prefix lengths.
+
+    Indices are shuffled, cut into pools of `batch_size * bucket_multiplier`,
+    sorted by (capped) prefix length inside each pool and split into batches;
+    the batch order is shuffled again. Padding waste drops while batches stay
+    randomized across epochs (call `set_epoch`).
+    """
+
+    def __init__(self, dataset, batch_size, max_seq_len=None, bucket_multiplier=50,
+                 shuffle=True, drop_last=False, seed=SEED):
+        lengths = np.asarray(dataset.pair_t)
+        self.lengths = np.minimum(lengths, max_seq_len) if max_seq_len else lengths
+        self.batch_size = batch_size
+        self.bucket_multiplier = bucket_multiplier
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        n = len(self.lengths)
+        return n // self.batch_size if self.drop_last else -(-n // self.batch_size)
+
+    def __iter__(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        n = len(self.lengths)
+        order = rng.permutation(n) if self.shuffle else np.arange(n)
+        pool = self.batch_size * self.bucket_multiplier
+
+        batches = []
+        for start in range(0, n, pool):
+            chunk = order[start:start + pool]
+            chunk = chunk[np.argsort(self.lengths[chunk], kind="stable")]
+            for b in range(0, len(chunk), self.batch_size):
+                batches.append(chunk[b:b + self.batch_size])
+        if self.drop_last:
+            batches = [b for b in batches if len(b) == self.batch_size]
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+        for batch in batches:
+            yield batch.tolist()
+
+
+# ---------------------------
+# Chunked full-catalog top-k
+# ---------------------------
+def row_blocks(item_weight, chunk_size):
+    """(start, block) over one table or a sequence of tables holding consecutive rows."""
+    tables = item_weight if isinstance(item_weight, (list, tuple)) else (item_weight,)
+    offset = 0
+    for table in tables:
+        for start in range(0, table.size(0), chunk_size):
+            yield offset + start, table[start:start + chunk_size]
+        offset += table.size(0)
+
+
+def chunked_topk(h, item_weight, k, chunk_size=65536, exclude_items=None, pad_idx=0):
+    """
+    Streaming top-k of h (B, D) @ item_weight.T (N, D).
+
+    `item_weight` may also be a sequence of tables whose rows follow each
+    other (STAMP.item_tables()), so a grown table is never concatenated.
+    Scores one block of items at a time and keeps only the best k per row.
+    `exclude_items` (B, E) ids are never returned; pad_idx is always excluded.
+    Returns (scores, items), (B, k') with k' <= k: when a row has fewer than
+    k items left, its missing slots are -inf / -1, and slots no row filled
+    are dropped.
+    """
+    B = h.size(0)
+    tables = item_weight if isinstance(item_weight, (list, tuple)) else (item_weight,)
+    N = sum(t.size(0) for t in tables)
+    k = min(k, N)
+    best_scores = torch.full((B, k), float("-inf"), device=h.device, dtype=h.dtype)
+    best_items = torch.full((B, k), -1, device=h.device, dtype=torch.long)
+    if exclude_items is not None:
+        exclude_items = exclude_items.to(h.device)
+
+    for start, block in row_blocks(tables, chunk_size):
+        end = start + block.size(0)
+        scores = h @ block.T                                        # (B, C)
+        if start <= pad_idx < end:
+            scores[:, pad_idx - start] = float("-inf")
+        if exclude_items is not None:
+            local = exclude_items - start
+            in_chunk = (local >= 0) & (local < end - start) & (exclude_items != pad_idx)
+            rows = torch.arange(B, device=h.device).unsqueeze(1).expand_as(local)
+            scores[rows[in_chunk], local[in_chunk]] = float("-inf")
+
+        top = torch.topk(scores, min(k, end - start), dim=1)
+        merged_scores = torch.cat([best_scores, top.values], dim=1)
+        merged_items = torch.cat([best_items, top.indices + start], dim=1)
+        keep = torch.topk(merged_scores, k, dim=1).indices
+        best_scores = merged_scores.gather(1, keep)
+        best_items = merged_items.gather(1, keep)
+
+    # Masked items (pad, exclusions) sort last with -inf; never return them
+    missing = best_scores == float("-inf")
+    best_items[missing] = -1
+    filled = int((~missing).sum(dim=1).max()) if B else 0
+    return best_scores[:, :filled], best_items[:, :filled]
+
+
 # ---------------------------
 # STAMP Model Definition
 # ---------------------------
@@ -64,6 +297,10 @@ class STAMP(nn.Module):
         self.pad_idx = pad_idx
 
         self.item_embedding = nn.Embedding(num_items, embed_dim, padding_idx=pad_idx)
+        # Rows added after training (add_items): kept beside item_embedding so
+        # a memory-mapped table is never copied to grow it. Not in state_dict.
+        self._extra_items = None
+        self._num_extra = 0
 
         self.W1 = nn.Linear(embed_dim, embed_dim, bias=False)
         self.W2 = nn.Linear(embed_dim, embed_dim, bias=False)
@@ -81,9 +318,10 @@ class STAMP(nn.Module):
         nn.init.normal_(self.item_embedding.weight, mean=0.0, std=0.0022)
         nn.init.normal_(self.ba, 0.0, 0.01)
 
-    def forward(self, session_items, candidate_items=None):
+    def session_representation(self, session_items):
+        """Encode left-padded sessions (B, L) into the STAMP query vector h (B, D)."""
         B, L = session_items.shape
-        emb = self.item_embedding(session_items)
+        emb = self.embed_items(session_items)
         xt = emb[:, -1, :]
         mask = (session_items != self.pad_idx).unsqueeze(-1).float()
         masked_emb = emb * mask
@@ -102,38 +340,213 @@ class STAMP(nn.Module):
 
         hs = torch.tanh(self.Ws(ma))
         ht = torch.tanh(self.Wt(xt))
-        h = hs * ht
+        return hs * ht
+
+    def score(self, h, candidate_items=None):
+        """
+        Dot-product logits of session representations h (B, D) against
+        per-row candidates (B, K), one candidate set shared by the batch (K,),
+        or all items.
+        """
+        if candidate_items is not None and candidate_items.dim() == 1:
+            # Shared candidates: gather K embeddings once instead of B * K
+            cand_emb = self.embed_items(candidate_items)
+            return h @ cand_emb.T
 
         if candidate_items is not None:
-            cand_emb = self.item_embedding(candidate_items)
+            cand_emb = self.embed_items(candidate_items)
             logits = torch.einsum("bd,bkd->bk", h, cand_emb)
             return logits
 
-        all_emb = self.item_embedding.weight.unsqueeze(0)  # (1, num_items, D)
-        logits = torch.einsum("bd,nd->bn", h, self.item_embedding.weight)
+        logits = torch.einsum("bd,nd->bn", h, self.item_weight)
         return logits
 
+    def forward(self, session_items, candidate_items=None):
+        h = self.session_representation(session_items)
+        return self.score(h, candidate_items)
+
+    # ---------------------------
+    # Item rows
+    # ---------------------------
+    def embed_items(self, items):
+        """Embeddings of item ids (any shape), including rows added by add_items."""
+        n_base = self.item_embedding.num_embeddings
+        if not self._num_extra:
+            return self.item_embedding(items)
+        extra = items >= n_base
+        if not extra.any():
+            return self.item_embedding(items)
+        out = self.item_embedding(items.masked_fill(extra, self.pad_idx))
+        out[extra] = self._extra_items[items[extra] - n_base]
+        return out
+
+    def item_tables(self):
+        """The embedding table as consecutive parts: (trained rows, added rows)."""
+        base = self.item_embedding.weight
+        if not self._num_extra:
+            return (base,)
+        return (base, self._extra_items[:self._num_extra])
+
+    @property
+    def item_weight(self):
+        """The whole (num_items, D) table; a copy once rows were added, so not for serving."""
+        tables = self.item_tables()
+        return tables[0] if len(tables) == 1 else torch.cat(tables)
+
+    @torch.no_grad()
+    def mean_item_embedding(self):
+        """Mean trained item embedding, padding excluded, without copying the table."""
+        weight = self.item_embedding.weight.detach()
+        total = torch.zeros(self.embed_dim, dtype=weight.dtype, device=weight.device)
+        for _, block in row_blocks(weight, 65536):
+            total += block.sum(dim=0)
+        n = weight.size(0)
+        if 0 <= self.pad_idx < n:
+            total -= weight[self.pad_idx]
+            n -= 1
+        return total / max(1, n)
+
+    @torch.no_grad()
+    def add_items(self, n_new, init=None):
+        """
+        Append `n_new` item rows and return their ids.
+
+        init : (n_new, D) or (D,) starting vectors; defaults to the mean item
+               embedding (cold start, so a new book is scored like an average one).
+        The trained table (possibly memory-mapped) is left as it is: new rows
+        go to a side buffer that grows geometrically, so adding books one at
+        a time copies neither the table nor the buffer on every call.
+        """
+        base = self.item_embedding.weight
+        start, end = self.num_items, self.num_items + n_new
+        used, needed = self._num_extra, end - base.size(0)
+        storage = self._extra_items
+        if storage is None or storage.size(0) < needed:
+            capacity = max(needed, used + used // 2 + 16)
+            grown = base.detach().new_empty((capacity, self.embed_dim))
+            if used:
+                grown[:used] = storage[:used]
+            self._extra_items = storage = grown
+
+        if init is None:
+            init = self.mean_item_embedding()
+        storage[used:needed] = init
+        self._num_extra = needed
+        self.num_items = end
+        return torch.arange(start, end)
+
+    @torch.no_grad()
+    def topk(self, session_items, k, chunk_size=65536, exclude_items=None):
+        """
+        Top-k items over the full catalog without materializing (B, num_items).
+
+        Items are scored `chunk_size` rows of the embedding table at a time and
+        merged into a running (B, k) top-k, so peak memory is
+        O(B * (k + chunk_size)) whatever the catalog size.
+
+        exclude_items : optional (B, E) LongTensor of item ids to skip per row
+                        (e.g. already-rated books), padded with pad_idx.
+        Returns (scores, items), at most (B, k); see chunked_topk.
+        """
+        h = self.session_representation(session_items)
+        return chunked_topk(h, self.item_tables(), k, chunk_size=chunk_size,
+                            exclude_items=exclude_items, pad_idx=self.pad_idx)
+
 
 
 # ---------------------------
 # Negative Sampling
 # ---------------------------
+def build_alias_table(probs):
+    """
+    Walker/Vose alias table for a discrete distribution.
+
+    Returns (prob, alias) so that drawing i uniformly and keeping i with
+    probability prob[i] (else alias[i]) samples from `probs` in O(1).
+    Construction is a single O(num_items) pass, done once per sampler.
+    """
+    n = len(probs)
+    scaled = (np.asarray(probs, dtype=np.float64) * n / np.sum(probs)).tolist()
+    prob = [1.0] * n
+    alias = list(range(n))
+
+    small = np.flatnonzero(np.asarray(scaled) < 1.0).tolist()
+    large = np.flatnonzero(np.asarray(scaled) >= 1.0).tolist()
+    while small and large:
+        s = small.pop()
+        l = large[-1]
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] -= 1.0 - scaled[s]
+        if scaled[l] < 1.0:
+            small.append(large.pop())
+    # Whatever is left is 1.0 up to rounding error
+    return np.asarray(prob, dtype=np.float64), np.asarray(alias, dtype=np.int64)
+
+
 class NegativeSampler:
-    def __init__(self, num_items, item_freq_counter=None, power=0.75):
+    """
+    Popularity^power negative sampler backed by an alias table.
+
+    - `sample(B, n)`: (B, n) NumPy draws, O(1) each (no cumsum/searchsorted
+      over the catalog per batch)
+    - `sample_shared(n)`: one (n,) negative set for the whole batch
+    - `sample_tensor(B, n)`: draws generated directly on `device`, so no
+      host -> device copy per step
+    """
+
+    def __init__(self, num_items, item_freq_counter=None, power=0.75, device=None, seed=SEED):
         self.num_items = num_items
         if item_freq_counter is None:
             probs = np.ones(num_items)
         else:
-            freq = np.array(
-                [item_freq_counter.get(i, 0) for i in range(num_items)], dtype=np.float64
-            )
+            freq = np.zeros(num_items, dtype=np.float64)
+            ids = np.fromiter(item_freq_counter.keys(), dtype=np.int64, count=len(item_freq_counter))
+            counts = np.fromiter(item_freq_counter.values(), dtype=np.float64, count=len(item_freq_counter))
+            in_range = (ids >= 0) & (ids < num_items)
+            freq[ids[in_range]] = counts[in_range]
             probs = np.power(freq, power)
             probs = np.clip(probs, 1e-8, None)
         probs = probs / probs.sum()
         self.probs = probs
+        self.prob_table, self.alias_table = build_alias_table(probs)
+
+        self.rng = np.random.default_rng(seed)
+        self.device = None
+        if device is not None:
+            self.to(device, seed=seed)
+
+    def reseed(self, seed):
+        """Give this copy its own stream (e.g. per DataLoader worker)."""
+        self.rng = np.random.default_rng(seed)
+        if self.device is not None:
+            self._generator.manual_seed(seed)
+
+    def to(self, device, seed=SEED):
+        """Keep a copy of the alias table on `device` for `sample_tensor`."""
+        self.device = torch.device(device)
+        self._prob_t = torch.as_tensor(self.prob_table, dtype=torch.float32, device=self.device)
+        self._alias_t = torch.as_tensor(self.alias_table, dtype=torch.long, device=self.device)
+        self._generator = torch.Generator(device=self.device)
+        self._generator.manual_seed(seed)
+        return self
 
     def sample(self, batch_size, n_samples):
-        samples = np.random.choice(
-            self.num_items, size=(batch_size, n_samples), p=self.probs
-        )
-        return samples
+        return self._draw((batch_size, n_samples))
+
+    def sample_shared(self, n_samples):
+        return self._draw((n_samples,))
+
+    def _draw(self, size):
+        idx = self.rng.integers(0, self.num_items, size=size)
+        keep = self.rng.random(size) < self.prob_table[idx]
+        return np.where(keep, idx, self.alias_table[idx])
+
+    def sample_tensor(self, batch_size, n_samples=None):
+        """Device-resident draws: (batch_size, n_samples), or (batch_size,) if n_samples is None."""
+        if self.device is None:
+            raise ValueError("NegativeSampler.sample_tensor needs a device; call .to(device) first")
+        size = (batch_size,) if n_samples is None else (batch_size, n_samples)
+        idx = torch.randint(self.num_items, size, device=self.device, generator=self._generator)
+        keep = torch.rand(size, device=self.device, generator=self._generator) < self._prob_t[idx]
+        return torch.where(keep, idx, self._alias_t[idx])
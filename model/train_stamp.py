@@ -1,10 +1,16 @@
 # train_stamp.py
+import argparse
 import torch
 import torch.nn as nn
 import torch.optim as optim
 from collections import Counter
 from torch.utils.data import DataLoader
-from stamp_model import STAMP, SessionDataset, collate_fn, NegativeSampler, device
+from stamp_model import (
+    STAMP, SessionDataset, SessionCollator, LengthBucketBatchSampler, NegativeSampler, device
+)
+from evaluate import evaluate, format_metrics
+from item_registry import ItemRegistry, registry_path_for
+from artifact import is_artifact, save_artifact
 import pandas as pd
 from sklearn.model_selection import train_test_split
 import os
@@ -12,21 +18,42 @@ import numpy as np
 # ---------------------------
 # Training loop
 # ---------------------------
-def train_epoch(model, dataloader, optimizer, neg_sampler, n_neg=100, grad_clip=5.0):
+def train_epoch(model, dataloader, optimizer, neg_sampler, n_neg=100, grad_clip=5.0, neg_mode="per_row"):
+    """
+    One pass over `dataloader` with BCE over (positive, negatives) logits.
+
+    neg_mode:
+      - "per_row":  n_neg sampled negatives per example (B * n_neg gathers)
+      - "shared":   one set of n_neg negatives for the whole batch (n_neg gathers)
+      - "in_batch": the other targets of the batch are the negatives (no sampling)
+    """
     model.train()
     total_loss = 0.0
     bce = nn.BCEWithLogitsLoss()
-    for seqs, lengths, targets in dataloader:
-        seqs, targets = seqs.to(device), targets.to(device)
+    for batch in dataloader:
+        seqs, lengths, targets = batch[:3]
+        seqs = seqs.to(device, non_blocking=True)
+        targets = targets.to(device, non_blocking=True)
         B = seqs.size(0)
 
-        negs = torch.LongTensor(neg_sampler.sample(B, n_neg)).to(device)
-        pos_col = targets.view(B, 1)
-        candidates = torch.cat([pos_col, negs], dim=1)
-
-        logits = model(seqs, candidates)
-        labels = torch.zeros_like(logits, dtype=torch.float, device=device)
-        labels[:, 0] = 1.0
+        if neg_mode == "in_batch":
+            h = model.session_representation(seqs)
+            logits = model.score(h, targets)                      # (B, B)
+            # Rows sharing a target are positives for each other
+            labels = (targets.unsqueeze(1) == targets.unsqueeze(0)).float()
+        else:
+            if len(batch) > 3:
+                # Drawn by SessionCollator inside the DataLoader workers
+                negs = batch[3].to(device, non_blocking=True)
+            elif neg_mode == "shared":
+                negs = _draw_negatives(neg_sampler, None, n_neg)  # (n_neg,)
+            else:
+                negs = _draw_negatives(neg_sampler, B, n_neg)     # (B, n_neg)
+            h = model.session_representation(seqs)
+            pos_logits = model.score(h, targets.view(B, 1))
+            logits = torch.cat([pos_logits, model.score(h, negs)], dim=1)
+            labels = torch.zeros_like(logits, dtype=torch.float, device=device)
+            labels[:, 0] = 1.0
 
         loss = bce(logits, labels)
         optimizer.zero_grad()
@@ -39,57 +66,128 @@ def train_epoch(model, dataloader, optimizer, neg_sampler, n_neg=100, grad_clip=
     return total_loss / len(dataloader.dataset)
 
 
+def _draw_negatives(neg_sampler, batch_size, n_neg):
+    """Negatives as a LongTensor on `device`, drawn there directly when the sampler supports it."""
+    if neg_sampler.device is not None:
+        if batch_size is None:
+            return neg_sampler.sample_tensor(n_neg)
+        return neg_sampler.sample_tensor(batch_size, n_neg)
+    if batch_size is None:
+        return torch.from_numpy(neg_sampler.sample_shared(n_neg)).to(device)
+    return torch.from_numpy(neg_sampler.sample(batch_size, n_neg)).to(device)
+
+
 # ---------------------------
 # Evaluation (Precision@K)
 # ---------------------------
 
 def precision_at_k(model, sessions_for_eval, item_count, K=20, batch_size=512, max_seq_len=50, n_neg=500):
     """
-    Approximate Precision@K using sampled negatives.
+    Approximate Precision@K (hit rate) using sampled negatives.
     For each positive target, sample n_neg negatives (instead of all items).
+    With n_neg=None the target is ranked against the full catalog instead.
+    Kept for existing callers; prefer evaluate.evaluate(), which returns
+    several metrics and K values from a single pass.
     """
-    model.eval()
-    hits, tot = 0, 0
-    device = next(model.parameters()).device
-
-    # Create list of (prefix, target)
-    pairs = []
-    for s in sessions_for_eval:
-        for t in range(1, len(s)):
-            pairs.append((s[:t][-max_seq_len:], s[t]))
-
-    with torch.no_grad():
-        for i in range(0, len(pairs), batch_size):
-            batch = pairs[i:i+batch_size]
-            seqs = [b[0] for b in batch]
-            targets = [b[1] for b in batch]
-            max_len = max(len(s) for s in seqs)
-            padded = [[0]*(max_len - len(s)) + s for s in seqs]
-            seq_tensor = torch.LongTensor(padded).to(device)
-
-            B = len(batch)
-            # Sample negatives per batch
-            negs = np.random.randint(1, item_count, size=(B, n_neg))
-            pos_col = np.array(targets).reshape(-1, 1)
-            candidates = np.concatenate([pos_col, negs], axis=1)
-            candidates = torch.LongTensor(candidates).to(device)
-
-            logits = model(seq_tensor, candidates)  # (B, 1 + n_neg)
-            topk = torch.topk(logits, K, dim=1).indices.cpu().numpy()
-
-            for r, tgt in enumerate(targets):
-                tot += 1
-                if 0 in topk[r]:  # positive is always at index 0
-                    hits += 1
-
-    return hits / tot if tot > 0 else 0.0
+    mode = "full" if n_neg is None else "sampled"
+    res = evaluate(model, sessions_for_eval, ks=(K,), mode=mode, n_neg=n_neg or 0,
+                   batch_size=batch_size, max_seq_len=max_seq_len)
+    return res[f"recall@{K}"]
 
 
 # ---------------------------
 # Entry point
 # ---------------------------
-if __name__ == "__main__":
-    ratings_path = "./../clean_data/ratings.csv"
+def load_registry(artifact_dir, checkpoint_path):
+    """
+    The item registry serving appends to (the artifact's, else the
+    checkpoint's), or a new one next to the checkpoint. Training appends to
+    it instead of rebuilding it, so ids handed out by handle_new_book stay.
+    """
+    paths = [registry_path_for(checkpoint_path)]
+    if is_artifact(artifact_dir):
+        paths.insert(0, registry_path_for(artifact_dir))
+    for path in paths:
+        if os.path.exists(path):
+            print(f"📒 Item ids from {path}")
+            return ItemRegistry.load(path)
+    return ItemRegistry(path=paths[-1])
+
+
+def cold_start_untrained(state_dict, trained_ids, pad_idx=0):
+    """
+    Give rows that training never updated (books only in the registry or in
+    validation sessions) the mean trained embedding, as serving does for a
+    new book. Returns a copy of `state_dict`.
+    """
+    state_dict = dict(state_dict)
+    weight = state_dict["item_embedding.weight"].detach().clone()
+    trained = torch.zeros(weight.size(0), dtype=torch.bool)
+    trained[list(trained_ids)] = True
+    trained[pad_idx] = False
+    untrained = ~trained
+    untrained[pad_idx] = False
+    if trained.any() and untrained.any():
+        weight[untrained] = weight[trained].mean(dim=0)
+    state_dict["item_embedding.weight"] = weight
+    return state_dict
+
+
+def build_train_loader(dataset, neg_sampler, args, pad_idx=0):
+    """
+    DataLoader for training. Collation (padding + negative sampling) is done
+    by a picklable SessionCollator, so it runs inside `num_workers` worker
+    processes with persistent workers, pinned memory and prefetching.
+    """
+    workers = args.num_workers
+    collator = SessionCollator(
+        pad_idx=pad_idx, max_seq_len=args.max_seq_len,
+        neg_sampler=neg_sampler if (workers > 0 and args.neg_mode != "in_batch") else None,
+        n_neg=args.n_neg, shared_negatives=args.neg_mode == "shared",
+    )
+    loader_kwargs = dict(
+        collate_fn=collator,
+        num_workers=workers,
+        pin_memory=args.pin_memory and torch.cuda.is_available(),
+    )
+    if workers > 0:
+        loader_kwargs.update(persistent_workers=True, prefetch_factor=args.prefetch_factor)
+
+    if args.bucket:
+        batch_sampler = LengthBucketBatchSampler(dataset, args.batch_size, max_seq_len=args.max_seq_len)
+        return DataLoader(dataset, batch_sampler=batch_sampler, **loader_kwargs)
+    return DataLoader(dataset, batch_size=args.batch_size, shuffle=True, **loader_kwargs)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train the STAMP session recommender.")
+    parser.add_argument("--ratings", default="./../clean_data/ratings.csv")
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--max-seq-len", type=int, default=50)
+    parser.add_argument("--n-neg", type=int, default=100)
+    parser.add_argument("--neg-mode", choices=["per_row", "shared", "in_batch"], default="per_row")
+    parser.add_argument("--num-workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="DataLoader worker processes (0 = load on the main thread)")
+    parser.add_argument("--prefetch-factor", type=int, default=4,
+                        help="batches prefetched per worker")
+    parser.add_argument("--pin-memory", action="store_true", help="pin batches (CUDA only)")
+    parser.add_argument("--bucket", action="store_true", help="length-bucketed batches")
+    parser.add_argument("--eval-mode", choices=["sampled", "full"], default="sampled",
+                        help="rank validation targets against sampled negatives or the full catalog")
+    parser.add_argument("--eval-neg", type=int, default=500)
+    parser.add_argument("--eval-k", type=int, nargs="+", default=[5, 20])
+    parser.add_argument("--eval-threads", type=int, default=None)
+    parser.add_argument("--artifact-dir", default="stamp",
+                        help="directory for the memory-mappable serving artifact")
+    parser.add_argument("--dataset-cache", default=None,
+                        help="directory to save the training pairs to and mmap them from, "
+                             "so workers share pages instead of copies")
+    return parser.parse_args(argv)
+
+
+def main(args):
+    ratings_path = args.ratings
     print(f"📂 Loading ratings from: {ratings_path}")
     ratings = pd.read_csv(ratings_path)
     ratings = ratings[["user_id", "book_isbn", "book_rating"]]
@@ -98,46 +196,65 @@ if __name__ == "__main__":
     print(f"✅ Created {len(sessions)} sessions (users with >=2 books rated)")
     sessions_train, sessions_val = train_test_split(sessions, test_size=0.1, random_state=42)
 
-    # Build ISBN → integer ID mapping
-    unique_books = sorted({isbn for session in sessions for isbn in session})
-    book2id = {isbn: i+1 for i, isbn in enumerate(unique_books)}  # reserve 0 for padding
-    id2book = {i+1: isbn for i, isbn in enumerate(unique_books)}
+    # ISBN → integer ID mapping: the existing registry, plus unseen books in
+    # sorted order (id 0 is padding)
+    save_path = "stamp.pt"
+    registry = load_registry(args.artifact_dir, save_path)
+    added = registry.extend(sorted({isbn for session in sessions for isbn in session}))
+    print(f"   → {added} new books registered")
+    book2id = registry.book_index()
 
     # Convert sessions from ISBN to integer IDs
     sessions_train = [[book2id[b] for b in s if b in book2id] for s in sessions_train]
     sessions_val = [[book2id[b] for b in s if b in book2id] for s in sessions_val]
 
-    num_items = len(book2id) + 1 
+    num_items = registry.num_items
     pad_idx = 0
+    # Item id N ↔ ISBN, so serving maps embedding rows to the right books
+    if os.path.abspath(registry.path) != os.path.abspath(registry_path_for(save_path)):
+        ItemRegistry([registry.isbn(i) for i in range(1, num_items)]).save(registry_path_for(save_path))
 
     print(f"🔢 num_items = {num_items}")
 
     train_dataset = SessionDataset(sessions_train)
-    val_dataset = SessionDataset(sessions_val)
-    train_loader = DataLoader(
-        train_dataset, batch_size=512, shuffle=True,
-        collate_fn=lambda b: collate_fn(b, pad_idx=pad_idx, max_seq_len=50)
-    )
+    if args.dataset_cache:
+        train_dataset = SessionDataset.load(train_dataset.save(args.dataset_cache), mmap=True)
 
     item_freq = Counter([item for s in sessions_train for item in s])
-    neg_sampler = NegativeSampler(num_items=num_items, item_freq_counter=item_freq, power=0.75)
+    # With workers, negatives are drawn on the CPU inside the workers;
+    # otherwise the sampler draws directly on the training device.
+    sampler_device = device if args.num_workers == 0 else None
+    neg_sampler = NegativeSampler(num_items=num_items, item_freq_counter=item_freq, power=0.75,
+                                  device=sampler_device)
+    train_loader = build_train_loader(train_dataset, neg_sampler, args, pad_idx=pad_idx)
+
     model = STAMP(num_items=num_items, embed_dim=100, pad_idx=pad_idx, dropout=0.2).to(device)
     optimizer = optim.Adam(model.parameters(), lr=0.005, weight_decay=1e-6)
     scheduler = optim.lr_scheduler.StepLR(optimizer, step_size=5, gamma=0.9)
-    n_epochs = 100
-    n_neg = 100
+    n_epochs = args.epochs
+    n_neg = args.n_neg
+
+    # Validated every 2 epochs and after the last one; the serving artifact
+    # gets the best validated weights and is written once, after training
+    best_key = f"recall@{max(args.eval_k)}"
+    best = None
 
     for epoch in range(1, n_epochs + 1):
-        train_loss = train_epoch(model, train_loader, optimizer, neg_sampler, n_neg=n_neg)
+        if isinstance(train_loader.batch_sampler, LengthBucketBatchSampler):
+            train_loader.batch_sampler.set_epoch(epoch)
+        train_loss = train_epoch(model, train_loader, optimizer, neg_sampler, n_neg=n_neg,
+                                 neg_mode=args.neg_mode)
         scheduler.step()
         print(f"Epoch {epoch} | Train Loss: {train_loss:.4f}")
 
-        if epoch % 2 == 0:
-            prec5 = precision_at_k(model, sessions_val[:2000], num_items, K=5)
-            prec20 = precision_at_k(model, sessions_val[:2000], num_items, K=20)
-            print(f"  Val Prec@5: {prec5:.4f} | Prec@20: {prec20:.4f}")
+        if epoch % 2 == 0 or epoch == n_epochs:
+            metrics = evaluate(model, sessions_val[:2000], ks=args.eval_k, mode=args.eval_mode,
+                               n_neg=args.eval_neg, num_threads=args.eval_threads)
+            print(f"  Val {format_metrics(metrics)}")
+            if best is None or metrics[best_key] > best["metrics"][best_key]:
+                best = {"epoch": epoch, "train_loss": train_loss, "metrics": metrics,
+                        "state": {k: v.detach().clone() for k, v in model.state_dict().items()}}
 
-        save_path = "stamp.pt"
         if os.path.exists(save_path):
             os.remove(save_path)  # delete old checkpoint to ensure overwrite
 
@@ -145,4 +262,17 @@ if __name__ == "__main__":
             "epoch": epoch,
             "model_state": model.state_dict(),
             "opt_state": optimizer.state_dict()
-        }, save_path)
\ No newline at end of file
+        }, save_path)
+
+    if best is None:
+        return
+    # Serving format: memory-mappable embeddings + manifest (artifact.py)
+    save_artifact(args.artifact_dir, cold_start_untrained(best["state"], item_freq, pad_idx),
+                  registry, pad_idx=pad_idx,
+                  metadata={"epoch": best["epoch"], "train_loss": best["train_loss"],
+                            "val": best["metrics"], "args": vars(args)})
+    print(f"📦 Saved {args.artifact_dir} from epoch {best['epoch']} "
+          f"(Val {best_key} {best['metrics'][best_key]:.4f})")
+
+if __name__ == "__main__":
+    main(parse_args())
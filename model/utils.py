@@ -1,12 +1,21 @@
 import os
 import sys
-import torch
+import json
+import time
+import logging
 import threading
-from collections import defaultdict, deque
-from django.db import transaction
+from contextlib import nullcontext
+
+try:
+    from model.lifecycle import model_lifecycle, ModelNotReady
+except ModuleNotFoundError:
+    from lifecycle import model_lifecycle, ModelNotReady
+
+with model_lifecycle.phase("torch_import"):
+    import torch
+from django.db import transaction, InterfaceError, OperationalError
 import re
 from difflib import SequenceMatcher
-from django.db.models import Q
 
 # --------------------------------------------------------
 # Django setup
@@ -17,10 +26,61 @@ if BASE_DIR not in sys.path:
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 import django
-if not django.apps.apps.ready:
-    django.setup()
+from django.apps import apps as _django_apps
+# Imported from AppConfig.ready() the registry is mid-populate: don't re-enter it
+if not _django_apps.ready and not _django_apps.loading:
+    with model_lifecycle.phase("django_setup"):
+        django.setup()
 
+from django.conf import settings
 from backend_app.models import User, Book, Rating
+from backend_app.search_index import book_search_index
+from backend_app.candidate_index import candidate_index
+from backend_app.db_tuning import read_db
+from backend_app.tracing import Trace, get_logger
+from backend_app.metrics import Counter, Histogram, CallbackMetric
+
+try:
+    from model.ann_index import IVFIndex
+    from model.batching import MicroBatcher
+    from model.session_store import SessionStore
+    from model.rec_cache import RecommendationCache
+    from model.interaction_log import IMPLICIT_RATING, InteractionLog
+    from model.item_registry import ItemRegistry, registry_path_for
+    from model.artifact import is_artifact, load_artifact, load_ivf
+    from model.evaluate import evaluate
+except ModuleNotFoundError:
+    from ann_index import IVFIndex
+    from batching import MicroBatcher
+    from session_store import SessionStore
+    from rec_cache import RecommendationCache
+    from interaction_log import IMPLICIT_RATING, InteractionLog
+    from item_registry import ItemRegistry, registry_path_for
+    from artifact import is_artifact, load_artifact, load_ivf
+    from evaluate import evaluate
+
+
+log = get_logger("recommend")
+
+# --------------------------------------------------------
+# METRICS (text format at /metrics, see backend_app/metrics.py)
+# --------------------------------------------------------
+RECOMMEND_REQUESTS = Counter(
+    "stamp_recommend_requests", "recommend_books() calls by outcome", ["outcome"])
+RECOMMEND_STAGE_SECONDS = Histogram(
+    "stamp_recommend_stage_seconds",
+    "Time per recommend_books() stage: session, candidates, scoring, db, total", ["stage"])
+BATCH_STAGE_SECONDS = Histogram(
+    "stamp_batch_stage_seconds",
+    "Micro-batch scoring stages per batch (tensor_build, forward, retrieval, topk) "
+    "and queue_wait per request", ["stage"])
+INTERACTIONS = Counter("stamp_interactions", "record_interaction() calls by kind", ["kind"])
+INTERACTION_SECONDS = Histogram(
+    "stamp_interaction_seconds", "record_interaction() latency (request path only)")
+
+
+def _observe_batch_stage(stage, seconds):
+    BATCH_STAGE_SECONDS.labels(stage).observe(seconds)
 
 
 # --------------------------------------------------------
@@ -32,35 +92,168 @@ _GLOBAL_STATE = {
     "index_book": {},
     "user_index": {},
     "index_user": {},
+    "ann_index": None,
+    "item_registry": None,
+    "cold_start": None,
+    "model_version": None,
+    "model_path": None,
 }
-
-# Each user's interaction sequence is stored independently
-_user_sequences = defaultdict(lambda: deque(maxlen=20))
-_sequence_locks = defaultdict(threading.Lock)
+# Guards multi-key reads/writes of _GLOBAL_STATE (model swap vs. requests)
+_state_lock = threading.RLock()
+
+# Embedding-space retrieval stage (IVF over item_embedding)
+ANN_NUM_CANDIDATES = 100
+ANN_N_PROBE = 16
+
+# Concurrent recommend requests are scored together in micro-batches
+BATCH_MAX_SIZE = 32
+BATCH_MAX_WAIT_MS = 3.0
+# A request gives up on its micro-batch after this long (TimeoutError → 503)
+BATCH_TIMEOUT_SECONDS = 5.0
+_batcher = MicroBatcher(max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                       observe=_observe_batch_stage)
+
+# Each user's recent books: in-process LRU over a SQLite file shared by all workers
+_SESSION_CFG = getattr(settings, "ML_SESSION_STORE", {})
+_session_store = SessionStore(
+    path=_SESSION_CFG.get("PATH"),
+    max_len=_SESSION_CFG.get("MAX_LEN", 20),
+    local_max_users=_SESSION_CFG.get("LOCAL_MAX_USERS", 50_000),
+    local_ttl_seconds=_SESSION_CFG.get("LOCAL_TTL_SECONDS", 5.0),
+    ttl_seconds=_SESSION_CFG.get("TTL_SECONDS", 7 * 24 * 3600),
+    purge_every=_SESSION_CFG.get("PURGE_EVERY_WRITES", 1000),
+)
+
+# recommend_books() results per (user, session fingerprint, top_k, model version)
+_CACHE_CFG = getattr(settings, "ML_RECOMMEND_CACHE", {})
+_rec_cache = RecommendationCache(
+    max_entries=_CACHE_CFG.get("MAX_ENTRIES", 100_000),
+    ttl_seconds=_CACHE_CFG.get("TTL_SECONDS", 300.0),
+)
 _device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+# How long a request waits for the startup auto-load before giving up
+MODEL_READY_TIMEOUT = getattr(settings, "ML_READY_TIMEOUT_SECONDS", 10.0)
+
 # --------------------------------------------------------
 # MODEL LOADING FUNCTIONS
 # --------------------------------------------------------
-def load_model(model_path, model_class):
-    """Load trained STAMP model and resize embeddings if DB size changed."""
-    load_mappings_from_db()
-    num_items = len(_GLOBAL_STATE["book_index"]) or Book.objects.count()
-    if num_items == 0:
-        raise ValueError("❌ No books found in DB — cannot initialize STAMP model.")
+def load_model(model_path, model_class, phase=None):
+    """
+    Load the trained STAMP model from an artifact directory (embeddings
+    memory-mapped, see artifact.py) or a pickled stamp.pt checkpoint, and
+    make it the serving model.
+    """
+    state = prepare_model(model_path, model_class, phase=phase)
+    with (phase or (lambda name: nullcontext()))("mapping_load"):
+        load_mappings_from_db(include_books=False)
+    _swap_state(state)
+    log.info("STAMP model loaded", extra={"fields": {
+        "model_path": model_path, "num_items": state["trained_model"].num_items,
+        "embed_dim": state["trained_model"].embed_dim}})
+    return state
 
-    # Initialize model
-    model = model_class(num_items=num_items, embed_dim=64)
+
+def prepare_model(model_path, model_class, phase=None):
+    """
+    Build everything the serving path needs for `model_path` without touching
+    the live state: model, IVF index, item registry and book mappings.
+
+    Item ids come from the registry saved with the model (items.txt / stamp.items),
+    so embedding row N is always the book training assigned to id N. Books
+    registered after training (see handle_new_book) get cold-start rows.
+    Checkpoints without a registry fall back to the old DB-order mapping.
+    An artifact's saved IVF index is opened as is; it is only built (k-means)
+    for checkpoints and artifacts saved without one.
+
+    phase : optional `name -> context manager` used to time each step
+            (ModelLifecycle.phase at startup).
+    """
+    phase = phase or (lambda name: nullcontext())
+    if is_artifact(model_path):
+        # Artifact directory: embeddings are memory-mapped, nothing is unpickled
+        with phase("checkpoint_load"):
+            model, manifest = load_artifact(model_path, model_class, device=_device)
+        with phase("mapping_load"):
+            registry = ItemRegistry.load(registry_path_for(model_path))
+            book_index, index_book = registry.book_index(), registry.index_book()
+        with phase("ivf_load"):
+            ann_index = load_ivf(model_path, manifest, model.embed_items,
+                                 n_probe=ANN_N_PROBE, device=_device)
+        version = manifest["version"]
+    else:
+        with phase("checkpoint_load"):
+            model, registry, book_index, index_book = _load_checkpoint(model_path, model_class)
+        ann_index = None
+        version = None
+
+    if ann_index is None:
+        with phase("ivf_build"):
+            ann_index = IVFIndex(n_probe=ANN_N_PROBE).build(
+                model.item_embedding.weight, exclude_ids=(model.pad_idx,), lookup=model.embed_items
+            )
+
+    with phase("cold_start_rows"):
+        cold_start = model.mean_item_embedding()
+        if registry is not None and registry.num_items > model.num_items:
+            added = registry.num_items - model.num_items
+            ann_index.add(model.add_items(added, init=cold_start))
+            print(f"   → {added} books registered since training got cold-start rows")
+
+    return {
+        "trained_model": model,
+        "book_index": book_index,
+        "index_book": index_book,
+        "ann_index": ann_index,
+        "item_registry": registry,
+        "cold_start": cold_start,
+        "model_version": version,
+        "model_path": model_path,
+    }
+
+
+def _swap_state(state):
+    """Publish a prepared model; readers snapshot under the same lock."""
+    with _state_lock:
+        # Books registered while `state` was being prepared
+        if state.get("item_registry") is not None:
+            state["item_registry"].sync()
+            _grow_to_registry(state)
+        _GLOBAL_STATE.update(state)
+    _rec_cache.clear()
+
+
+def _load_checkpoint(model_path, model_class):
+    """Legacy pickled checkpoint (stamp.pt); returns (model, registry or None, book_index, index_book)."""
     try:
     	checkpoint = torch.load(model_path, map_location=_device)
     except Exception as e:
     	print("Retrying with weights_only=False due to PyTorch 2.6+ security change...")
     	checkpoint = torch.load(model_path, map_location=_device, weights_only=False)
+    state_dict = checkpoint.get("model_state", checkpoint)
+    trained_items, embed_dim = state_dict["item_embedding.weight"].shape
+
+    registry_path = registry_path_for(model_path)
+    if os.path.exists(registry_path):
+        registry = ItemRegistry.load(registry_path)
+        book_index, index_book = registry.book_index(), registry.index_book()
+        num_items = trained_items
+    else:
+        print(f"⚠️ No item registry at {registry_path}; mapping books in DB order.")
+        registry = None
+        books = list(Book.objects.values_list("book_isbn", flat=True))
+        book_index = {isbn: idx for idx, isbn in enumerate(books)}
+        index_book = {idx: isbn for isbn, idx in book_index.items()}
+        num_items = len(book_index)
+        if num_items == 0:
+            raise ValueError("❌ No books found in DB — cannot initialize STAMP model.")
 
+    # Initialize model
+    model = model_class(num_items=num_items, embed_dim=embed_dim)
 
     # Handle mismatched layer shapes
     model_dict = model.state_dict()
-    for key, value in checkpoint.items():
+    for key, value in state_dict.items():
         if key in model_dict and value.shape != model_dict[key].shape:
             print(f"Resizing {key}: {value.shape} → {model_dict[key].shape}")
             min_shape = tuple(min(a, b) for a, b in zip(value.shape, model_dict[key].shape))
@@ -71,164 +264,165 @@ def load_model(model_path, model_class):
     model.load_state_dict(model_dict, strict=False)
     model.to(_device)
     model.eval()
-
-    _GLOBAL_STATE["trained_model"] = model
-    print(f"STAMP model loaded successfully from: {model_path}")
-    print(f"   → num_items = {num_items}, embed_dim = 64")
+    return model, registry, book_index, index_book
 
 
-
-def load_mappings_from_db():
-    """Load all users and books from DB into memory mappings."""
-    books = list(Book.objects.values_list("book_isbn", flat=True))
+def load_mappings_from_db(include_books=True):
+    """
+    Load all users from DB into memory mappings, and all books unless
+    include_books=False (the item registry provides them instead).
+    """
     users = list(User.objects.values_list("user_id", flat=True))
-
-    book_index = {isbn: idx for idx, isbn in enumerate(books)}
-    index_book = {idx: isbn for isbn, idx in book_index.items()}
     user_index = {uid: idx for idx, uid in enumerate(users)}
     index_user = {idx: uid for uid, idx in user_index.items()}
-
     _GLOBAL_STATE.update({
-        "book_index": book_index,
-        "index_book": index_book,
         "user_index": user_index,
         "index_user": index_user,
     })
 
-    print(f"Loaded mappings → {len(users)} users, {len(books)} books")
+    books = []
+    if include_books:
+        books = list(Book.objects.values_list("book_isbn", flat=True))
+        book_index = {isbn: idx for idx, isbn in enumerate(books)}
+        index_book = {idx: isbn for isbn, idx in book_index.items()}
+        _GLOBAL_STATE.update({
+            "book_index": book_index,
+            "index_book": index_book,
+        })
 
-import re
-import random
-from django.db.models import Q
-from backend_app.models import Book
+    print(f"Loaded mappings → {len(users)} users, {len(books)} books")
 
-def _get_similar_books_by_title(base_books, limit=500):
+def _get_similar_books_by_title(base_isbns, limit=500):
     """
-    Improved version:
-    - Extracts significant keywords (4+ letters, not common stopwords)
-    - Matches against title, author, or publisher
-    - Ensures results share at least one keyword in the title
-    - Adds small randomness for diversity
+    Candidate generation from the in-memory keyword index:
+    - Keywords (4+ letters, not common stopwords) come from the base books'
+      precomputed title/author/publisher keyword sets
+    - Candidates are ranked by how many of those keywords their title shares
+    - 20% of the slots are random books for novelty
+    Returns ISBNs; no database queries are made.
     """
-    if not base_books:
-        return list(Book.objects.order_by("?")[:limit])
+    if not base_isbns:
+        return candidate_index.random_isbns(limit)
 
     # --- Step 1: Build keyword set ---
-    stopwords = {
-        "from", "with", "this", "that", "your", "have", "will", "book", "books",
-        "into", "edition", "press", "about", "their", "these", "those", "which",
-        "after", "before", "under", "over", "then", "been", "were", "also",
-        "there", "where", "when", "how", "what", "why", "into", "once", "some",
-        "more", "most", "other", "such", "many", "each", "than", "them", "they",
-        "might", "must", "shall", "could", "would", "very", "make", "made",
-        "work", "works", "series", "paperback", "hardcover", "edition", "press"
-    }
-
-    keywords = set()
-    for book in base_books:
-        text = f"{book.book_title or ''} {book.book_author or ''} {book.publisher or ''}".lower()
-        tokens = re.findall(r"[a-zA-Z]{4,}", text)
-        keywords.update(t for t in tokens if t not in stopwords)
-
-    keywords = list(keywords)[:25]  # limit to avoid giant queries
+    keywords = list(candidate_index.keywords_for(base_isbns))[:25]
 
     if not keywords:
-        return list(Book.objects.order_by("?")[:limit])
-
-    # --- Step 2: Query by keyword overlap ---
-    query = Q()
-    for kw in keywords:
-        query |= (
-            Q(book_title__icontains=kw)
-            | Q(book_author__icontains=kw)
-            | Q(publisher__icontains=kw)
-        )
+        return candidate_index.random_isbns(limit)
 
-    similar_qs = (
-        Book.objects.filter(query)
-        .distinct()
-        .exclude(book_isbn__in=[b.book_isbn for b in base_books])
-    )
+    # --- Step 2: Rank by title keyword overlap count ---
+    isbns = candidate_index.similar(keywords, exclude=base_isbns, limit=int(limit * 0.8))
 
-    # --- Step 3: Rank by title keyword overlap count ---
-    matched = []
-    for b in similar_qs[:2000]:  # check up to 2000 for efficiency
-        title = (b.book_title or "").lower()
-        score = sum(kw in title for kw in keywords)
-        if score > 0:
-            matched.append((score, b))
+    # --- Step 3: add 20% random books for novelty ---
+    isbns.extend(candidate_index.random_isbns(int(limit * 0.2)))
 
-    # --- Step 4: Sort and add diversity ---
-    matched.sort(key=lambda x: x[0], reverse=True)
-    books = [b for _, b in matched[: int(limit * 0.8)]]
-
-    # add 20% random books for novelty
-    random_books = list(Book.objects.order_by("?")[: int(limit * 0.2)])
-    books.extend(random_books)
-
-    # --- Step 5: Deduplicate and trim ---
+    # --- Step 4: Deduplicate and trim ---
     seen = set()
-    final_books = []
-    for b in books:
-        if b.book_isbn not in seen:
-            seen.add(b.book_isbn)
-            final_books.append(b)
-        if len(final_books) >= limit:
+    final_isbns = []
+    for isbn in isbns:
+        if isbn not in seen:
+            seen.add(isbn)
+            final_isbns.append(isbn)
+        if len(final_isbns) >= limit:
             break
 
-    print(f"[DEBUG] Found {len(final_books)} similar books (keywords={len(keywords)})")
-    return final_books
+    log.debug("Found %d similar books (keywords=%d)", len(final_isbns), len(keywords))
+    return final_isbns
 
 # --------------------------------------------------------
 # INTERACTION FUNCTIONS
 # --------------------------------------------------------
+
+
 def record_interaction(user_id, book_isbn, rating=None, implicit=False):
     """
     Record a user-book interaction.
-    - If implicit=True (like a view), assign neutral rating (7.0)
-      but only if no explicit rating exists yet.
+    - If implicit=True (like a view), assign neutral rating (7.14)
+      but only if no rating exists yet.
     - If explicit rating provided, always overwrite any implicit one.
     - Prevent overwriting explicit ratings with implicit ones.
+
+    The session is updated right away; the Rating row is written by the
+    interaction log's background writer (see _persist_interactions), so bad
+    input is rejected here (ValueError → 400) rather than at flush time.
     """
-    from backend_app.models import Book, User, Rating
-
-    # --- Resolve user and book ---
-    user, _ = User.objects.get_or_create(user_id=user_id)
-    book, _ = Book.objects.get_or_create(book_isbn=book_isbn)
-
-    # ✅ Debug print: show full context of incoming request
-    print("\n[DEBUG] record_interaction() called:")
-    print(f"   → user_id   = {user_id}")
-    print(f"   → book_isbn = {book_isbn}")
-    print(f"   → book_name = {book.book_title or '(unknown title)'}")
-    print(f"   → rating    = {rating}")
-    print(f"   → implicit  = {implicit}")
-    print("-" * 70)
-
-    # --- Logic for storing rating ---
-    existing = Rating.objects.filter(user=user, book=book).first()
+    user_id = "" if user_id is None else str(user_id).strip()
+    book_isbn = "" if book_isbn is None else str(book_isbn).strip()
+    if not user_id or not book_isbn:
+        raise ValueError("user_id and book_isbn are required")
+    if not implicit:
+        if rating is None:
+            raise ValueError("An explicit interaction needs a rating")
+        try:
+            rating = float(rating)
+        except (TypeError, ValueError):
+            raise ValueError(f"rating must be a number, got {rating!r}")
+
+    trace = Trace(log, "interaction", user_id=user_id, book_isbn=book_isbn,
+                  rating=rating, implicit=bool(implicit))
+    with trace.span("journal"):
+        _interaction_log.record(user_id, book_isbn, rating, implicit)
+    with trace.span("session"):
+        _session_store.append(user_id, book_isbn)
+        _rec_cache.invalidate(user_id)
+    INTERACTION_SECONDS.observe(trace.finish()["total"] / 1000.0)
+    INTERACTIONS.labels("implicit" if implicit else "explicit").inc()
+
     if implicit:
-        if existing is None:
-            Rating.objects.create(user=user, book=book, rating=7.14)
-            msg = f"Implicit (view) rating recorded for {book.book_title or book_isbn}"
-        else:
-            msg = f"Skipped implicit rating — explicit already exists for {book.book_title or book_isbn}"
+        msg = f"Implicit (view) interaction recorded for {book_isbn}"
     else:
-        Rating.objects.update_or_create(
-            user=user, book=book,
-            defaults={"rating": rating}
-        )
-        msg = f"Explicit rating {rating} recorded for {book.book_title or book_isbn}"
-
-    # ✅ Debug print: confirm user’s total ratings in DB
-    count = Rating.objects.filter(user=user).count()
-    print(f"[DEBUG] User {user_id} now has {count} rating(s) in the database.")
-    print("=" * 70)
+        msg = f"Explicit rating {rating} recorded for {book_isbn}"
+    return {"status": "ok", "message": msg}
 
-    # --- Update in-memory sequence ---
-    _user_sequences[user_id].append(book_isbn)
 
-    return {"status": "ok", "message": msg}
+def _persist_interactions(events):
+    """
+    Write a coalesced batch of (user_id, book_isbn, rating, implicit) events
+    in one transaction: a handful of queries instead of five per event.
+    Upserts on the (user, book) unique constraint, so journal replays and
+    concurrent workers are safe.
+    """
+    user_ids = {e[0] for e in events}
+    isbns = {e[1] for e in events}
+    with transaction.atomic():
+        User.objects.bulk_create([User(user_id=u) for u in user_ids], ignore_conflicts=True)
+        Book.objects.bulk_create([Book(book_isbn=b) for b in isbns], ignore_conflicts=True)
+        users = dict(User.objects.filter(user_id__in=user_ids).values_list("user_id", "id"))
+        books = dict(Book.objects.filter(book_isbn__in=isbns).values_list("book_isbn", "id"))
+
+        explicit, implicit = [], []
+        for user_id, book_isbn, rating, is_implicit in events:
+            row = Rating(user_id=users[user_id], book_id=books[book_isbn],
+                         rating=IMPLICIT_RATING if is_implicit else rating)
+            (implicit if is_implicit else explicit).append(row)
+        # An explicit rating overwrites; a view only fills in a missing rating
+        Rating.objects.bulk_create(explicit, batch_size=500, update_conflicts=True,
+                                   unique_fields=["user", "book"], update_fields=["rating"])
+        Rating.objects.bulk_create(implicit, batch_size=500, ignore_conflicts=True)
+
+
+# Rating writes: journaled per process, flushed in batches by a background thread
+_LOG_CFG = getattr(settings, "ML_INTERACTION_LOG", {})
+_interaction_log = InteractionLog(
+    _persist_interactions,
+    journal_dir=_LOG_CFG.get("JOURNAL_DIR"),
+    flush_interval=_LOG_CFG.get("FLUSH_INTERVAL_SECONDS", 0.5),
+    max_batch=_LOG_CFG.get("MAX_BATCH", 500),
+    fsync=_LOG_CFG.get("FSYNC", False),
+    max_attempts=_LOG_CFG.get("MAX_ATTEMPTS", 5),
+    # Database locked or unreachable: retry, never dead-letter
+    transient_errors=(OperationalError, InterfaceError),
+)
+
+
+def get_interaction_log_stats():
+    """Queue depth, flush and replay counters of the interaction write-behind log."""
+    return _interaction_log.stats()
+
+
+def flush_interactions():
+    """Write pending interactions now (e.g. before reading Rating back)."""
+    return _interaction_log.flush()
 
 
 def recommend_books(user_id, top_k=5):
@@ -239,77 +433,153 @@ def recommend_books(user_id, top_k=5):
     3. Rank using STAMP.
     4. DO NOT modify user's true session.
     """
-    model = _GLOBAL_STATE.get("trained_model")
+    _check_reload_trigger()
+
+    # Early requests wait for the auto-loader instead of failing outright
+    if _GLOBAL_STATE.get("trained_model") is None \
+            and not model_lifecycle.wait_ready(MODEL_READY_TIMEOUT):
+        status = model_lifecycle.status()
+        RECOMMEND_REQUESTS.labels("not_ready").inc()
+        raise ModelNotReady(f"Model not loaded (state: {status['state']}"
+                            + (f", error: {status['error']})" if status["error"] else ")"))
+
+    # One consistent snapshot: a reload swapping mid-request cannot mix models
+    with _state_lock:
+        model = _GLOBAL_STATE.get("trained_model")
+        book_index = _GLOBAL_STATE["book_index"]
+        index_book = _GLOBAL_STATE["index_book"]
+        ann_index = _GLOBAL_STATE.get("ann_index")
+        model_version = _GLOBAL_STATE.get("model_version")
     if model is None:
-        raise ValueError("Model not loaded. Please check auto-load configuration.")
-
-    book_index = _GLOBAL_STATE["book_index"]
-    index_book = _GLOBAL_STATE["index_book"]
-
-    # --- Retrieve or reload user session ---
-    with _sequence_locks[user_id]:
-        seq = list(_user_sequences[user_id])
-
+        raise ModelNotReady("Model not loaded. Please check auto-load configuration.")
+
+    trace = Trace(log, "recommend", user_id=user_id, top_k=top_k)
+    with trace.db():
+        # --- Retrieve or reload user session ---
+        with trace.span("session"):
+            seq = _session_store.get(user_id)
+
+            if not seq:
+                log.debug("No session for %s, loading from DB", user_id)
+                last_rated = (
+                    Rating.objects.using(read_db()).filter(user__user_id=user_id)
+                    .order_by("-id")
+                    .values_list("book__book_isbn", flat=True)[:5]
+                )
+                seq = list(last_rated)[::-1]
+                if seq:
+                    seq = _session_store.extend(user_id, seq)
+
+        # --- Same session, top_k and model as last time: reuse the result ---
+        cache_key = _rec_cache.key(seq, top_k, model_version)
+        cached = _rec_cache.get(user_id, cache_key)
+        if cached is not None:
+            _observe_spans(trace.finish(cached=True, n=len(cached)), "cached")
+            return {"user_id": user_id, "recommendations": list(cached)}
+
+        result = _recommend_for_session(trace, user_id, seq, top_k, model,
+                                        book_index, index_book, ann_index)
+        _rec_cache.put(user_id, cache_key, tuple(result["recommendations"]))
+    _observe_spans(trace.finish(cached=False, n=len(result["recommendations"])), "computed")
+    return result
+
+
+def _observe_spans(spans, outcome):
+    RECOMMEND_REQUESTS.labels(outcome).inc()
+    for stage, ms in spans.items():
+        RECOMMEND_STAGE_SECONDS.labels(stage).observe(ms / 1000.0)
+
+
+def _recommend_for_session(trace, user_id, seq, top_k, model, book_index, index_book, ann_index):
     if not seq:
-        print(f"[DEBUG] No session for {user_id}, loading from DB...")
-        from backend_app.models import Rating
-        last_rated = (
-            Rating.objects.filter(user__user_id=user_id)
-            .order_by("-id")
-            .values_list("book__book_isbn", flat=True)[:5]
-        )
-        seq = list(last_rated)
-        if seq:
-            with _sequence_locks[user_id]:
-                _user_sequences[user_id].extend(seq)
-
-    if not seq:
-        print(f"[DEBUG] No ratings for user {user_id}, returning fallback.")
-        books = list(Book.objects.values_list("book_isbn", flat=True)[:top_k])
+        log.debug("No ratings for user %s, returning fallback", user_id)
+        books = list(Book.objects.using(read_db()).values_list("book_isbn", flat=True)[:top_k])
         return {"user_id": user_id, "recommendations": books}
 
-    # --- Print last books ---
-    last_books = list(Book.objects.filter(book_isbn__in=seq[-5:]))
-    print(f"\n[DEBUG] Last {len(last_books)} books for user {user_id}:")
-    for b in last_books:
-        print(f"   → {b.book_title} ({b.book_isbn})")
+    # Titles are looked up for the debug log only: no queries unless it is on
+    debug = log.isEnabledFor(logging.DEBUG)
+    if debug:
+        log.debug("Last books for user %s: %s", user_id,
+                  [f"{b.book_title} ({b.book_isbn})"
+                   for b in Book.objects.using(read_db()).filter(book_isbn__in=seq[-5:])])
 
     # --- Encode sequence ---
     seq_idx = [book_index[b] for b in seq if b in book_index]
     if not seq_idx:
         return {"user_id": user_id, "recommendations": []}
 
-    seq_tensor = torch.tensor([seq_idx], dtype=torch.long).to(_device)
-
     # --- Candidates ---
-    candidate_books = _get_similar_books_by_title(last_books, limit=100)
-    candidate_isbns = [b.book_isbn for b in candidate_books if b.book_isbn in book_index]
+    with trace.span("candidates"):
+        candidate_isbns = _get_similar_books_by_title(seq[-5:], limit=100)
+        candidate_idxs = [book_index[b] for b in candidate_isbns if b in book_index]
 
-    if not candidate_isbns:
-        print(f"[DEBUG] No similar books found for user {user_id}.")
+    # --- Score (batched with concurrent requests; adds IVF neighbours of h) ---
+    with trace.span("scoring"):
+        try:
+            top_idxs = _batcher.score(
+                model, seq_idx, candidate_idxs, top_k,
+                ann_index=ann_index, ann_k=ANN_NUM_CANDIDATES, timeout=BATCH_TIMEOUT_SECONDS,
+            )
+        except TimeoutError:
+            RECOMMEND_REQUESTS.labels("timeout").inc()
+            raise
+    if not top_idxs:
+        log.debug("No similar books found for user %s", user_id)
         return {"user_id": user_id, "recommendations": []}
 
-    candidate_idxs = [book_index[b] for b in candidate_isbns]
-    candidate_tensor = torch.tensor([candidate_idxs], dtype=torch.long).to(_device)
-
-    # --- Score ---
-    with torch.no_grad():
-        scores = model(seq_tensor, candidate_tensor)
-        scores = torch.softmax(scores, dim=-1)
-        top_indices = torch.topk(scores, top_k, dim=1).indices.squeeze(0).tolist()
+    rec_books = [index_book[i] for i in top_idxs if i in index_book]
 
-    rec_books = [candidate_isbns[i] for i in top_indices if i < len(candidate_isbns)]
+    if debug:
+        log.debug("Recommended for user %s: %s", user_id,
+                  [f"{b.book_title} ({b.book_isbn})"
+                   for b in Book.objects.using(read_db()).filter(book_isbn__in=rec_books)])
+        # ✅ The session is not modified here
+        log.debug("User %s session remains: %s", user_id, seq)
 
-    # --- Print recommendations ---
-    rec_objs = list(Book.objects.filter(book_isbn__in=rec_books))
-    print(f"\n[DEBUG] Recommended {len(rec_books)} books for user {user_id}:")
-    for b in rec_objs:
-        print(f"   ★ {b.book_title} ({b.book_isbn})")
+    return {"user_id": user_id, "recommendations": rec_books}
 
-    # ✅ DO NOT modify session here!
-    print(f"[DEBUG] User {user_id} session remains: {list(_user_sequences[user_id])}")
 
-    return {"user_id": user_id, "recommendations": rec_books}
+def get_batching_stats():
+    """Batch-size and queue-wait statistics of the scoring micro-batcher."""
+    return _batcher.stats()
+
+
+def get_session_store_stats():
+    """Hit/miss, eviction and size counters of the user session store."""
+    return _session_store.stats()
+
+
+def get_recommend_cache_stats():
+    """Hit-rate, eviction and invalidation counters of the recommendation cache."""
+    return _rec_cache.stats()
+
+
+# Existing stats() counters, read at scrape time
+CallbackMetric("stamp_recommend_cache_lookups", "Recommendation cache lookups by result",
+               lambda: {k: _rec_cache.stats()[k] for k in ("hits", "misses")},
+               type="counter", labelnames=["result"])
+CallbackMetric("stamp_recommend_cache_hit_ratio", "Recommendation cache hit rate since start",
+               lambda: _rec_cache.stats()["hit_rate"])
+CallbackMetric("stamp_recommend_cache_entries", "Cached recommendation results",
+               lambda: _rec_cache.stats()["size"])
+CallbackMetric("stamp_session_lookups", "Session store lookups by tier",
+               lambda: {k: _session_store.stats()[k] for k in ("local_hits", "shared_hits", "misses")},
+               type="counter", labelnames=["result"])
+CallbackMetric("stamp_session_hit_ratio", "Session store hit rate since start",
+               lambda: _session_store.stats()["hit_rate"])
+CallbackMetric("stamp_interaction_queue_depth", "Interactions waiting for the background writer",
+               lambda: _interaction_log.stats()["pending"])
+CallbackMetric("stamp_interactions_flushed", "Interactions written to the Rating table",
+               lambda: _interaction_log.stats()["flushed"], type="counter")
+CallbackMetric("stamp_interaction_flush_failures", "Failed interaction flushes (retried)",
+               lambda: _interaction_log.stats()["failures"], type="counter")
+CallbackMetric("stamp_interactions_dead_lettered",
+               "Interactions moved to the dead-letter file after repeated write failures",
+               lambda: _interaction_log.stats()["dead_lettered"], type="counter")
+CallbackMetric("stamp_interaction_last_flush_seconds", "Duration of the last interaction flush",
+               lambda: _interaction_log.stats()["last_flush_ms"] / 1000.0)
+CallbackMetric("stamp_batch_queue_depth", "Scoring requests waiting for a micro-batch",
+               lambda: _batcher.stats()["queue_depth"])
 
 # -----------------------------------------------
 # HANDLERS
@@ -320,7 +590,7 @@ def handle_new_user(user_id, age=None, location=None):
         user_id=user_id,
         defaults={"age": age, "location": location},
     )
-    _user_sequences[user_id] = deque(maxlen=20)
+    _session_store.reset(user_id)
     return {"status": "ok", "message": f"User {user_id} {'created' if created else 'exists'}."}
 
 
@@ -340,43 +610,406 @@ def handle_new_book(book_isbn, book_title=None, book_author=None,
             "image_url_l": image_url_l or "",
         },
     )
+    book_search_index.add_book(book.book_isbn, book.book_title, book.book_author)
+    candidate_index.add_book(book.book_isbn, book.book_title, book.book_author, book.publisher)
+    _register_new_item(book)
     return {"status": "ok", "message": f"Book {book_isbn} {'added' if created else 'exists'}."}
 
+def _register_new_item(book):
+    """
+    Give a new book an item id and an embedding row without reloading the model.
+    The row starts at the mean embedding of books with similar titles (or of
+    all books), so it can be recommended before the next training run.
+    """
+    with _state_lock:
+        registry = _GLOBAL_STATE.get("item_registry")
+        if registry is None or _GLOBAL_STATE.get("trained_model") is None \
+                or book.book_isbn in registry:
+            return
+        registry.add(book.book_isbn)
+        _grow_to_registry(_GLOBAL_STATE, focus_isbn=book.book_isbn)
+    print(f"📚 Registered {book.book_isbn} as item {registry.get(book.book_isbn)}")
+
+
+def _grow_to_registry(state, focus_isbn=None):
+    """
+    Add embedding rows for registry ids the model does not have yet (books
+    registered here or by other workers). `focus_isbn` is initialised from
+    keyword-similar books, the others from the mean embedding.
+    """
+    model, registry = state["trained_model"], state["item_registry"]
+    first = model.num_items
+    if registry is None or registry.num_items <= first:
+        return
+
+    init = state["cold_start"].expand(registry.num_items - first, -1).clone()
+    if focus_isbn is not None:
+        similar = candidate_index.similar(
+            candidate_index.keywords_for([focus_isbn]), exclude=[focus_isbn], limit=20
+        )
+        similar_ids = [registry.get(isbn) for isbn in similar]
+        similar_ids = [i for i in similar_ids if i is not None and i < first]
+        if similar_ids:
+            init[registry.get(focus_isbn) - first] = \
+                model.embed_items(torch.tensor(similar_ids, device=init.device)).mean(dim=0)
+
+    new_ids = model.add_items(init.size(0), init=init)
+    if state.get("ann_index") is not None:
+        state["ann_index"].add(new_ids)
+
+    # Publish the ids last, so requests never see an id without a row
+    for item_id in new_ids.tolist():
+        isbn = registry.isbn(item_id)
+        state["book_index"].setdefault(isbn, item_id)
+        state["index_book"][item_id] = isbn
+    # New books are candidates now
+    _rec_cache.clear()
+
 # --------------------------------------------------------
-# THREADED AUTO-LOAD FUNCTION
+# HOT RELOAD
 # --------------------------------------------------------
-def _auto_load_stamp_model_once():
-    """Automatically load STAMP model and mappings after Django setup."""
+# A reload prepares the new model next to the live one (load, IVF build,
+# warm-up, sanity eval) and only then swaps _GLOBAL_STATE under _state_lock.
+# Requests already queued keep their model: the micro-batcher groups
+# requests by model object. Other worker processes pick up a reload through
+# a trigger file that recommend_books polls every RELOAD_POLL_SECONDS.
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+RELOAD_TRIGGER_PATH = getattr(settings, "ML_RELOAD_TRIGGER", os.path.join(BASE_DIR, "ml_reload.json"))
+RELOAD_POLL_SECONDS = 2.0
+RELOAD_WARMUP_BATCHES = 3
+RELOAD_SANITY_RATINGS = 5000
+# A reload is refused when the sanity eval (sampled Recall@10 on recent
+# ratings) is missing, below RELOAD_MIN_RECALL or below RELOAD_MIN_RECALL_RATIO
+# of the live model's recall on the same ratings; None skips either check
+RELOAD_MIN_RECALL = getattr(settings, "ML_RELOAD_MIN_RECALL", 0.15)
+RELOAD_MIN_RECALL_RATIO = getattr(settings, "ML_RELOAD_MIN_RECALL_RATIO", 0.8)
+
+_reload_lock = threading.Lock()
+_reload_status = {"state": "idle", "generation": 0, "report": None, "error": None}
+_reload_poll = {"checked_at": 0.0}
+
+
+def _stamp_class():
     try:
-        try:
-            from model.stamp_model import STAMP
-        except ModuleNotFoundError:
-            from stamp_model import STAMP
+        from model.stamp_model import STAMP
+    except ModuleNotFoundError:
+        from stamp_model import STAMP
+    return STAMP
+
+
+def _find_model_path():
+    """First existing model location; artifact directories are preferred over stamp.pt."""
+    possible_paths = [
+        os.path.abspath(os.path.join(os.path.dirname(__file__), "stamp")),
+        os.path.abspath(os.path.join(os.path.dirname(__file__), "stamp.pt")),
+        os.path.abspath(os.path.join(os.path.dirname(__file__), "../model/stamp.pt")),
+        os.path.abspath(os.path.join(os.getcwd(), "model/stamp.pt")),
+    ]
+    print("🔍 Checking possible STAMP model paths:")
+    for p in possible_paths:
+        print("   -", p)
+    return next((p for p in possible_paths if is_artifact(p) or os.path.isfile(p)), None)
+
+
+def resolve_model_path(model_path=None):
+    """
+    Absolute path of a model to (re)load. Defaults to the live model's path.
+    Only paths inside the model directory are accepted, since checkpoints are
+    unpickled.
+    """
+    if not model_path:
+        model_path = _GLOBAL_STATE.get("model_path") or _find_model_path()
+        if model_path is None:
+            raise ValueError("No model path given and no model found in the model directory")
+    if not os.path.isabs(model_path):
+        model_path = os.path.join(MODEL_DIR, model_path)
+    model_path = os.path.realpath(model_path)
+    if os.path.commonpath([model_path, os.path.realpath(MODEL_DIR)]) != os.path.realpath(MODEL_DIR):
+        raise ValueError(f"Model path must be inside {MODEL_DIR}")
+    if not (is_artifact(model_path) or os.path.isfile(model_path)):
+        raise ValueError(f"No model artifact or checkpoint at {model_path}")
+    return model_path
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+@torch.no_grad()
+def _warmup(state, batches=RELOAD_WARMUP_BATCHES, batch_size=BATCH_MAX_SIZE):
+    """Run the serving path on random sessions so first requests do not pay for lazy init."""
+    model, ann_index = state["trained_model"], state["ann_index"]
+    generator = torch.Generator().manual_seed(0)
+    for _ in range(batches):
+        seqs = torch.randint(1, model.num_items, (batch_size, 20), generator=generator)
+        seqs[:, :10] = model.pad_idx
+        h = model.session_representation(seqs.to(_device))
+        _, ids = ann_index.search(h, k=ANN_NUM_CANDIDATES)
+        scores = model.score(h, ids.clamp(min=0).to(_device))
+        if not torch.isfinite(scores).all():
+            raise ValueError("Warm-up produced non-finite scores")
+        if (scores.amax(dim=1) == scores.amin(dim=1)).all():
+            raise ValueError("Warm-up scored every candidate alike (degenerate embeddings)")
+
+
+def _sanity_eval(state, max_ratings=RELOAD_SANITY_RATINGS):
+    """Recall/MRR@10 (sampled) on the most recent ratings, mapped with this model's ids."""
+    rows = Rating.objects.order_by("-id").values_list("user__user_id", "book__book_isbn")[:max_ratings]
+    sessions = {}
+    for user_id, isbn in rows:
+        item_id = state["book_index"].get(isbn)
+        if item_id is not None:
+            sessions.setdefault(user_id, []).append(item_id)
+    sessions = [s[::-1] for s in sessions.values() if len(s) >= 2]
+    if not sessions:
+        return None
+    return evaluate(state["trained_model"], sessions, ks=(10,), mode="sampled", n_neg=100,
+                    max_seq_len=_batcher.max_seq_len)
+
+
+def _check_sanity(sanity, live_sanity=None):
+    """Raise ValueError when the sanity eval rules the new model out."""
+    if RELOAD_MIN_RECALL is None and RELOAD_MIN_RECALL_RATIO is None:
+        return
+    if sanity is None:
+        raise ValueError("Sanity eval found no recent rating sessions to check the model on; "
+                         "not swapping (both ML_RELOAD_MIN_RECALL settings = None skip the check)")
+    recall = sanity.get("recall@10", 0.0)
+    if RELOAD_MIN_RECALL is not None and not recall >= RELOAD_MIN_RECALL:   # also refuses NaN
+        raise ValueError(f"Sanity recall@10 {recall:.4f} is below ML_RELOAD_MIN_RECALL "
+                         f"{RELOAD_MIN_RECALL}; not swapping")
+    if RELOAD_MIN_RECALL_RATIO is not None and live_sanity is not None:
+        live = live_sanity.get("recall@10", 0.0)
+        if not recall >= RELOAD_MIN_RECALL_RATIO * live:
+            raise ValueError(f"Sanity recall@10 {recall:.4f} is below {RELOAD_MIN_RECALL_RATIO:.0%} "
+                             f"of the live model's {live:.4f} on the same ratings; not swapping")
+
+
+def _live_state():
+    """The serving model and its book ids, or None before the first load."""
+    with _state_lock:
+        if _GLOBAL_STATE["trained_model"] is None:
+            return None
+        return {"trained_model": _GLOBAL_STATE["trained_model"],
+                "book_index": _GLOBAL_STATE["book_index"]}
+
+
+def reload_model(model_path=None, model_class=None, dry_run=False):
+    """
+    Load `model_path` (default: the live model's path) beside the live model,
+    warm it up, sanity-check it and swap it in atomically. With dry_run=True
+    everything but the swap runs. Returns a report with timings and memory;
+    raises ValueError (state "failed") when the sanity check refuses the model.
+    """
+    if not _reload_lock.acquire(blocking=False):
+        raise RuntimeError("A model reload is already running")
+    try:
+        return _reload_locked(model_path, model_class, dry_run)
+    finally:
+        _reload_lock.release()
+
+
+def _reload_locked(model_path, model_class, dry_run):
+    """reload_model's body; the caller holds _reload_lock."""
+    try:
+        model_path = resolve_model_path(model_path)
+        model_class = model_class or _stamp_class()
+        report = {"model_path": model_path, "dry_run": dry_run,
+                  "old_version": _GLOBAL_STATE.get("model_version"),
+                  "rss_mb_before": _rss_mb()}
+        _reload_status.update(state="loading", error=None)
+
+        t0 = time.perf_counter()
+        state = prepare_model(model_path, model_class)
+        report["load_ms"] = (time.perf_counter() - t0) * 1000
+        report["rss_mb_loaded"] = _rss_mb()
+        if report["rss_mb_before"] is not None:
+            # Both models are resident from here until the old one is released
+            report["memory_overlap_mb"] = report["rss_mb_loaded"] - report["rss_mb_before"]
+        report["new_version"] = state["model_version"]
+        report["num_items"] = state["trained_model"].num_items
+
+        _reload_status["state"] = "warming"
+        t0 = time.perf_counter()
+        _warmup(state)
+        report["warmup_ms"] = (time.perf_counter() - t0) * 1000
+
+        _reload_status["state"] = "evaluating"
+        t0 = time.perf_counter()
+        report["sanity"] = _sanity_eval(state)
+        live = _live_state()
+        report["live_sanity"] = _sanity_eval(live) if live is not None else None
+        report["sanity_ms"] = (time.perf_counter() - t0) * 1000
+        _reload_status["report"] = report
+        _check_sanity(report["sanity"], report["live_sanity"])
+
+        if dry_run:
+            _reload_status.update(state="validated", report=report)
+            return report
+
+        load_mappings_from_db(include_books=False)
+        t0 = time.perf_counter()
+        _swap_state(state)
+        report["swap_ms"] = (time.perf_counter() - t0) * 1000
+        _reload_status.update(state="swapped", report=report)
+        if not model_lifecycle.is_ready:
+            model_lifecycle.mark_ready()
+        print(f"🔁 Model reloaded from {model_path} → version {report['new_version']} "
+              f"(load {report['load_ms']:.0f} ms, warm-up {report['warmup_ms']:.0f} ms, "
+              f"swap {report['swap_ms']:.2f} ms)")
+        return report
+    except Exception as e:
+        _reload_status.update(state="failed", error=str(e))
+        raise
+
+
+def start_reload(model_path=None, publish=True):
+    """
+    Reload in a background thread. With publish=True the other worker
+    processes are told to reload too (see RELOAD_TRIGGER_PATH).
+    Returns the reload status.
+    """
+    model_path = resolve_model_path(model_path)
+    # Taken here and handed to the thread, so two callers cannot both start one
+    if not _reload_lock.acquire(blocking=False):
+        raise RuntimeError("A model reload is already running")
+    try:
+        if publish:
+            _reload_status["generation"] = request_reload(model_path)
+        _reload_status.update(state="queued", error=None)
+
+        def run():
+            try:
+                _reload_locked(model_path, None, False)
+            except Exception as e:
+                print(f"❌ Model reload failed: {e}")
+            finally:
+                _reload_lock.release()
+
+        threading.Thread(target=run, name="stamp-reload", daemon=True).start()
+    except BaseException:
+        _reload_lock.release()
+        raise
+    return get_reload_status()
+
+
+def request_reload(model_path):
+    """Ask every worker process to reload `model_path`; returns the trigger generation."""
+    generation = time.time_ns()
+    tmp = f"{RELOAD_TRIGGER_PATH}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"generation": generation, "model_path": model_path}, f)
+    os.replace(tmp, RELOAD_TRIGGER_PATH)
+    return generation
+
+
+def _check_reload_trigger():
+    """Start a background reload if another process published a newer trigger."""
+    now = time.monotonic()
+    if now - _reload_poll["checked_at"] < RELOAD_POLL_SECONDS:
+        return
+    _reload_poll["checked_at"] = now
+    trigger = _read_reload_trigger()
+    if trigger is None:
+        return
+    if trigger.get("generation", 0) <= _reload_status["generation"] or _reload_lock.locked():
+        return
+    _reload_status["generation"] = trigger["generation"]
+    try:
+        start_reload(trigger.get("model_path"), publish=False)
+    except (RuntimeError, ValueError) as e:
+        print(f"⚠️ Ignoring reload trigger: {e}")
+
+
+def _read_reload_trigger():
+    try:
+        with open(RELOAD_TRIGGER_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _reload_seconds():
+    report = _reload_status.get("report") or {}
+    return {stage: report[f"{stage}_ms"] / 1000.0
+            for stage in ("load", "warmup", "sanity", "swap") if f"{stage}_ms" in report}
+
+
+CallbackMetric("stamp_model_reload_seconds", "Stages of the last hot reload",
+               _reload_seconds, labelnames=["stage"])
+CallbackMetric("stamp_model_reload_generation", "Reload generation served by this worker",
+               lambda: _reload_status["generation"])
 
-        possible_paths = [
-            os.path.abspath(os.path.join(os.path.dirname(__file__), "stamp.pt")),
-            os.path.abspath(os.path.join(os.path.dirname(__file__), "../model/stamp.pt")),
-            os.path.abspath(os.path.join(os.getcwd(), "model/stamp.pt")),
-        ]
 
-        print("🔍 Checking possible STAMP model paths:")
-        for p in possible_paths:
-            print("   -", p)
+def get_reload_status():
+    status = dict(_reload_status)
+    status["model_version"] = _GLOBAL_STATE.get("model_version")
+    status["model_path"] = _GLOBAL_STATE.get("model_path")
+    return status
 
-        model_path = next((p for p in possible_paths if os.path.exists(p)), None)
+# --------------------------------------------------------
+# THREADED AUTO-LOAD FUNCTION
+# --------------------------------------------------------
+def _auto_load_stamp_model_once():
+    """
+    Automatically load STAMP model and mappings after Django setup.
+    Run through model_lifecycle.start(), which makes it single-flight and
+    records the time of each step; returns False when there is no model.
+    """
+    try:
+        # A worker starting after a hot reload loads the reloaded model directly
+        trigger = _read_reload_trigger()
+        model_path = None
+        if trigger is not None:
+            _reload_status["generation"] = trigger.get("generation", 0)
+            try:
+                model_path = resolve_model_path(trigger.get("model_path"))
+            except ValueError as e:
+                print(f"⚠️ Ignoring reload trigger: {e}")
+        model_path = model_path or _find_model_path()
         if model_path is None:
             print("⚠️ No valid stamp.pth found in any known path!")
-            return
+            return False
 
         print(f"✅ Found model file at: {model_path}")
-        load_model(model_path, STAMP)
+        state = load_model(model_path, _stamp_class(), phase=model_lifecycle.phase)
+        with model_lifecycle.phase("candidate_index"):
+            candidate_index.ensure_built()
+        with model_lifecycle.phase("first_inference"):
+            _warmup(state, batches=1)
         print("🚀 Auto-loaded STAMP model + DB mappings at startup!")
+        return True
 
     except Exception as e:
         import traceback
         print("❌ STAMP auto-load failed!")
         print(traceback.format_exc())
+        raise
+
+
+def wait_model_ready(timeout=None):
+    """Block until the startup auto-load finished (or `timeout` seconds); returns readiness."""
+    return model_lifecycle.wait_ready(timeout)
+
 
+def get_model_status():
+    """Readiness of the serving model plus the startup timing breakdown."""
+    status = model_lifecycle.status()
+    status["model_version"] = _GLOBAL_STATE.get("model_version")
+    status["model_path"] = _GLOBAL_STATE.get("model_path")
+    return status
 
-# Run auto-loader in a background thread (safe even if multiple Django workers)
-threading.Thread(target=_auto_load_stamp_model_once, daemon=True).start()
+
+def start_background():
+    """
+    Start this process's serving threads: the auto-loader (at most one per
+    process) and the interaction writer, which first replays journals of
+    workers that died with unwritten interactions. Importing this module
+    starts neither, so one-off commands can use it without them.
+    """
+    model_lifecycle.start(_auto_load_stamp_model_once)
+    _interaction_log.start()